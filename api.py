@@ -0,0 +1,176 @@
+# api.py
+"""
+Headless JSON API over db_functions for terminals that don't run the Streamlit UI.
+
+Usage: python api.py [port]   (default 8502, listens on localhost)
+
+GET  /products                  current catalogue with stock
+GET  /products/{id}             one product
+POST /bills                     {"bill_date", "customer_id"?, "customer_name", "pay_mode", "remarks", "items": [{"product_id", "quantity", "rate"?}]}
+POST /purchase-orders           {"vendor_id", "purchase_date", "invoice_number", "remarks", "items": [{"product_id", "quantity", "rate"?}]}
+GET  /customers?q=<mobile or name prefix>
+GET  /customers/{id}/bills       one customer's bills, newest first
+GET  /reports/{name}?start=YYYY-MM-DD&end=YYYY-MM-DD[&vendor_id=]
+
+Writes are recorded in the audit log under the X-Operator request header (default "api").
+"""
+import json
+import sys
+from datetime import date
+
+import pandas as pd
+from aiohttp import web
+
+from database import create_tables, set_audit_user
+import db_functions as db
+import async_db as adb
+import journal
+
+API_HOST = "127.0.0.1"
+API_PORT = 8502
+API_AUDIT_USER = "api"
+
+REPORTS = {
+    'bills': db.get_bill_report,
+    'purchases': db.get_purchase_report,
+    'stock': db.get_stock_report_with_dates,
+    'product-sales': db.get_product_wise_sales,
+    'product-purchases': db.get_product_wise_purchases,
+    'bulk-litres': db.get_bulk_litre_report,
+}
+
+routes = web.RouteTableDef()
+
+def _error(exc_class, message):
+    return exc_class(text=json.dumps({'error': message}), content_type='application/json')
+
+def _frame_response(df):
+    return web.Response(text=df.to_json(orient='records', date_format='iso'), content_type='application/json')
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise _error(web.HTTPBadRequest, "Request body must be JSON.")
+    if not isinstance(body.get('items'), list) or not body['items']:
+        raise _error(web.HTTPBadRequest, "At least one item is required.")
+    return body
+
+def _numbers(lines, column, message):
+    """lines[column] as whole numbers; HTTP 400 with message if any value is missing or not one."""
+    values = pd.to_numeric(lines[column], errors='coerce')
+    if values.isna().any() or (values % 1 != 0).any():
+        raise _error(web.HTTPBadRequest, message)
+    return values.astype('int64')
+
+def _price_lines(items, price_column):
+    """
+    Joins the requested lines with their products in the catalogue (only those are looked up); a 'rate'
+    sent by the client overrides the catalogue price.
+    """
+    import catalogue
+    if not all(isinstance(item, dict) for item in items):
+        raise _error(web.HTTPBadRequest, "Each item must be an object with product_id and quantity.")
+    lines = pd.DataFrame(items)
+    if not {'product_id', 'quantity'}.issubset(lines.columns):
+        raise _error(web.HTTPBadRequest, "Each item needs product_id and quantity.")
+    lines = lines[[c for c in ('product_id', 'quantity', 'rate') if c in lines.columns]].copy()
+    lines['product_id'] = _numbers(lines, 'product_id', "product_id must be a whole number.")
+    lines['quantity'] = _numbers(lines, 'quantity', "Quantities must be whole numbers.")
+    if (lines['quantity'] <= 0).any():
+        raise _error(web.HTTPBadRequest, "Quantities must be positive.")
+    if 'rate' in lines:
+        rates = pd.to_numeric(lines['rate'], errors='coerce')
+        if (rates.isna() & lines['rate'].notna()).any() or (rates < 0).any():
+            raise _error(web.HTTPBadRequest, "Rates must be non-negative numbers.")
+        lines['rate'] = rates
+    products_df = catalogue.get_catalogue().rows(lines['product_id'].unique(), ['name', 'size', price_column, 'gst_category', 'stock'])
+    taxes_df = db.get_taxes()[['tax_name', 'tax_value']]
+    lines = lines.merge(products_df, left_on='product_id', right_index=True, how='left')
+    unknown = lines.loc[lines['name'].isna(), 'product_id'].tolist()
+    if unknown:
+        raise _error(web.HTTPNotFound, f"Unknown product ids: {unknown}")
+    lines = lines.merge(taxes_df, left_on='gst_category', right_on='tax_name', how='left')
+    lines['gst_percent'] = lines['tax_value'].fillna(0)
+    lines['rate'] = lines['rate'].fillna(lines[price_column]) if 'rate' in lines else lines[price_column]
+    lines['name'] = lines['name'] + ' (' + lines['size'] + ')'
+    return lines
+
+def _create_bill(body, operator):
+    set_audit_user(operator)
+    lines = _price_lines(body['items'], 'selling_price')
+    wanted = lines.groupby('product_id')['quantity'].sum()
+    short = wanted[wanted > lines.groupby('product_id')['stock'].first()]
+    if not short.empty:
+        raise _error(web.HTTPConflict, f"Insufficient stock for product ids: {short.index.tolist()}")
+    items_df, totals = db.price_bill_items(lines)
+    return db.create_bill(body.get('bill_date', date.today().isoformat()), body.get('customer_name', 'Cash Customer'),
+                          body.get('pay_mode', 'Cash'), body.get('remarks', ''), items_df, totals, customer_id=body.get('customer_id'))
+
+def _create_purchase_order(body, operator):
+    set_audit_user(operator)
+    if 'vendor_id' not in body:
+        raise _error(web.HTTPBadRequest, "vendor_id is required.")
+    lines = _price_lines(body['items'], 'purchase_price')
+    items_df, totals = db.price_purchase_items(lines, db.get_tcs_value())
+    return db.create_purchase_order(body['vendor_id'], body.get('purchase_date', date.today().isoformat()),
+                                    body.get('invoice_number', ''), body.get('remarks', ''), items_df, totals)
+
+@routes.get('/products')
+async def list_products(request):
+    products_df = await adb.get_products()
+    return _frame_response(products_df.reset_index())
+
+@routes.get('/products/{product_id}')
+async def get_product(request):
+    products_df = await adb.get_products()
+    product_id = int(request.match_info['product_id'])
+    if product_id not in products_df.index:
+        raise _error(web.HTTPNotFound, f"Product ID {product_id} not found.")
+    return _frame_response(products_df.loc[[product_id]].reset_index())
+
+@routes.post('/bills')
+async def create_bill(request):
+    body = await _json_body(request)
+    success, message = await adb.run_write(_create_bill, body, request.headers.get('X-Operator', API_AUDIT_USER))
+    return web.json_response({'success': success, 'message': message}, status=201 if success else 409)
+
+@routes.post('/purchase-orders')
+async def create_purchase_order(request):
+    body = await _json_body(request)
+    success, message = await adb.run_write(_create_purchase_order, body, request.headers.get('X-Operator', API_AUDIT_USER))
+    return web.json_response({'success': success, 'message': message}, status=201 if success else 409)
+
+@routes.get('/customers')
+async def find_customers(request):
+    return _frame_response((await adb.search_customers(request.query.get('q', ''))).reset_index())
+
+@routes.get('/customers/{customer_id}/bills')
+async def get_customer_bills(request):
+    return _frame_response(await adb.get_customer_history(int(request.match_info['customer_id'])))
+
+@routes.get('/reports/{name}')
+async def get_report(request):
+    report = REPORTS.get(request.match_info['name'])
+    if report is None:
+        raise _error(web.HTTPNotFound, f"Unknown report. Available: {', '.join(REPORTS)}")
+    today = date.today()
+    args = [request.query.get('start', today.replace(day=1).isoformat()), request.query.get('end', today.isoformat())]
+    if report is db.get_purchase_report and 'vendor_id' in request.query:
+        args.append(int(request.query['vendor_id']))
+    return _frame_response(await adb.run_read(_run_report, report, *args))
+
+def _run_report(report, *args):
+    """Ranged reports read the reporting snapshot, like the Reports page, so they don't hold up billing."""
+    with db.heavy_report_reads():
+        return report(*args)
+
+def create_app():
+    create_tables()
+    journal.replay_pending()
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=API_HOST, port=int(sys.argv[1]) if len(sys.argv) > 1 else API_PORT)
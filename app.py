@@ -1,36 +1,96 @@
 # app1.py - Modern Button-Based UI
+import json
+import time
+import uuid
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime
 
-from database import create_tables
+from database import AUDITED_TABLES, create_tables, set_audit_user
+from cart import Cart, parse_pasted_lines, set_cart_quantities
 import db_functions as db
+# audit, backup, catalogue, journal, reorder and taxreturn are imported by the pages that use them
+from report_executor import ReportExecutor, ReportCancelled
 
 st.set_page_config(page_title="Liquor Store POS", layout="wide")
 create_tables()
 
 # --- Initialize Session State ---
 if 'app_mode' not in st.session_state: st.session_state.app_mode = "main" # main, po_create, po_edit
-if 'cart' not in st.session_state: st.session_state.cart = []
+if 'cart' not in st.session_state: st.session_state.cart = Cart()
 if 'selected_po_id' not in st.session_state: st.session_state.selected_po_id = None
 if 'po_edit_id' not in st.session_state: st.session_state.po_edit_id = None
 if 'po_items' not in st.session_state: st.session_state.po_items = []
 if 'original_po_items' not in st.session_state: st.session_state.original_po_items = pd.DataFrame()
+if 'po_grid_version' not in st.session_state: st.session_state.po_grid_version = 0
+if 'session_key' not in st.session_state: st.session_state.session_key = uuid.uuid4().hex
+
+REPORT_FUNCTIONS = {
+    "Bill Report": db.get_bill_report,
+    "Purchase Report": db.get_purchase_report,
+    "Stock Report": db.get_stock_report_with_dates,
+    "Product Wise Sale Report": db.get_product_wise_sales,
+    "Product Wise Purchase Report": db.get_product_wise_purchases,
+    "Bulk Litre Report": db.get_bulk_litre_report,
+}
+
+@st.cache_resource
+def get_report_executor():
+    """One report thread pool for the whole server, shared by all sessions."""
+    return ReportExecutor()
+
+@st.cache_resource
+def start_backup_scheduler():
+    """Scheduled backups run on one thread for the whole server."""
+    import backup
+    return backup.start_scheduler()
+
+def render_backups():
+    import backup
+    with st.sidebar.expander("💾 Backups"):
+        if st.button("Back up now", use_container_width=True):
+            success, message = backup.create_backup()
+            if success:
+                stats = backup.last_backup_stats
+                st.success(f"Saved {message} ({stats['mb']} MB in {stats['seconds']} s, longest step {stats['max_step_ms']} ms).")
+            else:
+                st.error(message)
+        backups_df = backup.list_backups()
+        if backups_df.empty:
+            st.info("No backups yet.")
+            return
+        st.dataframe(backups_df, hide_index=True)
+        name = st.selectbox("Restore from", backups_df['name'])
+        if st.checkbox(f"Replace the current data with {name}"):
+            if st.button("♻️ Restore", type="primary", use_container_width=True):
+                success, message = backup.restore_backup(name)
+                if success:
+                    st.success(message)
+                    refresh_data(force=True)
+                else:
+                    st.error(message)
 
+def reload_data():
+    """Refresh button: also drops the data shared by all sessions, to pick up edits made outside this server."""
+    db.reload_master_data()
+    refresh_data(force=True)
 
 def refresh_data(force=False):
-    """Refreshes dataframes in the session state."""
-    st.session_state.products_df = db.get_products()
+    """Refreshes dataframes in the session state (served from the caches shared by all sessions)."""
+    import catalogue
+    # A reference to the shared catalogue version, not a per-session copy
+    st.session_state.products_df = catalogue.get_catalogue().frame
     st.session_state.vendors_df = db.get_vendors()
     st.session_state.taxes_df = db.get_taxes()
-    st.session_state.customers_df = db.get_customers()
 
-def change_app_mode(mode, po_id=None):
+def change_app_mode(mode, po_id=None, items=None, vendor_id=None):
     st.session_state.app_mode = mode
     st.session_state.po_edit_id = po_id
+    st.session_state.po_draft_vendor_id = vendor_id
+    st.session_state.po_grid_version += 1  # start the line grid afresh
     if mode == "po_create":
-        # Start a new PO with one empty line
-        st.session_state.po_items = [{"product_id": None}]
+        # Start a new PO from the given lines (e.g. reorder suggestions) or with one empty line
+        st.session_state.po_items = items or [{"product_id": None}]
     elif mode == "po_edit":
         # Load existing PO data
         _, items_df = db.get_purchase_order_details(po_id)
@@ -45,10 +105,33 @@ def main():
     # Fetch store info from the database
     store_info = db.get_store_info()
     st.title(f"🍾 {store_info['name']}")
+    import journal
+    if journal.has_pending():
+        synced = journal.replay_pending()
+        if synced:
+            st.sidebar.success(f"Synced {synced} offline bill(s) to the database.")
+            refresh_data(force=True)
+        pending = journal.pending_bills()
+        if pending:
+            st.sidebar.warning(f"{len(pending)} bill(s) saved offline, waiting for the database.")
+    quarantined = journal.quarantined_bills()
+    if quarantined:
+        st.sidebar.error(f"{len(quarantined)} offline bill(s) could not be synced (last: {quarantined[-1]['error']}). "
+                         f"They are kept in {journal.QUARANTINE_FILE} to be entered by hand.")
     refresh_data()
+    oversold = st.session_state.products_df.query('stock < 0')
+    if not oversold.empty:
+        # Offline bills are synced without a stock check, as the goods have already left the shop
+        st.sidebar.warning(f"{len(oversold)} product(s) have negative stock, e.g. after offline bills were synced: "
+                           f"{', '.join(oversold['name'].head(5))}. Count them and correct the stock.")
+
+    # Changes made in this session are recorded under this name in the audit log
+    set_audit_user(st.sidebar.text_input("👤 Operator", key="operator").strip())
     
     # Sidebar refresh button
-    st.sidebar.button("🔄 Refresh Data", on_click=refresh_data, args=(True,), use_container_width=True)
+    st.sidebar.button("🔄 Refresh Data", on_click=reload_data, use_container_width=True)
+    start_backup_scheduler()
+    render_backups()
     
     # Check if we're in PO mode first
     if st.session_state.app_mode.startswith("po_"):
@@ -114,9 +197,9 @@ def main():
         ]
         sales_stats = []
         for label, start in periods:
-            report_df = db.get_bill_report(start.isoformat(), today.isoformat())
-            total_sales = report_df['Bill Total'].sum() if not report_df.empty and 'Bill Total' in report_df else 0
-            sales_stats.append((label, total_sales))
+            # Net sales per pay mode; closed days are read from their day close records
+            summary_df = db.get_sales_summary(start.isoformat(), today.isoformat())
+            sales_stats.append((label, summary_df['net_total'].sum()))
         
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -151,11 +234,17 @@ def render_billing():
     
     products_df = st.session_state.products_df
     taxes_df = st.session_state.taxes_df
+    session_key = st.session_state.session_key
+    # Stock held by other terminals' open carts is not for sale here
+    held_elsewhere = db.held_by_others(session_key)
+
+    cart = st.session_state.cart
+    bulk_mode = st.toggle("Bulk order mode", key="bulk_mode", help="One grid for all lines and pasted barcode/quantity lists, for large orders.")
 
     product_list = []
     for idx, row in products_df.iterrows():
-        quantity_in_cart = sum(item['quantity'] for item in st.session_state.cart if item['product_id'] == idx)
-        effective_stock = int(row['stock']) - quantity_in_cart
+        quantity_in_cart = cart.quantity(idx)
+        effective_stock = int(row['stock']) - held_elsewhere.get(idx, 0) - quantity_in_cart
         product_list.append(f"{row['name']} - {row['size']} ({effective_stock} left)")
 
     col1, col2 = st.columns([2, 3])
@@ -169,108 +258,174 @@ def render_billing():
             selected_product = selected_product_row.iloc[0] if not selected_product_row.empty else None
 
             if selected_product is not None:
-                quantity_in_cart = sum(item['quantity'] for item in st.session_state.cart if item['product_id'] == selected_product.name)
-                effective_stock = int(selected_product['stock']) - quantity_in_cart
+                quantity_in_cart = cart.quantity(selected_product.name)
+                effective_stock = int(selected_product['stock']) - held_elsewhere.get(selected_product.name, 0) - quantity_in_cart
                 
                 if effective_stock > 0:
                     quantity = st.number_input(f"Quantity for {selected_product['name']}", min_value=1, value=1, step=1, max_value=effective_stock)
                     if st.button("Add to Cart"):
                         tax_info = taxes_df[taxes_df['tax_name'] == selected_product['gst_category']]
                         gst_percent = tax_info['tax_value'].iloc[0] if not tax_info.empty else 0
-                        # Check if product already exists in cart
-                        existing_item = next((item for item in st.session_state.cart if item['product_id'] == selected_product.name), None)
-
-                        if existing_item:
-                            # Update existing item quantity
-                            if existing_item['quantity'] + quantity <= effective_stock:
-                                existing_item['quantity'] += quantity
-                            else:
-                                st.error("Cannot add more units than available stock")
+                        if not db.hold_stock(session_key, selected_product.name, quantity_in_cart + quantity, int(selected_product['stock'])):
+                            st.error("Cannot add more units than available stock")
                         else:
-                            # Add new item to cart
-                            st.session_state.cart.append({
-                                "product_id": selected_product.name,
-                                "name": f"{selected_product['name']} ({selected_product['size']})",
-                                "quantity": quantity,
-                                "rate": selected_product['selling_price'],
-                                "gst_percent": gst_percent,
-                                "gst_category": selected_product['gst_category']
-                            })
+                            # Adds to the existing line if the product is already in the cart
+                            cart.add(selected_product.name, f"{selected_product['name']} ({selected_product['size']})", quantity,
+                                     selected_product['selling_price'], gst_percent, selected_product['gst_category'])
                         st.rerun()
                 else:
                     st.warning(f"No more stock available for {selected_product['name']}. All available units are in the cart.")
 
+        if bulk_mode:
+            render_bulk_paste(cart, products_df, taxes_df, held_elsewhere, session_key)
+
     with col2:
         st.subheader("Current Bill")
-        if st.session_state.cart:
-            # Create a DataFrame for better display and editing
-            cart_df = pd.DataFrame(st.session_state.cart)
-
-            # Display each item with edit/delete buttons
-            for idx, item in enumerate(st.session_state.cart):
-                col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
-                col1.write(item['name'])
-
-                # Quantity modifier
-                current_qty = item['quantity']
-                new_qty = col2.number_input(
-                    "Qty",
-                    min_value=1,
-                    max_value=int(products_df.loc[item['product_id']]['stock']),
-                    value=current_qty,
-                    key=f"qty_{idx}"
-                )
-                if new_qty != current_qty:
-                    item['quantity'] = new_qty
-                    st.rerun()
-
-                # Display rate and amount
-                col3.write(f"₹ {item['rate']:.2f}")
-                col4.write(f"₹ {item['rate'] * item['quantity']:.2f}")
+        for message in st.session_state.pop('bulk_errors', []):
+            st.warning(message)
+        if cart:
+            if bulk_mode:
+                render_bulk_grid(cart, products_df, taxes_df, held_elsewhere, session_key)
+            else:
+                # Display each item with edit/delete buttons
+                for item in cart:
+                    col1, col2, col3, col4, col5 = st.columns([3, 1, 1, 1, 1])
+                    col1.write(item['name'])
+
+                    # Quantity modifier
+                    current_qty = item['quantity']
+                    product_stock = int(products_df.loc[item['product_id']]['stock'])
+                    new_qty = col2.number_input(
+                        "Qty",
+                        min_value=1,
+                        max_value=max(current_qty, product_stock - held_elsewhere.get(item['product_id'], 0)),
+                        value=current_qty,
+                        key=f"qty_{item['product_id']}"
+                    )
+                    if new_qty != current_qty:
+                        if db.hold_stock(session_key, item['product_id'], new_qty, product_stock):
+                            cart.set_quantity(item['product_id'], new_qty)
+                        st.rerun()
 
-                # Delete button
-                if col5.button("🗑️", key=f"del_{idx}"):
-                    st.session_state.cart.pop(idx)
-                    st.rerun()
+                    # Display rate and amount
+                    col3.write(f"₹ {item['rate']:.2f}")
+                    col4.write(f"₹ {item['rate'] * item['quantity']:.2f}")
 
-            # Calculate totals
-            cart_df = pd.DataFrame(st.session_state.cart)
-            cart_df['base_price'] = cart_df['rate'] / (1 + cart_df['gst_percent'] / 100)
-            cart_df['sub_total_line'] = cart_df['base_price'] * cart_df['quantity']
-            cart_df['amount'] = cart_df['rate'] * cart_df['quantity']
-            cart_df['gst_amount'] = cart_df['amount'] - cart_df['sub_total_line']
+                    # Delete button
+                    if col5.button("🗑️", key=f"del_{item['product_id']}"):
+                        db.hold_stock(session_key, item['product_id'], 0, 0)
+                        cart.remove(item['product_id'])
+                        st.rerun()
 
-            sub_total = cart_df['sub_total_line'].sum()
-            total_gst = cart_df['gst_amount'].sum()
-            grand_total = cart_df['amount'].sum()
+            # Running totals, kept up to date by the cart itself
+            st.metric("Sub-Total", f"₹ {cart.sub_total:,.2f}")
+            st.metric("Total GST", f"₹ {cart.total_gst:,.2f}")
+            st.metric("Grand Total", f"₹ {cart.grand_total:,.2f}")
 
-            st.metric("Sub-Total", f"₹ {sub_total:,.2f}")
-            st.metric("Total GST", f"₹ {total_gst:,.2f}")
-            st.metric("Grand Total", f"₹ {grand_total:,.2f}")
+            customer_id, customer_name = render_customer_lookup()
 
             form_col, cancel_col = st.columns([4,1])
             with form_col:
                 with st.form("bill_details"):
-                    # Create customer dropdown with Cash Customer as default
-                    customers_df = st.session_state.customers_df
-                    customer_options = ["Cash Customer"] + customers_df['name'].tolist()
-                    customer_name = st.selectbox("Customer Name", options=customer_options, index=0)
+                    st.write(f"Customer: **{customer_name}**")
                     pay_mode = st.selectbox("Payment Mode", ["Cash", "Card", "UPI"])
                     if st.form_submit_button("Generate Bill", use_container_width=True):
-                        totals = {'sub_total': sub_total, 'total_gst': total_gst, 'grand_total': grand_total}
-                        success, message = db.create_bill(bill_date.isoformat(), customer_name, pay_mode, "", cart_df, totals)
+                        cart_df, totals = db.price_bill_items(cart.to_frame())
+                        success, message = db.create_bill(bill_date.isoformat(), customer_name, pay_mode, "", cart_df, totals, customer_id=customer_id)
                         if success:
                             st.success(message); st.balloons()
-                            st.session_state.cart = []; refresh_data(force=True); st.rerun()
-                        else: st.error(message)
+                            db.release_holds(session_key)
+                            cart.clear(); st.session_state.bill_customer = None; st.session_state.next_customer_query = ""
+                            refresh_data(force=True); st.rerun()
+                        else:
+                            st.error(message); refresh_data(force=True)
             
             with cancel_col:
                 st.write(""); st.write("")
                 if st.button("❌ Cancel", type="secondary", use_container_width=True):
-                    st.session_state.cart = []; st.rerun()
+                    db.release_holds(session_key)
+                    cart.clear(); st.rerun()
         else:
             st.info("Your cart is empty.")
 
+def render_bulk_paste(cart, products_df, taxes_df, held_elsewhere, session_key):
+    """Adds pasted 'barcode quantity' lines (or product IDs instead of barcodes) to the cart."""
+    with st.form("bulk_paste", clear_on_submit=True):
+        text = st.text_area("Paste barcode / quantity lines", height=150, placeholder="8901234567890\t12\n8909876543210, 6")
+        if st.form_submit_button("Add Lines to Cart", use_container_width=True):
+            pasted, unreadable = parse_pasted_lines(text)
+            product_ids = db.get_product_ids_by_code(pasted)
+            quantities = {}
+            for code, quantity in pasted.items():
+                if code in product_ids:
+                    pid = product_ids[code]
+                    quantities[pid] = quantities.get(pid, cart.quantity(pid)) + quantity
+            errors = [f"Could not read line: {line}" for line in unreadable]
+            errors += [f"Unknown barcode or product ID: {code}" for code in pasted if code not in product_ids]
+            errors += set_cart_quantities(cart, quantities, products_df, taxes_df, held_elsewhere, session_key)
+            st.session_state.bulk_errors = errors
+            st.rerun()
+
+def render_bulk_grid(cart, products_df, taxes_df, held_elsewhere, session_key):
+    """All cart lines in one editable grid; quantity edits are applied together, 0 removes a line."""
+    grid = cart.to_frame().set_index('product_id')[['name', 'quantity', 'rate']]
+    grid['amount'] = grid['rate'] * grid['quantity']
+    edited = st.data_editor(
+        grid,
+        key=f"bulk_grid_{cart.version}",  # a fresh grid whenever the cart changed
+        use_container_width=True,
+        disabled=['name', 'rate', 'amount'],
+        column_config={
+            "name": "Product",
+            "quantity": st.column_config.NumberColumn("Qty", min_value=0, step=1, help="0 removes the line"),
+            "rate": st.column_config.NumberColumn("Rate", format="₹ %.2f"),
+            "amount": st.column_config.NumberColumn("Amount", format="₹ %.2f"),
+        }
+    )
+    quantities = edited['quantity'].fillna(0).astype(int)
+    changed = quantities[quantities != grid['quantity']]
+    if not changed.empty:
+        st.session_state.bulk_errors = set_cart_quantities(cart, changed.to_dict(), products_df, taxes_df, held_elsewhere, session_key)
+        st.rerun()
+
+def render_customer_lookup():
+    """Finds the bill's customer by mobile or name prefix, with inline quick-add. Returns (customer_id, customer_name)."""
+    if 'bill_customer' not in st.session_state: st.session_state.bill_customer = None  # (id, name) once picked
+    if 'next_customer_query' in st.session_state:  # a widget's value can only be set before it is drawn
+        st.session_state.customer_query = st.session_state.pop('next_customer_query')
+    query = st.text_input("Customer mobile or name", key="customer_query", placeholder="Leave empty for Cash Customer")
+    if not query.strip():
+        st.session_state.bill_customer = None
+        return None, "Cash Customer"
+
+    matches_df = db.search_customers(query)
+    if not matches_df.empty:
+        options = [None] + matches_df.index.tolist()
+        picked = st.session_state.bill_customer
+        customer_id = st.selectbox("Matching customers", options=options, index=options.index(picked[0]) if picked and picked[0] in options else 1,
+                                   format_func=lambda cid: "Cash Customer" if cid is None else f"{matches_df.at[cid, 'name']} ({matches_df.at[cid, 'mobile']})")
+        if customer_id is None:
+            return None, "Cash Customer"
+        st.session_state.bill_customer = (int(customer_id), matches_df.at[customer_id, 'name'])
+        return st.session_state.bill_customer
+
+    st.caption("No customer found.")
+    with st.expander("➕ Add as new customer", expanded=True):
+        digits = query.strip().isdigit()
+        new_mobile = st.text_input("Mobile", value=query.strip() if digits else "", key="quick_customer_mobile")
+        new_name = st.text_input("Name", value="" if digits else query.strip(), key="quick_customer_name")
+        if st.button("Add Customer", key="quick_add_customer"):
+            if not new_name.strip() or not new_mobile.strip():
+                st.error("Name and mobile are required.")
+            else:
+                success, message = db.add_customer(new_name.strip(), "", "", "", "", "", new_mobile.strip(), "")
+                if success:
+                    st.session_state.bill_customer = (db.get_customer_id_by_mobile(new_mobile), new_name.strip())
+                    st.session_state.next_customer_query = new_mobile.strip()
+                    st.rerun()
+                st.error(message)
+    return None, "Cash Customer"
+
 def render_po_form():
     """Displays the list of POs and the 'Create New' button."""
     # Back to main menu button
@@ -303,11 +458,14 @@ def render_po_form():
 
 def render_purchases():
     """Renders the unified form for creating and editing a PO."""
+    import catalogue
     products_df = st.session_state.products_df
     vendors_df = st.session_state.vendors_df
     taxes_df = st.session_state.taxes_df
-    
-    product_options = {idx: f"{row['name']} - {row['size']}" for idx, row in products_df.iterrows()}
+
+    # Product labels and their ids, built once per catalogue version and shared by all sessions
+    current_catalogue = catalogue.get_catalogue()
+    product_labels, product_ids = current_catalogue.product_options
     vendor_options = {idx: name for idx, name in vendors_df['name'].items()}
 
     header_text = "Create New Purchase Order" if st.session_state.app_mode == "po_create" else f"Editing PO #{st.session_state.po_edit_id}"
@@ -315,49 +473,58 @@ def render_purchases():
 
     # --- Section 1: Item Management (OUTSIDE the form) ---
     st.subheader("Items")
-    for i, item in enumerate(st.session_state.po_items):
-        # Auto-populate details when a product is selected for the first time
-        if item.get("product_id") and "product_name" not in item:
-            product_details = products_df.loc[item["product_id"]]
-            tax_info = taxes_df[taxes_df['tax_name'] == product_details['gst_category']]
-            item.update({
-                "product_name": f"{product_details['name']} - {product_details['size']}",
-                "rate": product_details['purchase_price'],
-                "selling_price": product_details['selling_price'],
-                "stock": product_details['stock'],
-                "gst_percent": tax_info['tax_value'].iloc[0] if not tax_info.empty else 0
-            })
-
-        cols = st.columns([3, 1, 1, 1, 1, 1])
-        # Add a placeholder for the selectbox to show "Select..."
-        all_product_options = {None: "Select..."}
-        all_product_options.update(product_options)
-        
-        selected_product_id = cols[0].selectbox("Product", options=all_product_options.keys(), format_func=lambda x: all_product_options.get(x), key=f"prod_{i}", index=list(all_product_options.keys()).index(item.get("product_id")) if item.get("product_id") in all_product_options else 0)
-        
-        if selected_product_id != item.get("product_id"):
-            st.session_state.po_items[i] = {"product_id": selected_product_id, "rate": 0.01, "quantity": 1}
-            st.rerun()
-
-        item['quantity'] = cols[1].number_input("Quantity", min_value=1, value=item.get("quantity", 1), key=f"qty_{i}")
-        item['rate'] = cols[2].number_input("Purchase Rate", min_value=0.01, value=item.get("rate", 0.01),  format="%.2f", disabled=True, key=f"rate_{i}")
-        cols[3].text_input("Stock", value=item.get("stock", "-"), disabled=True, key=f"stock_{i}")
-        cols[4].text_input("VAT %", value=f"{item.get('gst_percent', 0):.2f}%", disabled=True, key=f"gst%_{i}")
-        item['selling_price'] = cols[5].number_input("Selling Rate", min_value=0.01, value=item.get('selling_price', 0.01), format="%.2f", disabled=True, key=f"sell_{i}")
+    po_items = st.session_state.po_items
+    # Recomputed only when the lines were edited (new grid version) or the catalogue changed
+    lines_key = (st.session_state.po_grid_version, current_catalogue.version)
+    if st.session_state.get('po_lines_key') != lines_key:
+        st.session_state.po_lines = db.po_lines(po_items, products_df, taxes_df)
+        st.session_state.po_lines_key = lines_key
+    lines = st.session_state.po_lines
+    positions = current_catalogue.positions(lines['product_id'].fillna(-1).astype('int64'))
+    grid = pd.DataFrame({
+        'product': [product_labels[pos] if pos >= 0 else None for pos in positions],
+        'quantity': lines['quantity'].values,
+        'rate': lines['rate'].values,
+        'stock': lines['stock'].values,
+        'gst_percent': lines['gst_percent'].values,
+        'selling_price': lines['selling_price'].values,
+    }, index=pd.Index(list(range(len(lines))), dtype='int64', name='line'))  # new rows come back with no index
+    edited = st.data_editor(
+        grid,
+        key=f"po_grid_{st.session_state.po_grid_version}",
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        disabled=['rate', 'stock', 'gst_percent', 'selling_price'],
+        column_config={
+            "product": st.column_config.SelectboxColumn("Product", options=product_labels, required=True),
+            "quantity": st.column_config.NumberColumn("Quantity", min_value=1, step=1, default=1),
+            "rate": st.column_config.NumberColumn("Purchase Rate", format="%.2f"),
+            "stock": st.column_config.NumberColumn("Stock"),
+            "gst_percent": st.column_config.NumberColumn("VAT %", format="%.2f%%"),
+            "selling_price": st.column_config.NumberColumn("Selling Rate", format="%.2f"),
+        }
+    )
 
-    c1, c2, _ = st.columns([1, 1, 8])
-    if c1.button("Add Item"):
-        st.session_state.po_items.append({"product_id": None, "rate": 0.01, "quantity": 1})
-        st.rerun()
-    if c2.button("Remove Last Item") and st.session_state.po_items:
-        st.session_state.po_items.pop()
+    # Write edits back to the PO lines; a line whose product is unchanged keeps its saved details
+    edited_items = []
+    for line, label, quantity in zip(edited.index, edited['product'], edited['quantity']):
+        product_id = product_ids.get(label)
+        quantity = int(quantity) if pd.notna(quantity) and quantity >= 1 else 1
+        if pd.notna(line) and po_items[int(line)].get('product_id') == product_id:
+            edited_items.append(dict(po_items[int(line)], quantity=quantity))
+        else:
+            edited_items.append({"product_id": product_id, "quantity": quantity})
+    if [(item['product_id'], item['quantity']) for item in edited_items] != [(item.get('product_id'), item.get('quantity', 1)) for item in po_items]:
+        st.session_state.po_items = edited_items
+        st.session_state.po_grid_version += 1
         st.rerun()
     st.markdown("---")
 
     # --- Section 2: Details and Submission (INSIDE the form) ---
     with st.form("po_details_form"):
         st.subheader("Details & Submission")
-        po_data = {}
+        po_data = {"vendor_id": st.session_state.get("po_draft_vendor_id")}
         if st.session_state.app_mode == "po_edit":
             po_header_data, _ = db.get_purchase_order_details(st.session_state.po_edit_id)
             po_data = {
@@ -373,20 +540,16 @@ def render_purchases():
         invoice_number = c3.text_input("Invoice/DC Number", value=po_data.get("invoice_number", ""))
         remarks = st.text_area("Remarks", value=po_data.get("remarks", ""))
         
-        items_df = pd.DataFrame([item for item in st.session_state.po_items if item.get('product_id')])
+        items_df = lines.loc[lines['product_id'].notna(), ['product_id', 'quantity', 'rate', 'gst_percent']].astype({'product_id': 'int64'})
         if not items_df.empty:
-            items_df['amount'] = items_df['quantity'] * items_df['rate']
-            items_df['gst_amount'] = items_df['amount'] * items_df['gst_percent'] / 100
-            total_amount, total_gst = items_df['amount'].sum(), items_df['gst_amount'].sum()
             tcs_rate = db.get_tcs_value()
-            total_tcs = (total_amount + total_gst) * (tcs_rate / 100)
-            grand_total = total_amount + total_gst + total_tcs
+            items_df, totals = db.price_purchase_items(items_df, tcs_rate)
 
             c1, c2, c3, c4 = st.columns(4)
-            c1.metric("Total Amount", f"₹{total_amount:,.2f}")
-            c2.metric("Total GST", f"₹{total_gst:,.2f}")
-            c3.metric(f"Total TCS ({tcs_rate}%)", f"₹{total_tcs:,.2f}")
-            c4.metric("Grand Total", f"₹{grand_total:,.2f}")
+            c1.metric("Total Amount", f"₹{totals['total_amount']:,.2f}")
+            c2.metric("Total GST", f"₹{totals['total_gst']:,.2f}")
+            c3.metric(f"Total TCS ({tcs_rate}%)", f"₹{totals['total_tcs']:,.2f}")
+            c4.metric("Grand Total", f"₹{totals['grand_total']:,.2f}")
 
         st.markdown("---")
         c1, c2 = st.columns(2)
@@ -399,13 +562,9 @@ def render_purchases():
             if items_df.empty:
                 st.error("Please add at least one product to the purchase order.")
             else:
-                totals = {'total_amount': total_amount, 'total_gst': total_gst, 'total_tcs': total_tcs, 'grand_total': grand_total}
                 if st.session_state.app_mode == "po_create":
                     success, msg = db.create_purchase_order(vendor_id, purchase_date.isoformat(), invoice_number, remarks, items_df, totals)
                 else:
-                    original_df = st.session_state.original_po_items
-                    for _, row in original_df.iterrows(): db.update_product_stock(row['product_id'], -row['quantity'])
-                    for _, row in items_df.iterrows(): db.update_product_stock(row['product_id'], row['quantity'])
                     success, msg = db.update_purchase_order(st.session_state.po_edit_id, vendor_id, purchase_date.isoformat(), invoice_number, remarks, items_df, totals)
                 
                 if success:
@@ -496,9 +655,9 @@ def render_products_section():
     st.subheader("Edit Products")
     st.info("Edit data directly in the table. Click 'Save Changes' to apply. To delete a row, select it and press the 'Delete' key, then save.")
 
-    # Keep a copy of the original for comparison
+    # Keep the version being edited for comparison (catalogue versions are never modified, so no copy)
     if 'original_products_df' not in st.session_state:
-        st.session_state.original_products_df = st.session_state.products_df.copy()
+        st.session_state.original_products_df = st.session_state.products_df
 
     edited_products_df = st.data_editor(
         st.session_state.products_df,
@@ -551,7 +710,7 @@ def render_products_section():
 
             # Refresh data and update original copy
             refresh_data(force=True)
-            st.session_state.original_products_df = st.session_state.products_df.copy()
+            st.session_state.original_products_df = st.session_state.products_df
             st.success("Product changes saved successfully!")
             #st.rerun()
 
@@ -560,6 +719,8 @@ def render_products_section():
 
 def render_customers_section():
     st.subheader("👥 Customers Management")
+    # Loaded only here: billing looks customers up with db.search_customers
+    st.session_state.customers_df = db.get_customers()
     
     with st.expander("Add New Customer", expanded=False):
         with st.form("new_customer_form"):
@@ -582,10 +743,20 @@ def render_customers_section():
                     success, message = db.add_customer(name, address, "", "", "", "", mobile, "")
                     if success:
                         st.success(message)
-                        refresh_data()
+                        st.session_state.customers_df = db.get_customers()
                     else:
                         st.error(message)
     
+    with st.expander("Customer History", expanded=False):
+        stats_df = db.get_customer_stats()
+        if stats_df.empty:
+            st.info("No bills are linked to customers yet.")
+        else:
+            st.dataframe(stats_df, use_container_width=True, hide_index=True)
+            customer_id = st.selectbox("Show bills of", options=stats_df['Customer ID'].tolist(),
+                                       format_func=lambda cid: stats_df.loc[stats_df['Customer ID'] == cid, 'Customer Name'].iloc[0])
+            st.dataframe(db.get_customer_history(int(customer_id)), use_container_width=True, hide_index=True)
+
     st.subheader("Edit Customers")
     st.info("Edit data directly in the table. Click 'Save Changes' to apply. To delete a row, select it and press the 'Delete' key, then save.")
 
@@ -641,7 +812,7 @@ def render_customers_section():
                             st.error(f"Error updating customer {row['name']}: {msg}")
 
             # Refresh data and update original copy
-            refresh_data(force=True)
+            st.session_state.customers_df = db.get_customers()
             st.session_state.original_customers_df = st.session_state.customers_df.copy()
             st.success("Customer changes saved successfully!")
             #st.rerun()
@@ -894,59 +1065,237 @@ def render_reports():
         if st.button("🍾 Bulk Litre Report", use_container_width=True):
             st.session_state.selected_report = "Bulk Litre Report"
             st.rerun()
+
+    # Third row of buttons
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("🔔 Reorder Suggestions", use_container_width=True):
+            st.session_state.selected_report = "Reorder Suggestions"
+            st.rerun()
+    with col2:
+        if st.button("🕵️ Audit Log", use_container_width=True):
+            st.session_state.selected_report = "Audit Log"
+            st.rerun()
+    with col3:
+        if st.button("🔒 Day Close", use_container_width=True):
+            st.session_state.selected_report = "Day Close"
+            st.rerun()
+
+    # Fourth row of buttons
+    col1, _, _ = st.columns(3)
+    with col1:
+        if st.button("🧾 Tax Return", use_container_width=True):
+            st.session_state.selected_report = "Tax Return"
+            st.rerun()
     
     # Use the selected report type
     report_type = st.session_state.selected_report
+    if report_type == "Reorder Suggestions":
+        render_reorder_suggestions()
+        return
+    if report_type == "Audit Log":
+        render_audit_log()
+        return
+    if report_type == "Day Close":
+        render_day_close()
+        return
+    if report_type == "Tax Return":
+        render_tax_return()
+        return
 
-    if report_type in ["Bill Report", "Purchase Report", "Stock Report", "Product Wise Sale Report", "Product Wise Purchase Report", "Bulk Litre Report"]:
+    if report_type in REPORT_FUNCTIONS:
         col1, col2 = st.columns(2)
         start_date = col1.date_input("Start Date", date.today().replace(day=1))
         end_date = col2.date_input("End Date", date.today())
         
         start_date_str = start_date.isoformat()
         end_date_str = end_date.isoformat()
-    
-    if st.button("Generate Report", key=f"btn_{report_type}"):
-        if report_type == "Bill Report":
-            report_df = db.get_bill_report(start_date_str, end_date_str)
-            st.dataframe(report_df)
-            st.download_button("Download as CSV", report_df.to_csv(index=False), "bill_report.csv")
+        report_args = (start_date_str, end_date_str)
+
+        if report_type == "Stock Report":
+            report_args += (st.checkbox("Include sales forecast"),)
 
-        elif report_type == "Purchase Report":
+        if report_type == "Purchase Report":
             vendors_df = st.session_state.vendors_df
             vendor_list = {row['name']: row.name for _, row in vendors_df.iterrows()}
             vendor_list['All'] = 'All'
             selected_vendor = st.selectbox("Filter by Vendor", options=vendor_list.keys(), index=len(vendor_list)-1)
-            vendor_id = vendor_list[selected_vendor]
-            report_df = db.get_purchase_report(start_date_str, end_date_str, vendor_id)
+            report_args += (vendor_list[selected_vendor],)
+    
+    if st.button("Generate Report", key=f"btn_{report_type}"):
+        st.session_state.requested_report = report_type
+
+    # Once requested, the report follows the inputs: changing a date starts the new query and cancels the stale one
+    if report_type not in REPORT_FUNCTIONS or st.session_state.get('requested_report') != report_type:
+        return
+    executor = get_report_executor()
+    job = executor.submit(report_type, REPORT_FUNCTIONS[report_type], *report_args, owner=st.session_state.session_key)
+    if not job.done():
+        col1, col2 = st.columns([4, 1])
+        col1.info(f"Generating {report_type}... {job.elapsed:.1f}s ({job.steps:,} query steps)")
+        if col2.button("❌ Cancel", key="cancel_report"):
+            executor.cancel(report_type, owner=st.session_state.session_key)
+            st.session_state.requested_report = None
+            st.rerun()
+        time.sleep(0.3)
+        st.rerun()
+    try:
+        report_df = job.result()
+    except ReportCancelled:
+        st.rerun()  # superseded by a newer request
+    except Exception as e:
+        st.error(f"Report failed: {e}")
+        return
+
+    if report_type == "Bill Report":
+        st.dataframe(report_df)
+        st.download_button("Download as CSV", report_df.to_csv(index=False), "bill_report.csv")
+
+    elif report_type == "Purchase Report":
+        st.dataframe(report_df)
+        st.download_button("Download as CSV", report_df.to_csv(index=False), "purchase_report.csv")
+
+    elif report_type == "Stock Report":
+        st.info(f"Stock report showing opening and closing stock for the period {start_date_str} to {end_date_str}")
+        if not report_df.empty:
             st.dataframe(report_df)
-            st.download_button("Download as CSV", report_df.to_csv(index=False), "purchase_report.csv")
-
-        elif report_type == "Stock Report":
-            st.info(f"Stock report showing opening and closing stock for the period {start_date_str} to {end_date_str}")
-            report_df = db.get_stock_report_with_dates(start_date_str, end_date_str)
-            if not report_df.empty:
-                st.dataframe(report_df)
-                st.download_button("Download as CSV", report_df.to_csv(index=False), "stock_report.csv")
+            st.download_button("Download as CSV", report_df.to_csv(index=False), "stock_report.csv")
+        else:
+            st.warning("No stock data found for the selected period.")
+
+    elif report_type == "Product Wise Sale Report":
+        st.dataframe(report_df)
+        st.bar_chart(report_df.set_index('Product Name')['Total Quantity Sold'])
+
+    elif report_type == "Product Wise Purchase Report":
+        st.dataframe(report_df)
+        st.bar_chart(report_df.set_index('Product Name')['Total Quantity Purchased'])
+
+    elif report_type == "Bulk Litre Report":
+        st.dataframe(report_df)
+        st.bar_chart(report_df.set_index('Product Name'))
+
+def render_reorder_suggestions():
+    """Products at or below their reorder point, grouped by the vendor they were last bought from."""
+    import reorder
+    suggestions_df = reorder.get_reorder_suggestions()
+    if suggestions_df.empty:
+        st.success("No product is at or below its reorder point.")
+        return
+    st.info(f"{len(suggestions_df)} products are at or below their reorder point "
+            f"(sales velocity over the last {', '.join(str(w) for w in reorder.SALES_WINDOWS)} days).")
+    columns = {'name': 'Product Name', 'size': 'Size', 'stock': 'Available Stock', 'velocity': 'Sold / Day',
+               'days_of_cover': 'Days of Cover', 'reorder_point': 'Reorder Point', 'suggested_qty': 'Suggested Qty', 'last_rate': 'Last Rate'}
+    for vendor_id, vendor_df in suggestions_df.groupby('vendor_id', dropna=False, sort=False):
+        vendor_name = vendor_df['vendor'].iloc[0] if pd.notna(vendor_id) else "No purchase history"
+        st.subheader(vendor_name)
+        st.dataframe(vendor_df[list(columns)].rename(columns=columns), use_container_width=True)
+        if pd.notna(vendor_id) and st.button(f"📝 Draft PO for {vendor_name}", key=f"draft_po_{int(vendor_id)}"):
+            items = reorder.draft_purchase_order(vendor_df, vendor_id)
+            change_app_mode("po_create", items=items, vendor_id=int(vendor_id))
+            st.rerun()
+    st.download_button("Download as CSV", suggestions_df.to_csv(), "reorder_suggestions.csv")
+
+PAYMENT_COLUMNS = {'pay_mode': 'Pay Mode', 'bill_count': 'Bills', 'sales_total': 'Sales', 'adjustment_total': 'Returns / Edits', 'net_total': 'Net'}
+TAX_COLUMNS = {'gst_category': 'Tax Category', 'gst_percent': 'Rate %', 'taxable_amount': 'Taxable Value', 'gst_amount': 'Tax'}
+
+def render_day_close():
+    """Z report of one day (stored once closed, a live preview before) and totals for a period."""
+    close_date = st.date_input("Day", date.today(), max_value=date.today(), key="close_date").isoformat()
+    header, payments_df, taxes_df = db.get_day_close(close_date)
+    if header['closed']:
+        st.success(f"🔒 {close_date} was closed at {header['closed_at']} by {header['closed_by']}. Its bills can no longer be changed.")
+    else:
+        st.info(f"{close_date} is open. The figures below are a preview.")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Bills", f"{header['bill_count']:,}")
+    col2.metric("Net Sales", f"₹ {header['net_total']:,.2f}")
+    col3.metric("Tax", f"₹ {header['gst_total']:,.2f}")
+    st.dataframe(payments_df.rename(columns=PAYMENT_COLUMNS), hide_index=True, use_container_width=True)
+    st.dataframe(taxes_df.rename(columns=TAX_COLUMNS), hide_index=True, use_container_width=True)
+    if not header['closed'] and st.checkbox(f"Bills dated {close_date} are complete - lock the day"):
+        if st.button("🔒 Close Day", type="primary"):
+            success, message = db.close_day(close_date)
+            if success:
+                st.rerun()
             else:
-                st.warning("No stock data found for the selected period.")
+                st.error(message)
 
-        elif report_type == "Product Wise Sale Report":
-            report_df = db.get_product_wise_sales(start_date_str, end_date_str)
-            st.dataframe(report_df)
-            st.bar_chart(report_df.set_index('Product Name')['Total Quantity Sold'])
+    st.markdown("---")
+    st.subheader("Period Summary")
+    col1, col2 = st.columns(2)
+    start_date = col1.date_input("Start Date", date.today().replace(day=1), key="summary_start").isoformat()
+    end_date = col2.date_input("End Date", date.today(), key="summary_end").isoformat()
+    summary_df = db.get_sales_summary(start_date, end_date)
+    closes_df = db.get_day_closes(start_date, end_date)
+    st.caption(f"{len(closes_df)} closed day(s) in the period.")
+    st.dataframe(summary_df.reset_index().rename(columns=PAYMENT_COLUMNS), hide_index=True, use_container_width=True)
+    st.download_button("Download as CSV", closes_df.to_csv(index=False), "day_closes.csv")
+
+def render_tax_return():
+    """Monthly output and input tax per rate, with exports and a check against the line items."""
+    import taxreturn
+    month = date.today().replace(day=1)
+    periods = []
+    for _ in range(24):
+        periods.append(month.strftime("%Y-%m"))
+        month = (month - pd.Timedelta(days=1)).replace(day=1)
+    period = st.selectbox("Month", periods)
+    return_df = taxreturn.get_tax_return(period)
+    if return_df.empty:
+        st.info(f"No taxed sales or purchases in {period}.")
+        return
+    totals = taxreturn.tax_totals(return_df)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Output Tax", f"₹ {totals['output_tax']:,.2f}")
+    col2.metric("Input Tax", f"₹ {totals['input_tax']:,.2f}")
+    col3.metric("Net Payable", f"₹ {totals['net_payable']:,.2f}")
+    st.dataframe(return_df.rename(columns={'direction': 'Direction', 'gst_percent': 'Rate %', 'taxable_amount': 'Taxable Value',
+                                           'tax_amount': 'Tax', 'line_count': 'Lines'}), hide_index=True, use_container_width=True)
+    col1, col2 = st.columns(2)
+    col1.download_button("Download CSV", taxreturn.tax_return_csv(period), f"tax_return_{period}.csv")
+    col2.download_button("Download JSON", taxreturn.tax_return_json(period), f"tax_return_{period}.json")
+
+    if taxreturn.is_archived(period):
+        st.caption(f"{period} is archived, so it cannot be reconciled with the bill and purchase lines.")
+    elif st.button("🔎 Reconcile with bill and purchase lines"):
+        mismatches_df = taxreturn.reconcile_tax_return(period)
+        if mismatches_df.empty:
+            st.success("The return matches the line items.")
+        else:
+            st.warning(f"{len(mismatches_df)} day/rate totals differ from the line items.")
+            st.dataframe(mismatches_df, hide_index=True, use_container_width=True)
+            st.session_state.rebuild_tax_period = period
+    if st.session_state.get('rebuild_tax_period') == period and st.button("Rebuild totals from the line items"):
+        success, message = taxreturn.rebuild_tax_daily(period)
+        st.session_state.rebuild_tax_period = None
+        if success:
+            st.success(message)
+        else:
+            st.error(message)
 
-        elif report_type == "Product Wise Purchase Report":
-            report_df = db.get_product_wise_purchases(start_date_str, end_date_str)
-            st.dataframe(report_df)
-            st.bar_chart(report_df.set_index('Product Name')['Total Quantity Purchased'])
+def render_audit_log():
+    """Who changed what and when, filtered by record, operator and date."""
+    import audit
+    col1, col2, col3 = st.columns(3)
+    table_name = col1.selectbox("Table", ["All"] + list(AUDITED_TABLES))
+    row_id = col2.number_input("Record ID (0 = all)", min_value=0, step=1)
+    user = col3.selectbox("Operator", ["All"] + audit.get_audit_users())
+    col1, col2 = st.columns(2)
+    start_date = col1.date_input("Start Date", date.today().replace(day=1), key="audit_start")
+    end_date = col2.date_input("End Date", date.today(), key="audit_end")
 
-        elif report_type == "Bulk Litre Report":
-            report_df = db.get_bulk_litre_report(start_date_str, end_date_str)
-            st.dataframe(report_df)
-            st.bar_chart(report_df.set_index('Product Name'))
+    log_df = audit.get_audit_log(None if table_name == "All" else table_name, row_id or None,
+                                 None if user == "All" else user, start_date.isoformat(), end_date.isoformat())
+    if log_df.empty:
+        st.info("No changes recorded for this selection.")
+        return
+    log_df['changes'] = log_df['changes'].map(lambda changes: json.dumps(changes, ensure_ascii=False))
+    st.dataframe(log_df, use_container_width=True)
+    st.download_button("Download as CSV", log_df.to_csv(), "audit_log.csv")
 
 def render_stock_management():
+    import reorder
     # Back to main menu button
     if st.button("← Back to Main Menu", type="secondary"):
         st.session_state.current_page = None
@@ -974,6 +1323,9 @@ def render_stock_management():
     else:
         # Show current stock as default
         st.info("Click 'Generate Stock Report' to view opening and closing stock for selected dates.")
+        low_stock = len(reorder.get_reorder_suggestions())
+        if low_stock:
+            st.warning(f"🔔 {low_stock} products are at or below their reorder point - see Reports → Reorder Suggestions.")
         current_stock_df = db.get_stock_report()
         st.dataframe(current_stock_df, use_container_width=True)
 
@@ -993,7 +1345,7 @@ def render_bills_management():
     tab1, tab2, tab3 = st.tabs(["📋 View Bills", "🖨️ Print Bills", "🤖 Auto-Generate Bills"])
 
     # Get bills data once
-    bills_df = db.get_bill_report(start_date.isoformat(), end_date.isoformat())
+    bills_df = db.get_bill_report(start_date.isoformat(), end_date.isoformat(), fresh=True)
 
     # Tab 1: View and Manage Bills
     with tab1:
@@ -1022,7 +1374,7 @@ def render_bills_management():
                 with col3:
                     if 'pending_delete_bill_id' not in st.session_state:
                         st.session_state.pending_delete_bill_id = None
-                    if st.button("🗑️ Delete Bill", type="secondary"):
+                    if st.button("🚫 Void Bill", type="secondary"):
                         st.session_state.pending_delete_bill_id = selected_bill
                         st.rerun()
 
@@ -1043,12 +1395,38 @@ def render_bills_management():
 
                 st.dataframe(display_df, use_container_width=True)
 
-                # Delete confirmation
+                adjustments_df = db.get_bill_adjustments(selected_bill)
+                if not adjustments_df.empty:
+                    st.caption("Returns and changes recorded against this bill")
+                    adjustments_df['Product'] = adjustments_df['product_id'].apply(lambda x: f"{products_df.loc[x]['name']} ({products_df.loc[x]['size']})")
+                    st.dataframe(adjustments_df[['adjustment_date', 'kind', 'Product', 'quantity', 'amount', 'reason']], use_container_width=True, hide_index=True)
+
+                with st.expander("↩️ Return Items"):
+                    with st.form(f"return_form_{selected_bill}"):
+                        sold_df = items_df.groupby('product_id')['quantity'].sum()
+                        if not adjustments_df.empty:
+                            sold_df = sold_df.add(adjustments_df.groupby('product_id')['quantity'].sum(), fill_value=0)
+                        returns = {}
+                        for product_id, sold_qty in sold_df[sold_df > 0].items():
+                            returns[product_id] = st.number_input(
+                                f"{products_df.loc[product_id]['name']} ({products_df.loc[product_id]['size']}) - {int(sold_qty)} on bill",
+                                min_value=0, max_value=int(sold_qty), value=0, key=f"return_{selected_bill}_{product_id}")
+                        reason = st.text_input("Reason")
+                        if st.form_submit_button("Record Return"):
+                            success, msg = db.return_bill_items(selected_bill, {pid: qty for pid, qty in returns.items() if qty}, reason)
+                            if success:
+                                st.success(msg)
+                                refresh_data(force=True)
+                                st.rerun()
+                            else:
+                                st.error(msg)
+
+                # Void confirmation
                 if st.session_state.pending_delete_bill_id == selected_bill:
-                    st.warning(f"Are you sure you want to delete Bill #{selected_bill}?")
+                    st.warning(f"Void Bill #{selected_bill}? Its items go back into stock and it no longer counts in sales; the bill stays on record.")
                     col1, col2 = st.columns(2)
-                    if col1.button("✅ Confirm Delete", type="secondary"):
-                        success, msg = db.delete_bill(selected_bill)
+                    if col1.button("✅ Confirm Void", type="secondary"):
+                        success, msg = db.void_bill(selected_bill)
                         if success:
                             st.success(msg)
                             st.session_state.pending_delete_bill_id = None
@@ -1113,9 +1491,10 @@ def render_bills_management():
 
 # Helper functions for bill generation
 def generate_single_bill_html(bill_id):
+    import catalogue
     bill, items_df = db.get_bill_by_id(bill_id)
     store_info = db.get_store_info()
-    products_df = db.get_products()
+    products_df = catalogue.get_catalogue().frame
 
     # Format items for receipt
     items_table = "".join([
@@ -1155,8 +1534,9 @@ def generate_single_bill_html(bill_id):
     )
 
 def generate_multiple_bills_html(bills_df, start_date, end_date):
+    import catalogue
     store_info = db.get_store_info()
-    products_df = db.get_products()
+    products_df = catalogue.get_catalogue().frame
     all_bills_html = []
 
     for _, bill_row in bills_df.iterrows():
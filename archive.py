@@ -0,0 +1,190 @@
+# archive.py
+"""
+Moves closed financial years (1 April - 31 March) out of liquor_store.db into Parquet files
+partitioned by year/month, e.g. archive/bills/year=2023/month=4/fy2023-....parquet
+
+Reports read only the archived rows of their date range: SQLite report connections load them with
+read_archive() (partition pruning and the date filter pushed into the Parquet scan), DuckDB scans the
+Parquet files directly.
+
+Usage: python archive.py 2023   (archives FY 2023-24)
+"""
+import os
+import sys
+import uuid
+from contextlib import closing
+from datetime import date
+import pandas as pd
+
+ARCHIVE_DIR = "archive"
+
+# header table -> (date column, item table, foreign key from item to header)
+ARCHIVED_TABLES = {
+    'bills': ('bill_date', 'bill_items', 'bill_id'),
+    'purchase_orders': ('purchase_date', 'purchase_order_items', 'purchase_order_id'),
+}
+# header table -> (adjustment table, foreign key to header, date column). Adjustments are archived with
+# their header; a header with adjustments dated after its financial year stays in the database
+ARCHIVED_ADJUSTMENTS = {
+    'bills': ('bill_adjustments', 'bill_id', 'adjustment_date'),
+}
+
+def has_archive():
+    return os.path.isdir(ARCHIVE_DIR)
+
+def _archived_tables():
+    """(table, date column) of every archived table: headers, their items and adjustments."""
+    for header, (date_column, items, _) in ARCHIVED_TABLES.items():
+        yield header, date_column
+        yield items, date_column
+        if header in ARCHIVED_ADJUSTMENTS:
+            table, _, adjustment_date = ARCHIVED_ADJUSTMENTS[header]
+            yield table, adjustment_date
+
+def has_dataset(table):
+    return os.path.isdir(_dataset_path(table))
+
+def dataset_glob(table):
+    """Glob of all Parquet files of an archived table, e.g. for DuckDB's read_parquet."""
+    return os.path.join(_dataset_path(table), "**", "*.parquet")
+
+def financial_year_bounds(fy_start_year):
+    return f"{fy_start_year}-04-01", f"{fy_start_year + 1}-03-31"
+
+def _dataset_path(table):
+    return os.path.join(ARCHIVE_DIR, table)
+
+def archived_financial_years():
+    """Start years of the financial years that have rows in the archive."""
+    years = set()
+    for header in ARCHIVED_TABLES:
+        path = _dataset_path(header)
+        if not os.path.isdir(path):
+            continue
+        for year_dir in os.listdir(path):
+            if not year_dir.startswith('year='):
+                continue
+            for month_dir in os.listdir(os.path.join(path, year_dir)):
+                if month_dir.startswith('month='):
+                    year, month = int(year_dir[5:]), int(month_dir[6:])
+                    years.add(year if month >= 4 else year - 1)
+    return years
+
+def is_archived(start_date, end_date):
+    """True if any financial year overlapping start_date..end_date (ISO dates) was archived."""
+    first = int(start_date[:4]) - (start_date[5:7] < '04')
+    last = int(end_date[:4]) - (end_date[5:7] < '04')
+    return any(first <= year <= last for year in archived_financial_years())
+
+def read_archive(table, date_column, start_date=None, end_date=None, columns=None):
+    """
+    Read archived rows of a table whose date_column lies between start_date and end_date; either bound
+    may be None. The year bounds prune whole partitions, the date bounds are evaluated inside the
+    Parquet scan.
+    """
+    path = _dataset_path(table)
+    if not os.path.isdir(path):
+        return pd.DataFrame()
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    row_filter = None
+    if start_date:
+        row_filter = (ds.field('year') >= int(start_date[:4])) & (ds.field(date_column) >= start_date)
+    if end_date:
+        upper = (ds.field('year') <= int(end_date[:4])) & (ds.field(date_column) <= end_date)
+        row_filter = upper if row_filter is None else row_filter & upper
+    df = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+    return df.drop(columns=['year', 'month'], errors='ignore')
+
+def _write_partitioned(table, df, date_column, fy_start_year):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if df.empty:
+        return
+    df = df.copy()
+    # All-NULL text columns would otherwise be written as a null type and clash with later files
+    for col in [col for col, dtype in df.dtypes.items() if pd.api.types.is_string_dtype(dtype)]:
+        df[col] = df[col].astype('string')
+    df['year'] = df[date_column].str[:4].astype(int)
+    df['month'] = df[date_column].str[5:7].astype(int)
+    pq.write_to_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        root_path=_dataset_path(table),
+        partition_cols=['year', 'month'],
+        basename_template=f"fy{fy_start_year}-{uuid.uuid4().hex}-{{i}}.parquet",
+    )
+
+def archive_financial_year(fy_start_year, vacuum=True):
+    """
+    Copy all bills (with their items and adjustments) and purchase orders of a closed financial year to
+    Parquet, verify the copy and then delete them from the database. Bills with a return or edit dated
+    after the year stay in the database, so each adjustment is archived together with its bill; run the
+    year again once the later year is closed. Rows already present in the archive (from an interrupted
+    earlier run) are not written twice.
+    """
+    import database
+    import db_functions as db
+    start_date, end_date = financial_year_bounds(fy_start_year)
+    if end_date >= date.today().isoformat():
+        return False, f"FY {fy_start_year}-{str(fy_start_year + 1)[-2:]} is not closed yet."
+
+    summary = {}
+    # The deletes are not audited row by row; one audit entry per table records the archive run
+    with closing(db.get_connection()) as conn, database.audit_suspended():
+        for header, (date_column, items, fk) in ARCHIVED_TABLES.items():
+            selection, params = f"SELECT id FROM {header} h WHERE h.{date_column} BETWEEN ? AND ?", (start_date, end_date)
+            adjustments = ARCHIVED_ADJUSTMENTS.get(header)
+            if adjustments:
+                adjustment_table, adjustment_fk, adjustment_date = adjustments
+                selection += f" AND NOT EXISTS (SELECT 1 FROM {adjustment_table} a WHERE a.{adjustment_fk} = h.id AND a.{adjustment_date} > ?)"
+                params += (end_date,)
+                kept = conn.execute(f"SELECT COUNT(*) FROM {header} WHERE {date_column} BETWEEN ? AND ? AND id NOT IN ({selection})",
+                                    (start_date, end_date) + params).fetchone()[0]
+                if kept:
+                    summary[f"{header}_kept"] = kept
+            headers_df = pd.read_sql_query(f"SELECT * FROM {header} WHERE id IN ({selection})", conn, params=params)
+            items_df = pd.read_sql_query(
+                f"SELECT i.*, h.{date_column} FROM {items} i JOIN {header} h ON i.{fk} = h.id WHERE h.id IN ({selection})",
+                conn, params=params)
+            if headers_df.empty:
+                summary[header] = 0
+                continue
+
+            archived = read_archive(header, date_column, start_date, end_date, columns=['id'])
+            archived_ids = set(archived['id']) if not archived.empty else set()
+            _write_partitioned(header, headers_df[~headers_df['id'].isin(archived_ids)], date_column, fy_start_year)
+            _write_partitioned(items, items_df[~items_df[fk].isin(archived_ids)], date_column, fy_start_year)
+            if adjustments:
+                adjustments_df = pd.read_sql_query(f"SELECT * FROM {adjustment_table} WHERE {adjustment_fk} IN ({selection})", conn, params=params)
+                _write_partitioned(adjustment_table, adjustments_df[~adjustments_df[adjustment_fk].isin(archived_ids)], adjustment_date, fy_start_year)
+
+            # Only delete what can be read back from the archive
+            archived = read_archive(header, date_column, start_date, end_date, columns=['id'])
+            missing = set(headers_df['id']) - (set(archived['id']) if not archived.empty else set())
+            if missing:
+                conn.rollback()
+                return False, f"Archive verification failed for {header}: {len(missing)} rows missing. Nothing was deleted."
+
+            with database.audit_session(conn):
+                conn.execute(f"DELETE FROM {items} WHERE {fk} IN ({selection})", params)
+                if adjustments:
+                    conn.execute(f"DELETE FROM {adjustment_table} WHERE {adjustment_fk} IN ({selection})", params)
+                    summary[adjustment_table] = len(adjustments_df)
+                conn.execute(f"DELETE FROM {header} WHERE id IN ({selection})", params)
+            database.record_audit(conn, header, None, 'ARCHIVE', {'from': start_date, 'to': end_date, 'rows': len(headers_df)})
+            summary[header] = len(headers_df)
+        conn.commit()
+        if vacuum:
+            conn.execute("VACUUM")
+    # A snapshot taken before the run still holds the archived rows, which reports would count twice
+    db.clear_report_cache()
+    if db.REPORT_MODE == "snapshot":
+        db.refresh_report_snapshot(force=True)
+    return True, summary
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    success, result = archive_financial_year(int(sys.argv[1]))
+    print(result if not success else f"Archived: {result}")
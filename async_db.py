@@ -0,0 +1,99 @@
+# async_db.py
+"""
+Async counterparts of the db_functions readers and writers, for asyncio code such as api.py.
+sqlite3 blocks, so every call runs on a pool of DB threads and the event loop stays free. Writes
+are not serialized here: their threads only wait on writer.WriteQueue, which orders them and
+group-commits the ones waiting together.
+Concurrent identical reads are coalesced: the second caller awaits the query the first one started,
+unless a write has finished since that query started.
+The synchronous db_functions API is unchanged and remains the single implementation.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import db_functions as db
+
+READ_THREADS = 4
+WRITE_THREADS = 32  # writes waiting on the writer queue at once, so they can share a commit
+
+_read_pool = ThreadPoolExecutor(max_workers=READ_THREADS, thread_name_prefix="db-read")
+_write_pool = ThreadPoolExecutor(max_workers=WRITE_THREADS, thread_name_prefix="db-write")
+_in_flight = {}  # (event loop, writes finished, function, args, kwargs) -> future of the running read
+_writes_finished = 0
+_coalesce_stats = {'queries': 0, 'coalesced': 0}
+
+async def run_read(func, *args, **kwargs):
+    """Runs a blocking read on the read pool, sharing the result with identical reads already in flight."""
+    loop = asyncio.get_running_loop()
+    key = (loop, _writes_finished, func.__qualname__, args, tuple(sorted(kwargs.items())))
+    future = _in_flight.get(key)
+    if future is None:
+        _coalesce_stats['queries'] += 1
+        future = loop.run_in_executor(_read_pool, functools.partial(func, *args, **kwargs))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        _coalesce_stats['coalesced'] += 1
+    # shield: one waiter being cancelled must not cancel the query the others are waiting on
+    result = await asyncio.shield(future)
+    return result.copy() if isinstance(result, pd.DataFrame) else result
+
+async def run_write(func, *args, **kwargs):
+    """Runs a blocking write (or a read-validate-write sequence) on the write pool."""
+    global _writes_finished
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_write_pool, functools.partial(func, *args, **kwargs))
+    finally:
+        _writes_finished += 1  # reads started from now on must not join queries that may predate the write
+
+def get_coalesce_stats():
+    return dict(_coalesce_stats)
+
+def _reader(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_read(func, *args, **kwargs)
+    return wrapper
+
+def _writer(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_write(func, *args, **kwargs)
+    return wrapper
+
+# --- Readers ---
+get_products = _reader(db.get_products)
+get_customers = _reader(db.get_customers)
+get_vendors = _reader(db.get_vendors)
+get_taxes = _reader(db.get_taxes)
+get_tcs_value = _reader(db.get_tcs_value)
+get_store_info = _reader(db.get_store_info)
+get_purchase_orders_summary = _reader(db.get_purchase_orders_summary)
+get_purchase_order_details = _reader(db.get_purchase_order_details)
+get_bill_by_id = _reader(db.get_bill_by_id)
+search_customers = _reader(db.search_customers)
+get_customer_stats = _reader(db.get_customer_stats)
+get_customer_history = _reader(db.get_customer_history)
+get_bill_report = _reader(db.get_bill_report)
+get_purchase_report = _reader(db.get_purchase_report)
+get_stock_report = _reader(db.get_stock_report)
+get_stock_report_with_dates = _reader(db.get_stock_report_with_dates)
+get_product_wise_sales = _reader(db.get_product_wise_sales)
+get_product_wise_purchases = _reader(db.get_product_wise_purchases)
+get_bulk_litre_report = _reader(db.get_bulk_litre_report)
+get_day_close = _reader(db.get_day_close)
+get_sales_summary = _reader(db.get_sales_summary)
+
+# --- Writers ---
+create_bill = _writer(db.create_bill)
+update_bill = _writer(db.update_bill)
+delete_bill = _writer(db.delete_bill)
+void_bill = _writer(db.void_bill)
+return_bill_items = _writer(db.return_bill_items)
+close_day = _writer(db.close_day)
+create_purchase_order = _writer(db.create_purchase_order)
+update_purchase_order = _writer(db.update_purchase_order)
+update_product_stock = _writer(db.update_product_stock)
@@ -0,0 +1,96 @@
+# audit.py
+"""
+Query and maintenance API for the audit trail written by the triggers created in database.py.
+
+Each audit_log row records who changed which row of which table, when, and how: the full row for
+INSERT and DELETE, {"column": [old, new]} for UPDATE. compact_audit_log() moves the JSON of older
+entries into zlib-compressed batches (audit_batches) and keeps the indexed columns in audit_log,
+so lookups by entity, user or time stay index scans and only the matching batches are inflated.
+changed_at is stored in UTC; dates passed in and times returned are local, like day_close.
+
+Usage: python audit.py compact [older_than_days]
+"""
+import json
+import sys
+import zlib
+from contextlib import closing
+from datetime import date, timedelta
+
+import pandas as pd
+
+import database
+import db_functions as db
+
+COMPACT_AFTER_DAYS = 7  # entries younger than this keep their changes uncompressed
+COMPACT_BATCH_SIZE = 500  # entries per compressed batch
+AUDIT_QUERY_LIMIT = 500
+UTC_OF_LOCAL_DATE = "strftime('%Y-%m-%d %H:%M:%f', ?, 'utc')"  # local midnight of a date as a UTC changed_at bound
+
+def get_audit_log(table_name=None, row_id=None, user=None, start_date=None, end_date=None, limit=AUDIT_QUERY_LIMIT):
+    """
+    Audit entries, newest first, filtered by entity (table_name and optionally row_id), user and an
+    inclusive range of local dates. changed_at is returned in local time and the changes column holds
+    the decoded JSON (dict) of each entry.
+    """
+    where, params = [], []
+    if table_name:
+        where.append("table_name = ?")
+        params.append(table_name)
+        if row_id is not None:
+            where.append("row_id = ?")
+            params.append(int(row_id))
+    if user:
+        where.append("user = ?")
+        params.append(user)
+    if start_date:
+        where.append(f"audit_log.changed_at >= {UTC_OF_LOCAL_DATE}")
+        params.append(str(start_date))
+    if end_date:
+        where.append(f"audit_log.changed_at < {UTC_OF_LOCAL_DATE}")
+        params.append((date.fromisoformat(str(end_date)) + timedelta(days=1)).isoformat())
+    query = ("SELECT id, strftime('%Y-%m-%d %H:%M:%f', changed_at, 'localtime') AS changed_at, user, table_name, row_id, action, changes, batch_id "
+             "FROM audit_log")
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY audit_log.changed_at DESC, id DESC LIMIT ?"
+    params.append(int(limit))
+
+    with closing(db.get_connection()) as conn:
+        df = pd.read_sql_query(query, conn, params=params, index_col='id')
+        batch_ids = sorted({int(b) for b in df['batch_id'].dropna()})
+        compacted = {}
+        for batch_id in batch_ids:
+            payload = conn.execute("SELECT payload FROM audit_batches WHERE id = ?", (batch_id,)).fetchone()[0]
+            compacted.update(json.loads(zlib.decompress(payload)))
+    df['changes'] = [json.loads(changes) if changes is not None else compacted.get(str(entry_id))
+                     for entry_id, changes in df['changes'].items()]
+    return df.drop(columns='batch_id')
+
+def get_audit_users():
+    """Everyone who appears in the audit log, for filter drop-downs."""
+    with closing(db.get_connection()) as conn:
+        return [row[0] for row in conn.execute("SELECT DISTINCT user FROM audit_log WHERE user IS NOT NULL ORDER BY user")]
+
+def compact_audit_log(older_than_days=COMPACT_AFTER_DAYS, batch_size=COMPACT_BATCH_SIZE):
+    """Compresses the changes of entries older than older_than_days in batches; returns how many entries were compacted."""
+    cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+    with closing(db.get_connection()) as conn, database.audit_suspended():
+        rows = conn.execute(f"SELECT id, changes FROM audit_log WHERE batch_id IS NULL AND changed_at < {UTC_OF_LOCAL_DATE} ORDER BY id", (cutoff,)).fetchall()
+        with database.audit_session(conn):
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                payload = json.dumps({str(entry_id): json.loads(changes) for entry_id, changes in batch}, separators=(',', ':'))
+                cursor = conn.execute("INSERT INTO audit_batches (first_id, last_id, payload) VALUES (?, ?, ?)",
+                                      (batch[0][0], batch[-1][0], zlib.compress(payload.encode('utf-8'), 9)))
+                conn.executemany("UPDATE audit_log SET changes = NULL, batch_id = ? WHERE id = ?",
+                                 [(cursor.lastrowid, entry_id) for entry_id, _ in batch])
+        conn.commit()
+    return len(rows)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'compact':
+        print(__doc__)
+        sys.exit(1)
+    database.create_tables()
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else COMPACT_AFTER_DAYS
+    print(f"Compacted {compact_audit_log(days)} audit entries.")
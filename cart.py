@@ -0,0 +1,154 @@
+# cart.py
+"""
+Billing cart keyed by product_id.
+
+Lines keep the order they were added in. Sub-total, GST and grand total are running sums that each
+add, quantity change or removal updates by the difference of one line, so a rerun with hundreds of
+lines costs nothing until the bill is generated. to_frame() builds the DataFrame that
+db.price_bill_items / db.create_bill take, once, at commit time.
+
+parse_pasted_lines(), stock_shortfalls() and set_cart_quantities() serve the bulk order mode, which
+fills the cart from pasted code/quantity lists and checks all lines against stock at once.
+"""
+import re
+
+import pandas as pd
+
+import db_functions as db
+
+CART_COLUMNS = ['product_id', 'name', 'quantity', 'rate', 'gst_percent', 'gst_category']
+
+def _line_totals(line):
+    """(sub-total, GST, amount) of one line; rate includes GST."""
+    amount = line['rate'] * line['quantity']
+    sub_total = line['rate'] / (1 + line['gst_percent'] / 100) * line['quantity']
+    return sub_total, amount - sub_total, amount
+
+class Cart:
+    """Lines by product_id with running totals; every change is O(1)."""
+
+    def __init__(self):
+        self._lines = {}  # product_id -> {'product_id', 'name', 'quantity', 'rate', 'gst_percent', 'gst_category'}
+        self.sub_total = self.total_gst = self.grand_total = 0.0
+        self.version = 0  # bumped on every change, e.g. to key widgets that show the lines
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return iter(list(self._lines.values()))
+
+    def __contains__(self, product_id):
+        return product_id in self._lines
+
+    def quantity(self, product_id):
+        line = self._lines.get(product_id)
+        return line['quantity'] if line else 0
+
+    def quantities(self):
+        """{product_id: quantity} of all lines."""
+        return {pid: line['quantity'] for pid, line in self._lines.items()}
+
+    def _count(self, line, sign):
+        self.version += 1
+        sub_total, gst, amount = _line_totals(line)
+        self.sub_total += sign * sub_total
+        self.total_gst += sign * gst
+        self.grand_total += sign * amount
+
+    def add(self, product_id, name, quantity, rate, gst_percent, gst_category):
+        """Adds quantity units, to the existing line if the product is already in the cart."""
+        if product_id in self._lines:
+            self.set_quantity(product_id, self._lines[product_id]['quantity'] + quantity)
+            return
+        line = {'product_id': product_id, 'name': name, 'quantity': int(quantity), 'rate': float(rate),
+                'gst_percent': float(gst_percent), 'gst_category': gst_category}
+        self._lines[product_id] = line
+        self._count(line, 1)
+
+    def set_quantity(self, product_id, quantity):
+        """Changes a line's quantity; 0 or less removes it."""
+        if quantity <= 0:
+            self.remove(product_id)
+            return
+        line = self._lines[product_id]
+        self._count(line, -1)
+        line['quantity'] = int(quantity)
+        self._count(line, 1)
+
+    def remove(self, product_id):
+        line = self._lines.pop(product_id, None)
+        if line is None:
+            return
+        if self._lines:
+            self._count(line, -1)
+        else:
+            self.clear()  # no rounding left over from the running sums
+
+    def clear(self):
+        self.version += 1
+        self._lines.clear()
+        self.sub_total = self.total_gst = self.grand_total = 0.0
+
+    def totals(self):
+        return {'sub_total': self.sub_total, 'total_gst': self.total_gst, 'grand_total': self.grand_total}
+
+    def to_frame(self):
+        """The lines as a DataFrame (CART_COLUMNS), for db.price_bill_items and db.create_bill."""
+        return pd.DataFrame(list(self._lines.values()), columns=CART_COLUMNS)
+
+def parse_pasted_lines(text):
+    """
+    Reads 'code quantity' lines (tab, comma, semicolon or space separated; quantity 1 if left out), as
+    pasted from a spreadsheet or order list. Returns ({code: total quantity}, lines that could not be read).
+    """
+    quantities, unreadable = {}, []
+    for line in text.splitlines():
+        parts = [part for part in re.split(r'[\t,;\s]+', line.strip()) if part]
+        if not parts:
+            continue
+        try:
+            quantity = int(parts[1]) if len(parts) == 2 else 1
+        except ValueError:
+            quantity = 0
+        if len(parts) > 2 or quantity <= 0:
+            unreadable.append(line.strip())
+            continue
+        quantities[parts[0]] = quantities.get(parts[0], 0) + quantity
+    return quantities, unreadable
+
+def stock_shortfalls(quantities, stock, held):
+    """
+    Checks all requested quantities at once. quantities and held are {product_id: quantity}, stock a
+    Series indexed by product_id. Returns the units available (stock less other carts' holds) for
+    every product asked for beyond them; quantities of 0 (removals) always pass.
+    """
+    wanted = pd.Series(quantities, dtype='int64')
+    held = pd.Series(held, dtype='int64').reindex(wanted.index, fill_value=0)
+    available = stock.reindex(wanted.index, fill_value=0).astype('int64') - held
+    return available[(wanted > 0) & (wanted > available)].clip(lower=0)
+
+def set_cart_quantities(cart, quantities, products_df, taxes_df, held_elsewhere, session_key):
+    """
+    Sets the cart quantity of many products ({product_id: quantity}, 0 removes the line) with one
+    vectorized stock check and one hold update. Returns a message for every line left unchanged.
+    """
+    shortfalls = stock_shortfalls(quantities, products_df['stock'], held_elsewhere)
+    errors = [f"{products_df.at[pid, 'name']} ({products_df.at[pid, 'size']}): only {available} available." for pid, available in shortfalls.items()]
+    quantities = {pid: qty for pid, qty in quantities.items() if pid not in shortfalls.index}
+    stock = products_df['stock'].reindex(list(quantities)).astype(int).to_dict()
+    refused = set(db.hold_stock_many(session_key, quantities, stock))
+    errors += [f"{products_df.at[pid, 'name']} ({products_df.at[pid, 'size']}): just taken by another terminal." for pid in refused]
+
+    new_ids = [pid for pid, qty in quantities.items() if qty > 0 and pid not in cart and pid not in refused]
+    new_rows = products_df.loc[new_ids]
+    gst_percents = new_rows['gst_category'].map(taxes_df.drop_duplicates('tax_name').set_index('tax_name')['tax_value']).fillna(0)
+    for pid, qty in quantities.items():
+        if pid in refused:
+            continue
+        if pid in cart:
+            cart.set_quantity(pid, qty)
+        elif qty > 0:
+            row = new_rows.loc[pid]
+            cart.add(pid, f"{row['name']} ({row['size']})", qty, row['selling_price'], gst_percents[pid], row['gst_category'])
+    return errors
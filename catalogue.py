@@ -0,0 +1,188 @@
+# catalogue.py
+"""
+Process-wide product catalogue shared by all Streamlit sessions and API requests.
+
+A Catalogue is an immutable version of the products table held as NumPy columns, with type, size,
+category and gst_category stored as small integer codes into per-column category lists, so each
+distinct string exists once. The DataFrame view (Catalogue.frame) is built once per version and
+shared, so sessions hold references to one copy instead of each loading their own.
+
+Versions are copy-on-write:
+- a commit by any connection (a sale, a PO, a stock adjustment) is seen through PRAGMA data_version
+  and produces a new version that re-reads only the stock column and shares every other array;
+- product master edits in this process call invalidate(), which forces a full reload;
+- edits made by other processes are picked up by a full reload after CATALOGUE_TTL.
+
+Memory still grows with the number of sessions: a session keeps the frame of the version that was
+current at its last rerun (products_df, and original_products_df in the product editor), so idle
+sessions pin old versions. The frame of a stock-only version shares every column except stock (and
+the index) with the previous frame, so each pinned version costs about 8 bytes per SKU; see
+tests/test_catalogue.py for the 50k SKU x 20 session measurement.
+"""
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import db_functions as db
+
+CATALOGUE_TTL = 60  # seconds before a full reload picks up product edits made by other processes
+CATEGORICAL_COLUMNS = ('type', 'size', 'category', 'gst_category')
+PRODUCT_COLUMNS = ['name', 'type', 'size', 'purchase_price', 'selling_price', 'category', 'gst_category', 'stock']
+
+_lock = threading.Lock()
+_state = {'catalogue': None, 'loaded_at': 0.0, 'full_reload': True, 'data_version': None, 'conn': None, 'db_file': None}
+
+class Catalogue:
+    """One immutable version of the product table; rows are ordered by product id."""
+
+    def __init__(self, version, ids, columns, codes, categories):
+        self.version = version
+        self.ids = ids  # sorted int64 product ids
+        self.columns = columns  # name (object), purchase_price / selling_price (float64), stock (int64)
+        self.codes = codes  # column -> int codes into categories[column], -1 for NULL
+        self.categories = categories  # column -> object array of distinct values
+        for array in (ids, *columns.values(), *codes.values()):
+            array.flags.writeable = False
+        self._frame = None
+        self._base_frame = None  # frame of the version this one was derived from, to share its columns
+        self._options = None
+        self._frame_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays (product names counted by their string length)."""
+        total = self.ids.nbytes + sum(a.nbytes for a in self.codes.values())
+        total += sum(a.nbytes for key, a in self.columns.items() if key != 'name')
+        strings = [self.columns['name']] + list(self.categories.values())
+        return total + sum(sum(len(s) for s in a if isinstance(s, str)) + a.nbytes for a in strings)
+
+    def positions(self, product_ids):
+        """Row positions of product_ids; -1 for ids not in the catalogue."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(product_ids), -1)
+        pos = np.minimum(np.searchsorted(self.ids, product_ids), len(self.ids) - 1)
+        return np.where(self.ids[pos] == product_ids, pos, -1)
+
+    def column(self, name, positions=slice(None)):
+        """Values of one column (only at positions, if given), decoding categorical codes."""
+        if name in self.codes:
+            codes, categories = self.codes[name][positions], self.categories[name]
+            if not len(categories):
+                return np.full(len(codes), None, dtype=object)
+            return np.where(codes >= 0, categories[np.maximum(codes, 0)], None)
+        return self.columns[name][positions]
+
+    def rows(self, product_ids, columns=PRODUCT_COLUMNS):
+        """Only the given products as a DataFrame like frame (index id); ids not in the catalogue are left out."""
+        positions = self.positions(product_ids)
+        positions = positions[positions >= 0]
+        return pd.DataFrame({name: self.column(name, positions) for name in columns}, index=pd.Index(self.ids[positions], name='id'))
+
+    def label(self, product_id):
+        """'name (size)' of one product, None if unknown."""
+        pos = self.positions([product_id])[0]
+        if pos < 0:
+            return None
+        size_code = self.codes['size'][pos]
+        return f"{self.columns['name'][pos]} ({self.categories['size'][size_code] if size_code >= 0 else ''})"
+
+    @property
+    def frame(self):
+        """
+        The catalogue as a DataFrame shaped like db.get_products() (index id). Built once per version
+        and shared, with the text columns pointing at the category strings: treat it as read-only.
+        """
+        with self._frame_lock:
+            if self._frame is None and self._base_frame is not None:
+                # Stock-only version: every other column (and the index) is the previous frame's
+                base = self._base_frame
+                data = {name: base[name] if name != 'stock' else pd.Series(self.columns['stock'], index=base.index, name='stock', copy=False)
+                        for name in PRODUCT_COLUMNS}
+                self._frame = pd.DataFrame(data, copy=False)
+            elif self._frame is None:
+                data = {name: self.column(name) for name in PRODUCT_COLUMNS}
+                self._frame = pd.DataFrame(data, index=pd.Index(self.ids, name='id'))
+            self._base_frame = None
+            return self._frame
+
+    @property
+    def product_options(self):
+        """
+        ('name - size' labels in row order, {label: product id}) for product pickers. Built once and
+        shared with the stock-only versions that follow; label i belongs to row position i (see positions()).
+        """
+        with self._frame_lock:
+            if self._options is None:
+                labels = [f"{name} - {size}" for name, size in zip(self.columns['name'], self.column('size'))]
+                self._options = (labels, dict(zip(labels, self.ids.tolist())))
+            return self._options
+
+    def with_stock(self, version, stock):
+        """Copy-on-write: a new version sharing everything but the stock column."""
+        columns = dict(self.columns, stock=stock)
+        catalogue = Catalogue(version, self.ids, columns, self.codes, self.categories)
+        catalogue._options = self._options
+        catalogue._base_frame = self._frame if self._frame is not None else self._base_frame
+        return catalogue
+
+def _encode(values):
+    """(codes, categories) for an object array; NULLs get code -1."""
+    series = pd.Series(values, dtype=object)
+    codes, categories = pd.factorize(series)
+    return codes.astype(np.int32), np.asarray(categories, dtype=object)
+
+def _load(conn, version):
+    rows = conn.execute(f"SELECT id, {', '.join(PRODUCT_COLUMNS)} FROM products ORDER BY id").fetchall()
+    values = list(zip(*rows)) if rows else [()] * (len(PRODUCT_COLUMNS) + 1)
+    ids = np.asarray(values[0], dtype=np.int64)
+    raw = dict(zip(PRODUCT_COLUMNS, values[1:]))
+    columns = {'name': np.asarray(raw['name'], dtype=object),
+               'purchase_price': np.asarray(raw['purchase_price'], dtype=np.float64),
+               'selling_price': np.asarray(raw['selling_price'], dtype=np.float64),
+               'stock': np.asarray([s or 0 for s in raw['stock']], dtype=np.int64)}
+    codes, categories = {}, {}
+    for name in CATEGORICAL_COLUMNS:
+        codes[name], categories[name] = _encode(raw[name])
+    return Catalogue(version, ids, columns, codes, categories)
+
+def _connection():
+    """The catalogue's own long-lived connection; data_version only reports commits made by other connections."""
+    if _state['conn'] is None or _state['db_file'] != db.DB_FILE:
+        _state['conn'] = sqlite3.connect(db.DB_FILE, check_same_thread=False)
+        _state['db_file'] = db.DB_FILE
+        _state['full_reload'] = True
+    return _state['conn']
+
+def get_catalogue():
+    """The current catalogue version, reloading (fully or only the stock column) if the database changed."""
+    with _lock:
+        conn = _connection()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        current = _state['catalogue']
+        version = current.version + 1 if current is not None else 1
+        if current is None or _state['full_reload'] or time.time() - _state['loaded_at'] > CATALOGUE_TTL:
+            _state.update(catalogue=_load(conn, version), loaded_at=time.time(), full_reload=False, data_version=data_version)
+        elif data_version != _state['data_version']:
+            rows = conn.execute("SELECT id, stock FROM products ORDER BY id").fetchall()
+            ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+            if np.array_equal(ids, current.ids):
+                stock = np.asarray([row[1] or 0 for row in rows], dtype=np.int64)
+                if not np.array_equal(stock, current.columns['stock']):
+                    _state['catalogue'] = current.with_stock(version, stock)
+            else:
+                # Products were added or removed by another process
+                _state.update(catalogue=_load(conn, version), loaded_at=time.time())
+            _state['data_version'] = data_version
+        return _state['catalogue']
+
+def invalidate():
+    """Forces a full reload on the next get_catalogue(); called after product master edits."""
+    with _lock:
+        _state['full_reload'] = True
@@ -1,7 +1,99 @@
 # database.py
+import getpass
+import json
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 
-def create_connection(db_file="liquor_store.db"):
+DB_FILE = "liquor_store.db"
+SCHEMA_VERSION = 8  # bump with every schema change; databases already at this version skip create_tables()
+
+# Tables whose changes are written to audit_log by triggers, and the events recorded for each.
+# Issuing a bill is not audited (the bill is its own record) and products.stock is ignored, so
+# selling writes no audit rows; returns, voids and edits are audited through bill_adjustments.
+AUDITED_TABLES = {
+    'products': ('INSERT', 'UPDATE', 'DELETE'),
+    'customers': ('INSERT', 'UPDATE', 'DELETE'),
+    'vendors': ('INSERT', 'UPDATE', 'DELETE'),
+    'tax_config': ('INSERT', 'UPDATE', 'DELETE'),
+    'store_info': ('INSERT', 'UPDATE', 'DELETE'),
+    'purchase_orders': ('INSERT', 'UPDATE', 'DELETE'),
+    'purchase_order_items': ('INSERT', 'DELETE'),  # PO edits replace the lines
+    'bills': ('UPDATE', 'DELETE'),
+    'bill_adjustments': ('INSERT',),
+}
+AUDIT_IGNORED_COLUMNS = {'products': {'stock'}}
+
+# Every taxed line with the date it counts on: sales ('output') by bill date, returns and edits by
+# adjustment date, purchases ('input', rates exclude GST) by purchase date. tax_daily holds these summed
+# per day and rate; taxreturn.py reconciles the two.
+TAX_LINES_SQL = """
+SELECT b.bill_date AS tax_date, 'output' AS direction, COALESCE(bi.gst_percent, 0) AS gst_percent,
+       bi.amount - bi.gst_amount AS taxable_amount, bi.gst_amount AS tax_amount
+FROM bill_items bi JOIN bills b ON b.id = bi.bill_id
+UNION ALL
+SELECT adjustment_date, 'output', COALESCE(gst_percent, 0), amount - gst_amount, gst_amount FROM bill_adjustments
+UNION ALL
+SELECT po.purchase_date, 'input', COALESCE(poi.gst_percent, 0), poi.amount, poi.gst_amount
+FROM purchase_order_items poi JOIN purchase_orders po ON po.id = poi.purchase_order_id
+"""
+
+_schema_ready = set()  # database files this process has already checked
+_audit_context = threading.local()
+
+def _default_audit_user():
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "system"
+
+DEFAULT_AUDIT_USER = _default_audit_user()
+
+def set_audit_user(user):
+    """ Name recorded in audit_log for writes made from the current thread """
+    _audit_context.user = user or None
+
+def get_audit_user():
+    return getattr(_audit_context, 'user', None) or DEFAULT_AUDIT_USER
+
+@contextmanager
+def audit_suspended():
+    """ Maintenance writes (migrations, archiving) made inside this block are not audited row by row """
+    previous = getattr(_audit_context, 'suspended', False)
+    _audit_context.suspended = True
+    try:
+        yield
+    finally:
+        _audit_context.suspended = previous
+
+# The triggers read the writing session's user and audit_suspended() state from the one-row
+# audit_session table instead of calling application functions, so any SQLite client can write to the
+# audited tables. The application fills the row inside its write transactions and removes it before
+# they commit; writes made without it (sqlite3 shell, DB Browser, scripts) are audited as this user.
+EXTERNAL_AUDIT_USER = "external"
+AUDIT_ENABLED_SQL = "NOT EXISTS (SELECT 1 FROM audit_session WHERE suspended)"
+AUDIT_USER_SQL = f"COALESCE((SELECT user FROM audit_session), '{EXTERNAL_AUDIT_USER}')"
+
+@contextmanager
+def audit_session(cursor):
+    """
+    Publishes the current thread's audit user and audit_suspended() state to the triggers for the
+    writes made inside this block. Use it inside the write transaction; the row never gets committed.
+    """
+    cursor.execute("INSERT OR REPLACE INTO audit_session (id, user, suspended) VALUES (1, ?, ?)",
+                   (get_audit_user(), int(getattr(_audit_context, 'suspended', False))))
+    try:
+        yield
+    finally:
+        cursor.execute("DELETE FROM audit_session")
+
+def record_audit(cursor, table_name, row_id, action, changes):
+    """ Adds one audit entry written by the application rather than a trigger (e.g. an archive run) """
+    cursor.execute("INSERT INTO audit_log (changed_at, user, table_name, row_id, action, changes) VALUES (strftime('%Y-%m-%d %H:%M:%f', 'now'), ?, ?, ?, ?, ?)",
+                   (get_audit_user(), table_name, row_id, action, json.dumps(changes, separators=(',', ':'))))
+
+def create_connection(db_file=DB_FILE):
     """ Create a database connection to the SQLite database """
     conn = None
     try:
@@ -11,12 +103,96 @@ def create_connection(db_file="liquor_store.db"):
         print(e)
     return conn
 
+def _add_column(cursor, table, column, definition):
+    """ Add a column to a table created by an older version of the application """
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _tax_daily_upsert(select):
+    """ Adds the (tax_date, direction, gst_percent, taxable_amount, tax_amount, line_count) rows of select to tax_daily """
+    return f'''
+    INSERT INTO tax_daily (tax_date, direction, gst_percent, taxable_amount, tax_amount, line_count) {select}
+    ON CONFLICT (tax_date, direction, gst_percent) DO UPDATE SET taxable_amount = taxable_amount + excluded.taxable_amount,
+        tax_amount = tax_amount + excluded.tax_amount, line_count = line_count + excluded.line_count;'''
+
+def _create_tax_triggers(cursor):
+    """ Triggers that keep tax_daily in step with every write to bill and purchase lines """
+    bill_line = ("SELECT bill_date, 'output', COALESCE({r}.gst_percent, 0), {s}({r}.amount - {r}.gst_amount), {s}{r}.gst_amount, {s}1 "
+                 "FROM bills WHERE id = {r}.bill_id")
+    po_line = ("SELECT purchase_date, 'input', COALESCE({r}.gst_percent, 0), {s}{r}.amount, {s}{r}.gst_amount, {s}1 "
+               "FROM purchase_orders WHERE id = {r}.purchase_order_id")
+    bill_lines = ("SELECT {d}, 'output', COALESCE(gst_percent, 0), {s}SUM(amount - gst_amount), {s}SUM(gst_amount), {s}COUNT(*) "
+                  "FROM bill_items WHERE bill_id = NEW.id GROUP BY 3")
+    po_lines = ("SELECT {d}, 'input', COALESCE(gst_percent, 0), {s}SUM(amount), {s}SUM(gst_amount), {s}COUNT(*) "
+                "FROM purchase_order_items WHERE purchase_order_id = NEW.id GROUP BY 3")
+    adjustment = "SELECT NEW.adjustment_date, 'output', COALESCE(NEW.gst_percent, 0), NEW.amount - NEW.gst_amount, NEW.gst_amount, 1 WHERE true"
+    # Deletes made during maintenance (archiving) keep their totals, like day_close
+    triggers = {
+        'tax_daily_bill_items_insert': ("AFTER INSERT ON bill_items", [bill_line.format(r='NEW', s='')]),
+        'tax_daily_bill_items_update': ("AFTER UPDATE ON bill_items", [bill_line.format(r='OLD', s='-'), bill_line.format(r='NEW', s='')]),
+        'tax_daily_bill_items_delete': (f"AFTER DELETE ON bill_items WHEN {AUDIT_ENABLED_SQL}", [bill_line.format(r='OLD', s='-')]),
+        'tax_daily_bill_adjustments_insert': ("AFTER INSERT ON bill_adjustments", [adjustment]),
+        'tax_daily_bills_date': ("AFTER UPDATE OF bill_date ON bills WHEN OLD.bill_date IS NOT NEW.bill_date",
+                                 [bill_lines.format(d='OLD.bill_date', s='-'), bill_lines.format(d='NEW.bill_date', s='')]),
+        'tax_daily_po_items_insert': ("AFTER INSERT ON purchase_order_items", [po_line.format(r='NEW', s='')]),
+        'tax_daily_po_items_update': ("AFTER UPDATE ON purchase_order_items", [po_line.format(r='OLD', s='-'), po_line.format(r='NEW', s='')]),
+        'tax_daily_po_items_delete': (f"AFTER DELETE ON purchase_order_items WHEN {AUDIT_ENABLED_SQL}", [po_line.format(r='OLD', s='-')]),
+        'tax_daily_purchase_orders_date': ("AFTER UPDATE OF purchase_date ON purchase_orders WHEN OLD.purchase_date IS NOT NEW.purchase_date",
+                                           [po_lines.format(d='OLD.purchase_date', s='-'), po_lines.format(d='NEW.purchase_date', s='')]),
+    }
+    for name, (event, selects) in triggers.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {''.join(_tax_daily_upsert(select) for select in selects)} END")
+
+def _create_audit_triggers(cursor, table, events):
+    """
+    (Re)creates the audit triggers of one table. INSERT and DELETE store the full row as JSON, UPDATE
+    only the changed columns as {"column": [old, new]}; updates that change nothing are not logged.
+    """
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    tracked = [c for c in columns if c not in AUDIT_IGNORED_COLUMNS.get(table, ())]
+    def image(ref):
+        return "json_object(" + ", ".join(f"'{c}', {ref}.{c}" for c in tracked) + ")"
+    # json_patch drops the null members, i.e. the unchanged columns
+    diff = "json_patch('{}', json_object(" + ", ".join(
+        f"'{c}', CASE WHEN OLD.{c} IS NOT NEW.{c} THEN json_array(OLD.{c}, NEW.{c}) END" for c in tracked) + "))"
+    bodies = {'INSERT': ('NEW', image('NEW')), 'UPDATE': ('NEW', diff), 'DELETE': ('OLD', image('OLD'))}
+    for event in events:
+        name = f"audit_{table}_{event.lower()}"
+        ref, changes = bodies[event]
+        of = f" OF {', '.join(tracked)}" if event == 'UPDATE' else ""
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f'''
+        CREATE TRIGGER {name} AFTER {event}{of} ON {table} WHEN {AUDIT_ENABLED_SQL}
+        BEGIN
+            INSERT INTO audit_log (changed_at, user, table_name, row_id, action, changes)
+            SELECT strftime('%Y-%m-%d %H:%M:%f', 'now'), {AUDIT_USER_SQL}, '{table}', {ref}.id, '{event}', changes
+            FROM (SELECT {changes} AS changes) WHERE changes != '{{}}';
+        END''')
+
 def create_tables():
-    """ Create the tables needed for the application """
+    """ Create the tables needed for the application; runs once per process and database """
+    db_path = os.path.abspath(DB_FILE)
+    if db_path in _schema_ready:
+        return
     conn = create_connection()
     if conn is not None:
         try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                _schema_ready.add(db_path)
+                return
+            # Triggers of schema versions before 8 call these until they are recreated below
+            conn.create_function("audit_enabled", 0, lambda: 0)
+            conn.create_function("audit_user", 0, get_audit_user)
             c = conn.cursor()
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS audit_session (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                user TEXT,
+                suspended INTEGER NOT NULL DEFAULT 0
+            )''')
+            c.execute("INSERT OR REPLACE INTO audit_session (id, user, suspended) VALUES (1, NULL, 1)")  # migration backfills are not audited
 
             # Product Table
             c.execute('''
@@ -109,6 +285,8 @@ def create_tables():
             c.execute('''
             CREATE TABLE IF NOT EXISTS bills (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bill_uuid TEXT,
+                customer_id INTEGER,
                 bill_date TEXT NOT NULL,
                 customer_name TEXT,
                 pay_mode TEXT,
@@ -143,7 +321,184 @@ def create_tables():
                 vat_number TEXT NOT NULL
             )''')
 
+            # Client-generated bill id, so a bill replayed from the offline journal is inserted only once
+            _add_column(c, 'bills', 'bill_uuid', 'TEXT')
+            c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bills_uuid ON bills (bill_uuid)")
+
+            # Returns, voids and edits: signed lines recorded against the original bill, which is never rewritten
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS bill_adjustments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bill_id INTEGER NOT NULL,
+                adjustment_date TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                reason TEXT,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                rate REAL NOT NULL,
+                gst_percent REAL NOT NULL,
+                gst_amount REAL NOT NULL,
+                amount REAL NOT NULL,
+                FOREIGN KEY (bill_id) REFERENCES bills (id),
+                FOREIGN KEY (product_id) REFERENCES products (id)
+            )''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_bill_adjustments_bill ON bill_adjustments (bill_id)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_bill_adjustments_date ON bill_adjustments (adjustment_date)")
+
+            # Prefix search on customer names at the till (mobile already has the UNIQUE index)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name COLLATE NOCASE)")
+
+            # Customer link on bills, backfilled from the free-text name (or a mobile typed as the name);
+            # names shared by several customers are left unlinked
+            _add_column(c, 'bills', 'customer_id', 'INTEGER')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_bills_customer ON bills (customer_id, bill_date)")
+            c.execute('''
+            UPDATE bills SET customer_id = COALESCE(
+                (SELECT id FROM customers WHERE mobile = bills.customer_name),
+                (SELECT MIN(id) FROM customers WHERE name = bills.customer_name HAVING COUNT(*) = 1))
+            WHERE customer_id IS NULL AND customer_name IS NOT NULL AND customer_name != 'Cash Customer'
+            ''')
+
+            # Per-customer aggregate, kept up to date by the bill write paths in db_functions and filled
+            # from the existing bills (net of adjustments, voided bills not counted) only when the table is created
+            new_customer_stats = not c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_stats'").fetchone()
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS customer_stats (
+                customer_id INTEGER PRIMARY KEY,
+                bill_count INTEGER NOT NULL,
+                lifetime_spend REAL NOT NULL,
+                first_visit TEXT,
+                last_visit TEXT
+            )''')
+            if new_customer_stats:
+                c.execute('''
+                INSERT INTO customer_stats (customer_id, bill_count, lifetime_spend, first_visit, last_visit)
+                SELECT b.customer_id, COUNT(*) - COUNT(a.voided), SUM(b.grand_total + IFNULL(a.amount, 0)),
+                    MIN(CASE WHEN a.voided IS NULL THEN b.bill_date END), MAX(CASE WHEN a.voided IS NULL THEN b.bill_date END)
+                FROM bills b LEFT JOIN (
+                    SELECT bill_id, SUM(amount) AS amount, MAX(CASE WHEN kind = 'void' THEN 1 END) AS voided FROM bill_adjustments GROUP BY bill_id
+                ) a ON a.bill_id = b.id
+                WHERE b.customer_id IS NOT NULL GROUP BY b.customer_id
+                ''')
+
+            # Row-level history for audits: who changed a price, edited or voided a bill. changed_at is UTC
+            # (audit.py converts to and from local dates). Changes of older entries are moved into
+            # zlib-compressed batches by audit.compact_audit_log()
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                changed_at TEXT NOT NULL,
+                user TEXT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER,
+                action TEXT NOT NULL,
+                changes TEXT,
+                batch_id INTEGER
+            )''')
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS audit_batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                first_id INTEGER NOT NULL,
+                last_id INTEGER NOT NULL,
+                payload BLOB NOT NULL
+            )''')
+            c.execute("CREATE INDEX IF NOT EXISTS idx_audit_entity ON audit_log (table_name, row_id, changed_at)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_log (user, changed_at)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_audit_changed_at ON audit_log (changed_at)")
+            for table, events in AUDITED_TABLES.items():
+                _create_audit_triggers(c, table, events)
+            # The log is append-only; only compaction (run with auditing suspended) may rewrite it
+            for event in ('UPDATE', 'DELETE'):
+                c.execute(f"DROP TRIGGER IF EXISTS audit_log_no_{event.lower()}")
+                c.execute(f'''
+                CREATE TRIGGER audit_log_no_{event.lower()} BEFORE {event} ON audit_log WHEN {AUDIT_ENABLED_SQL}
+                BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END''')
+
+            # End-of-day close (Z report): immutable totals per day, pay mode and tax category
+            c.execute("CREATE INDEX IF NOT EXISTS idx_bills_date ON bills (bill_date, pay_mode)")
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS day_close (
+                close_date TEXT PRIMARY KEY,
+                closed_at TEXT NOT NULL,
+                closed_by TEXT,
+                bill_count INTEGER NOT NULL,
+                sales_total REAL NOT NULL,
+                adjustment_total REAL NOT NULL,
+                net_total REAL NOT NULL,
+                taxable_total REAL NOT NULL,
+                gst_total REAL NOT NULL
+            )''')
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS day_close_payments (
+                close_date TEXT NOT NULL,
+                pay_mode TEXT NOT NULL,
+                bill_count INTEGER NOT NULL,
+                sales_total REAL NOT NULL,
+                adjustment_total REAL NOT NULL,
+                net_total REAL NOT NULL,
+                PRIMARY KEY (close_date, pay_mode),
+                FOREIGN KEY (close_date) REFERENCES day_close (close_date)
+            )''')
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS day_close_taxes (
+                close_date TEXT NOT NULL,
+                gst_category TEXT NOT NULL,
+                gst_percent REAL NOT NULL,
+                taxable_amount REAL NOT NULL,
+                gst_amount REAL NOT NULL,
+                PRIMARY KEY (close_date, gst_category, gst_percent),
+                FOREIGN KEY (close_date) REFERENCES day_close (close_date)
+            )''')
+            for table in ('day_close', 'day_close_payments', 'day_close_taxes'):
+                for event in ('UPDATE', 'DELETE'):
+                    c.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_no_{event.lower()} BEFORE {event} ON {table}
+                    BEGIN SELECT RAISE(ABORT, 'A closed day cannot be changed'); END''')
+            # A closed day is locked: no new bills, adjustments or changes to its totals. Returns of old
+            # bills are dated on the day they happen. Archiving runs with auditing suspended and may
+            # still remove the bills of closed days; their day_close records stay.
+            closed = "EXISTS (SELECT 1 FROM day_close WHERE close_date = {})"
+            locks = {
+                'day_lock_bills_insert': ("BEFORE INSERT ON bills", closed.format("NEW.bill_date")),
+                'day_lock_bills_update': ("BEFORE UPDATE OF bill_date, pay_mode, sub_total, total_gst, total_tcs, grand_total ON bills",
+                                          "(OLD.bill_date IS NOT NEW.bill_date OR OLD.pay_mode IS NOT NEW.pay_mode OR OLD.sub_total IS NOT NEW.sub_total"
+                                          " OR OLD.total_gst IS NOT NEW.total_gst OR OLD.total_tcs IS NOT NEW.total_tcs OR OLD.grand_total IS NOT NEW.grand_total)"
+                                          f" AND ({closed.format('OLD.bill_date')} OR {closed.format('NEW.bill_date')})"),
+                'day_lock_bills_delete': ("BEFORE DELETE ON bills", f"{AUDIT_ENABLED_SQL} AND {closed.format('OLD.bill_date')}"),
+                'day_lock_bill_items_update': ("BEFORE UPDATE ON bill_items", closed.format("(SELECT bill_date FROM bills WHERE id = OLD.bill_id)")),
+                'day_lock_bill_items_delete': ("BEFORE DELETE ON bill_items", f"{AUDIT_ENABLED_SQL} AND {closed.format('(SELECT bill_date FROM bills WHERE id = OLD.bill_id)')}"),
+                'day_lock_bill_adjustments_insert': ("BEFORE INSERT ON bill_adjustments", closed.format("NEW.adjustment_date")),
+            }
+            for name, (event, condition) in locks.items():
+                c.execute(f"DROP TRIGGER IF EXISTS {name}")
+                c.execute(f'''
+                CREATE TRIGGER {name} {event} WHEN {condition}
+                BEGIN SELECT RAISE(ABORT, 'This day is closed'); END''')
+
+            # Output and input tax per day and rate for GST/VAT returns, kept current by triggers and
+            # filled from the existing lines only when the table is created (archived years keep their totals)
+            new_tax_daily = not c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tax_daily'").fetchone()
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS tax_daily (
+                tax_date TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                gst_percent REAL NOT NULL,
+                taxable_amount REAL NOT NULL,
+                tax_amount REAL NOT NULL,
+                line_count INTEGER NOT NULL,
+                PRIMARY KEY (tax_date, direction, gst_percent)
+            )''')
+            if new_tax_daily:
+                c.execute(f'''
+                INSERT INTO tax_daily (tax_date, direction, gst_percent, taxable_amount, tax_amount, line_count)
+                SELECT tax_date, direction, gst_percent, SUM(taxable_amount), SUM(tax_amount), COUNT(*) FROM ({TAX_LINES_SQL}) GROUP BY 1, 2, 3
+                ''')
+            _create_tax_triggers(c)
+
+            c.execute("DELETE FROM audit_session")
+            c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             conn.commit()
+            _schema_ready.add(db_path)
         except sqlite3.Error as e:
             print(f"Error creating tables: {e}")
         finally:
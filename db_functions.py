@@ -1,99 +1,666 @@
 # db_functions.py
+import functools
+import json
+import os
 import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from datetime import date, timedelta
+from pathlib import Path
 import pandas as pd
-import numpy as np
+
+import database
 
 DB_FILE = "liquor_store.db"
 
+# Heavy ranged reports (Reports page jobs, API /reports) read from a separate connection so they don't
+# compete with billing; operational views (dashboard, stock management, bills) always read the live file.
+# 'snapshot' = copy via the online backup API, refreshed once the live DB has changed, 'readonly' = mode=ro
+# on the live file, 'live' = old behaviour
+REPORT_MODE = "snapshot"
+REPORT_SNAPSHOT_FILE = "liquor_store_report.db"
+REPORT_SNAPSHOT_INTERVAL = 300  # seconds; upper bound on snapshot age, e.g. for WAL commits by other processes
+REPORT_SNAPSHOT_PAGES = 256  # pages copied per backup step; the live DB is unlocked between steps
+# 'sqlite' or 'duckdb' (optional dependency; attaches the database read-only through DuckDB's SQLite scanner)
+REPORT_BACKEND = "sqlite"
+
+# Memoized report results and master data, shared by all sessions of this process; entries are
+# dropped by the write functions that touch their tables
+REPORT_CACHE_MAX_ENTRIES = 128
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+REPORT_CACHE_TTL = 300  # seconds; catches writes made by other processes
+MASTER_DATA_TTL = 60  # seconds; vendors, taxes, customers and store details edited by other processes
+
+# Idle read connections kept open for reuse by all sessions
+CONNECTION_POOL_SIZE = 8
+
+# Bill, PO and stock writes go through one writer thread (see writer.py) that group-commits them
+USE_WRITE_QUEUE = True
+
+# Carts hold stock for this long without activity before other terminals can sell it
+STOCK_HOLD_TTL = 900  # seconds
+
+_snapshot_lock = threading.Lock()
+_snapshot_taken_at = 0.0
+_snapshot_counter = None  # live file change counter the current snapshot was copied at
+_snapshot_dirty = False  # set by this process's writes (the counter doesn't move per commit in WAL mode)
+_report_context = threading.local()
+_report_cache = OrderedDict()  # (function, args, kwargs) -> (DataFrame, tables, nbytes, stored_at), least recently used first
+_report_cache_lock = threading.Lock()
+_report_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_table_versions = {}  # table -> number of times this process invalidated it; None key counts clear_report_cache()
+_pool = None
+_pool_lock = threading.Lock()
+_stock_holds = {}  # (session_key, product_id) -> [quantity, expires_at], shared by all sessions of this process only (not api.py's)
+_stock_holds_lock = threading.Lock()
+
+class InsufficientStockError(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Insufficient stock for product ID(s) {', '.join(map(str, product_ids))}. Another terminal may have sold it.")
+
 def get_connection():
     return sqlite3.connect(DB_FILE, detect_types=sqlite3.PARSE_DECLTYPES)
 
+class ConnectionPool:
+    """Read connections to db_file reused across threads, instead of one new connection per query."""
+
+    def __init__(self, db_file, size=CONNECTION_POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self.stats = {'opened': 0, 'reused': 0}
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self.stats['reused' if conn is not None else 'opened'] += 1
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        try:
+            yield conn
+            conn.rollback()  # never hand out a connection with a transaction still open
+        except Exception:
+            conn.close()
+            raise
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+def get_connection_pool():
+    """The process-wide read pool for DB_FILE."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_file != DB_FILE:
+            _pool = ConnectionPool(DB_FILE)
+        return _pool
+
+def _read_query(query, params=(), index_col=None):
+    """Runs a short read on a pooled connection."""
+    with get_connection_pool().connection() as conn:
+        return pd.read_sql_query(query, conn, params=params, index_col=index_col)
+
+def _read_one(query, params=()):
+    """The first row of a short read on a pooled connection, or None."""
+    with get_connection_pool().connection() as conn:
+        return conn.execute(query, params).fetchone()
+
+def _readonly_connection(db_file):
+    uri = Path(db_file).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True, detect_types=sqlite3.PARSE_DECLTYPES)
+
+def _live_change_counter():
+    """The file change counter in the SQLite header, bumped by every commit in rollback-journal mode."""
+    try:
+        with open(DB_FILE, 'rb') as f:
+            f.seek(24)
+            return f.read(4)
+    except OSError:
+        return None
+
+def _snapshot_is_fresh():
+    return (not _snapshot_dirty and _snapshot_counter == _live_change_counter()
+            and time.time() - _snapshot_taken_at < REPORT_SNAPSHOT_INTERVAL and os.path.exists(REPORT_SNAPSHOT_FILE))
+
+def refresh_report_snapshot(force=False):
+    """
+    Copies the live database into the reporting snapshot once the live file has changed since the last
+    copy (or the copy is older than REPORT_SNAPSHOT_INTERVAL). While another thread is copying, reports
+    keep reading the existing snapshot instead of waiting.
+    """
+    global _snapshot_taken_at, _snapshot_counter, _snapshot_dirty
+    import backup
+    if not force and _snapshot_is_fresh():
+        return False
+    if not _snapshot_lock.acquire(blocking=force or not os.path.exists(REPORT_SNAPSHOT_FILE)):
+        return False
+    try:
+        if not force and _snapshot_is_fresh():
+            return False  # another thread refreshed it while this one waited
+        # Read before copying: a commit that lands during the copy makes the next report copy again
+        counter, _snapshot_dirty = _live_change_counter(), False
+        tmp_file = REPORT_SNAPSHOT_FILE + ".tmp"
+        # Commits by the till restart a paged copy in rollback-journal mode; this copy gives up paging
+        # after backup.BACKUP_MAX_RESTARTS restarts and finishes in one step
+        backup._copy_database(DB_FILE, tmp_file, pages=REPORT_SNAPSHOT_PAGES)
+        try:
+            os.replace(tmp_file, REPORT_SNAPSHOT_FILE)
+        except PermissionError:
+            # Windows refuses to replace a file that a report still has open; keep the old snapshot for now
+            os.remove(tmp_file)
+            _snapshot_dirty = True
+            return False
+        _snapshot_taken_at, _snapshot_counter = time.time(), counter
+        return True
+    finally:
+        _snapshot_lock.release()
+
+def get_report_connection():
+    """Returns a read-only connection for heavy reports according to REPORT_MODE."""
+    if REPORT_MODE == "snapshot":
+        refresh_report_snapshot()
+        return _readonly_connection(REPORT_SNAPSHOT_FILE)
+    if REPORT_MODE == "readonly":
+        return _readonly_connection(DB_FILE)
+    return get_connection()
+
+def _duckdb_report_connection(heavy=False):
+    import duckdb
+    if REPORT_MODE == "snapshot" and heavy:
+        refresh_report_snapshot()
+        db_file = REPORT_SNAPSHOT_FILE
+    else:
+        db_file = DB_FILE
+    conn = duckdb.connect()
+    conn.execute("INSTALL sqlite; LOAD sqlite;")
+    path = str(Path(db_file).resolve()).replace("'", "''")  # ATTACH takes no parameters
+    conn.execute(f"ATTACH '{path}' AS store (TYPE SQLITE, READ_ONLY)")
+    conn.execute("USE store")
+    return conn
+
+def _reads_report_source(fresh=False):
+    """True when a report runs as a heavy ranged report (see heavy_report_reads) and may read REPORT_MODE's source."""
+    return not fresh and getattr(_report_context, 'heavy', False)
+
+def _report_connection(fresh=False):
+    """
+    Report functions read the live database unless they run as a heavy ranged report; they take
+    fresh=True when even then the caller must see its own latest writes (e.g. Bills Management).
+    """
+    heavy = _reads_report_source(fresh)
+    if REPORT_BACKEND == "duckdb":
+        return _duckdb_report_connection(heavy)
+    return get_report_connection() if heavy else get_connection()
+
+def _read_sql(conn, query, params=()):
+    if isinstance(conn, sqlite3.Connection):
+        return pd.read_sql_query(query, conn, params=params)
+    return conn.execute(query, list(params)).df()
+
+def _date_literal(value):
+    """An ISO date as a SQL literal, for views, which cannot take parameters."""
+    return f"'{date.fromisoformat(str(value)).isoformat()}'"
+
+def _attach_archived_rows(conn, table, date_column, start_date=None, end_date=None):
+    """
+    Creates temp view <table>_all = live rows UNION ALL the archived rows dated between start_date and
+    end_date (either bound may be None). SQLite gets them from archive.read_archive() in a temp table,
+    DuckDB reads the Parquet files.
+    """
+    import archive
+    start_date, end_date = (str(bound) if bound else None for bound in (start_date, end_date))
+    if not isinstance(conn, sqlite3.Connection):
+        if not archive.has_dataset(table):
+            conn.execute(f"CREATE TEMP VIEW {table}_all AS SELECT * FROM store.{table}")
+            return
+        files = archive.dataset_glob(table).replace("'", "''")
+        conditions = ["true"]
+        if start_date:
+            conditions += [f"year >= {int(start_date[:4])}", f"{date_column} >= {_date_literal(start_date)}"]
+        if end_date:
+            conditions += [f"year <= {int(end_date[:4])}", f"{date_column} <= {_date_literal(end_date)}"]
+        conn.execute(f"""CREATE TEMP VIEW {table}_all AS SELECT * FROM store.{table} UNION ALL BY NAME
+                     SELECT * EXCLUDE (year, month) FROM read_parquet('{files}', hive_partitioning = true) WHERE {' AND '.join(conditions)}""")
+        return
+    archived = archive.read_archive(table, date_column, start_date, end_date)
+    if archived.empty:
+        conn.execute(f"CREATE TEMP VIEW {table}_all AS SELECT * FROM main.{table}")
+        return
+    # Columns added to the live table after a year was archived read as NULL for that year
+    columns = [(row[1], row[2]) for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    rows = archived.reindex(columns=[name for name, _ in columns]).astype(object)
+    conn.execute(f"CREATE TEMP TABLE archived_{table} ({', '.join(f'{name} {decl}' for name, decl in columns)})")
+    conn.executemany(f"INSERT INTO archived_{table} VALUES ({', '.join('?' * len(columns))})", rows.where(rows.notna(), None).values.tolist())
+    conn.execute(f"CREATE TEMP VIEW {table}_all AS SELECT * FROM main.{table} UNION ALL SELECT * FROM archived_{table}")
+
+@contextmanager
+def heavy_report_reads():
+    """Reports run in this thread inside the block read per REPORT_MODE (the snapshot by default)."""
+    _report_context.heavy = True
+    try:
+        yield
+    finally:
+        _report_context.heavy = False
+
+@contextmanager
+def bound_report_job(job):
+    """
+    Hands every report connection opened in this thread to job.attach() so the job can track and cancel
+    it; the job's report reads as a heavy report.
+    """
+    _report_context.job = job
+    try:
+        with heavy_report_reads():
+            yield job
+    finally:
+        _report_context.job = None
+
+# Sold lines net of returns/voids/edits: bill lines dated on their bill, adjustment lines on their own date.
+# line_kind (0 = bill line, 1 = adjustment) and line_id order the lines of one bill and date totally.
+BILL_LINES_VIEW = """
+CREATE TEMP VIEW bill_lines_all AS
+SELECT bi.bill_id, b.bill_date AS line_date, 0 AS line_kind, bi.id AS line_id, bi.product_id, bi.quantity, bi.rate, bi.gst_percent, bi.gst_amount, bi.amount
+FROM bill_items_all bi JOIN bills_all b ON b.id = bi.bill_id
+UNION ALL
+SELECT bill_id, adjustment_date, 1, id, product_id, quantity, rate, gst_percent, gst_amount, amount FROM bill_adjustments_all
+"""
+
+@contextmanager
+def _report_reader(start_date, end_date, *headers, fresh=False):
+    """
+    Report connection on which <table>_all holds the live rows plus any archived rows dated between
+    start_date and end_date, for each of the given archive.ARCHIVED_TABLES headers and its item table
+    (and all archived adjustments). With 'bills', bill_lines_all holds the sold lines net of adjustments.
+    """
+    import archive
+    conn = _report_connection(fresh)
+    try:
+        job = getattr(_report_context, 'job', None)
+        if job is not None:
+            job.attach(conn)
+        for header in headers:
+            date_column, items, _ = archive.ARCHIVED_TABLES[header]
+            for table in (header, items):
+                _attach_archived_rows(conn, table, date_column, start_date, end_date)
+            if header in archive.ARCHIVED_ADJUSTMENTS:
+                # Net bill totals need every adjustment of the bills in range, whatever its date. An archived
+                # adjustment is dated no later than the end of its bill's financial year (later ones keep
+                # the bill in the database), so later years need not be read
+                table, _, adjustment_date = archive.ARCHIVED_ADJUSTMENTS[header]
+                fy_end = archive.financial_year_bounds(int(str(end_date)[:4]) - (str(end_date)[5:7] < '04'))[1] if end_date else None
+                _attach_archived_rows(conn, table, adjustment_date, None, fy_end)
+        if 'bills' in headers:
+            conn.execute(BILL_LINES_VIEW)
+        yield conn
+    finally:
+        conn.close()
+
+def _copy(result):
+    return result.copy() if hasattr(result, 'copy') else result
+
+def _cached_report(*tables, ttl=REPORT_CACHE_TTL):
+    """
+    Caches a function's result (a DataFrame, dict or plain value) for all sessions until one of `tables`
+    is written (see _invalidate_reports) or ttl seconds have passed. Callers get their own copy. Calls
+    with fresh=True must see the latest writes, including other processes', and always run the query.
+    Only live reads are stored: a result read from the report snapshot, or one whose tables were
+    written while it ran, may predate the latest writes.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if kwargs.get('fresh'):
+                return func(*args, **kwargs)
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            with _report_cache_lock:
+                entry = _report_cache.get(key)
+                if entry is not None and time.time() - entry[3] < ttl:
+                    _report_cache.move_to_end(key)
+                    _report_cache_stats['hits'] += 1
+                    return _copy(entry[0])
+                _report_cache_stats['misses'] += 1
+                versions = table_versions(*tables)
+            result = func(*args, **kwargs)
+            if REPORT_MODE == "snapshot" and _reads_report_source():
+                return result
+            nbytes = int(result.memory_usage(deep=True).sum()) if isinstance(result, pd.DataFrame) else sys.getsizeof(result)
+            if nbytes <= REPORT_CACHE_MAX_BYTES:
+                with _report_cache_lock:
+                    if table_versions(*tables) == versions:
+                        _report_cache[key] = (_copy(result), frozenset(tables), nbytes, time.time())
+                        _evict_reports()
+            return result
+        wrapper.tables = frozenset(tables)
+        return wrapper
+    return decorator
+
+def table_versions(*tables):
+    """A value that changes whenever this process writes one of tables or clears the report cache."""
+    return tuple(_table_versions.get(table, 0) for table in (None,) + tables)
+
+def _evict_reports():
+    total_bytes = sum(entry[2] for entry in _report_cache.values())
+    while _report_cache and (len(_report_cache) > REPORT_CACHE_MAX_ENTRIES or total_bytes > REPORT_CACHE_MAX_BYTES):
+        _, entry = _report_cache.popitem(last=False)
+        total_bytes -= entry[2]
+        _report_cache_stats['evictions'] += 1
+
+def _invalidate_reports(*tables):
+    """Drops every cached report that reads one of the given tables and marks the report snapshot stale."""
+    global _snapshot_dirty
+    _snapshot_dirty = True
+    with _report_cache_lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+        stale = [key for key, entry in _report_cache.items() if entry[1].intersection(tables)]
+        for key in stale:
+            del _report_cache[key]
+        _report_cache_stats['invalidations'] += len(stale)
+
+def get_report_cache_stats():
+    with _report_cache_lock:
+        stats = dict(_report_cache_stats)
+        stats['entries'] = len(_report_cache)
+        stats['bytes'] = sum(entry[2] for entry in _report_cache.values())
+    return stats
+
+def clear_report_cache():
+    with _report_cache_lock:
+        _report_cache.clear()
+        _table_versions[None] = _table_versions.get(None, 0) + 1
+
+def _as_audit_user(cursor, user, command, *args):
+    """Runs command in the write transaction with the audit user of the session that queued it, published to the audit triggers."""
+    previous = database.get_audit_user()
+    database.set_audit_user(user)
+    try:
+        if command in UNAUDITED_WRITES:
+            return command(cursor, *args)
+        with database.audit_session(cursor):
+            return command(cursor, *args)
+    finally:
+        database.set_audit_user(previous)
+
+def _run_write(command, *args):
+    """
+    Runs a transaction body command(cursor, *args) and returns its result. With USE_WRITE_QUEUE the
+    body is queued to the writer thread and committed together with other pending writes.
+    """
+    if USE_WRITE_QUEUE:
+        import writer
+        return writer.get_write_queue().submit(_as_audit_user, database.get_audit_user(), command, *args).result()
+    with closing(get_connection()) as conn:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA foreign_keys = ON")
+            return _as_audit_user(cursor, database.get_audit_user(), command, *args)
+
+def _param_rows(df, columns):
+    """Rows of df as plain Python values, ready for executemany."""
+    return df[columns].astype(object).values.tolist()
+
+def _stock_deltas(items_df, sign):
+    deltas = items_df.groupby('product_id')['quantity'].sum() * sign
+    return [(int(qty), int(pid)) for pid, qty in deltas.items() if qty]
+
 def execute_query(query, params=(), fetch=None):
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("PRAGMA foreign_keys = ON")
-        cursor.execute(query, params)
+        with database.audit_session(cursor):
+            cursor.execute(query, params)
+            result = cursor.fetchone() if fetch == 'one' else cursor.fetchall() if fetch == 'all' else cursor.lastrowid
         conn.commit()
-        if fetch == 'one':
-            return cursor.fetchone()
-        if fetch == 'all':
-            return cursor.fetchall()
-        return cursor.lastrowid
+        return result
 
 # --- Product, Customer, Vendor, Tax Functions (No Changes) ---
 def add_product(name, p_type, size, purchase_price, selling_price, category, gst_category):
     query = "INSERT INTO products (name, type, size, purchase_price, selling_price, category, gst_category) VALUES (?, ?, ?, ?, ?, ?, ?)"
     try:
-        execute_query(query, (name, p_type, size, purchase_price, selling_price, category, gst_category)); return True, "Product added."
+        execute_query(query, (name, p_type, size, purchase_price, selling_price, category, gst_category)); _invalidate_products(); return True, "Product added."
     except sqlite3.IntegrityError as e: return False, f"Error: {e}"
 def update_product(pid, name, p_type, size, purchase_price, selling_price, category, gst_category):
     query = "UPDATE products SET name=?, type=?, size=?, purchase_price=?, selling_price=?, category=?, gst_category=? WHERE id=?"
     try:
-        execute_query(query, (name, p_type, size, purchase_price, selling_price, category, gst_category, pid)); return True, "Product updated."
+        execute_query(query, (name, p_type, size, purchase_price, selling_price, category, gst_category, pid)); _invalidate_products(); return True, "Product updated."
     except sqlite3.IntegrityError as e: return False, f"Error: {e}"
+def _invalidate_products():
+    """After a product master edit: cached reports and the shared catalogue (stock changes it notices by itself)."""
+    import catalogue
+    _invalidate_reports('products')
+    catalogue.invalidate()
 def delete_entity(table_name, entity_id):
     query = f"DELETE FROM {table_name} WHERE id=?"
     try:
-        execute_query(query, (entity_id,)); return True, f"Record deleted."
+        execute_query(query, (entity_id,)); _invalidate_products() if table_name == 'products' else _invalidate_reports(table_name); return True, f"Record deleted."
     except sqlite3.IntegrityError as e: return False, f"Cannot delete. Record is in use."
     except Exception as e: return False, f"Error: {e}"
-def get_products(): return pd.read_sql_query("SELECT id, name, type, size, purchase_price, selling_price, category, gst_category, stock FROM products", get_connection(), index_col='id')
-def update_product_stock(product_id, quantity_change): execute_query("UPDATE products SET stock = stock + ? WHERE id = ?", (quantity_change, product_id))
+def reload_master_data():
+    """Drops the shared products, customers, vendors, taxes and store details so the next read gets edits made by other processes."""
+    _invalidate_products()
+    _invalidate_reports('customers', 'vendors', 'tax_config', 'store_info')
+def get_products():
+    """The product table (index id) as a private copy of the shared catalogue (see catalogue.py)."""
+    import catalogue
+    return catalogue.get_catalogue().frame.copy()
+def get_product_ids_by_code(codes):
+    """
+    {code: product_id} for pasted codes. A code is looked up in barcode1-3 first and otherwise taken
+    as a product id; codes matching neither are left out. One scan of products however many codes.
+    """
+    codes = sorted({str(code).strip() for code in codes} - {''})
+    if not codes:
+        return {}
+    query = ("SELECT id, barcode1, barcode2, barcode3 FROM products WHERE barcode1 IN (SELECT value FROM json_each(?1)) "
+             "OR barcode2 IN (SELECT value FROM json_each(?1)) OR barcode3 IN (SELECT value FROM json_each(?1)) "
+             "OR CAST(id AS TEXT) IN (SELECT value FROM json_each(?1))")
+    wanted = set(codes)
+    by_barcode, by_id = {}, {}
+    with get_connection_pool().connection() as conn:
+        for pid, *barcodes in conn.execute(query, (json.dumps(codes),)):
+            by_barcode.update((barcode, pid) for barcode in barcodes if barcode in wanted)
+            by_id[str(pid)] = pid
+    return {code: by_barcode.get(code, by_id.get(code)) for code in codes if code in by_barcode or code in by_id}
+def _adjust_stock(cursor, product_id, quantity_change):
+    cursor.execute("UPDATE products SET stock = stock + ? WHERE id = ?", (quantity_change, product_id))
+def update_product_stock(product_id, quantity_change):
+    _run_write(_adjust_stock, int(product_id), int(quantity_change))
+    _invalidate_reports('products')
+
+# --- Stock holds for open carts ---
+def _purge_expired_holds(now):
+    for key in [key for key, (_, expires_at) in _stock_holds.items() if expires_at <= now]:
+        del _stock_holds[key]
+
+def held_by_others(session_key):
+    """{product_id: quantity} currently held by other sessions' carts."""
+    with _stock_holds_lock:
+        _purge_expired_holds(time.time())
+        held = {}
+        for (owner, product_id), (quantity, _) in _stock_holds.items():
+            if owner != session_key:
+                held[product_id] = held.get(product_id, 0) + quantity
+        return held
+
+def hold_stock(session_key, product_id, quantity, stock):
+    """
+    Sets this session's hold on a product to `quantity` (0 releases it) and refreshes the expiry of all
+    its holds. `stock` is the caller's current figure; returns False if other holds leave too little.
+    """
+    return not hold_stock_many(session_key, {product_id: quantity}, {product_id: stock})
+
+def hold_stock_many(session_key, quantities, stock):
+    """
+    hold_stock for many products under one lock: quantities and stock are {product_id: figure}.
+    Returns the product_ids whose hold was refused; the others are set.
+    """
+    now = time.time()
+    with _stock_holds_lock:
+        _purge_expired_holds(now)
+        others = {}
+        for (owner, pid), (qty, _) in _stock_holds.items():
+            if owner != session_key and pid in quantities:
+                others[pid] = others.get(pid, 0) + qty
+        refused = []
+        for product_id, quantity in quantities.items():
+            if quantity > 0 and others.get(product_id, 0) + quantity > stock[product_id]:
+                refused.append(product_id)
+            elif quantity > 0:
+                _stock_holds[(session_key, product_id)] = [quantity, now + STOCK_HOLD_TTL]
+            else:
+                _stock_holds.pop((session_key, product_id), None)
+        for (owner, _), hold in _stock_holds.items():
+            if owner == session_key:
+                hold[1] = now + STOCK_HOLD_TTL
+        return refused
+
+def release_holds(session_key):
+    with _stock_holds_lock:
+        for key in [key for key in _stock_holds if key[0] == session_key]:
+            del _stock_holds[key]
 def add_customer(name, address, area, city, state, pincode, mobile, email):
     query = "INSERT INTO customers (name, address, area, city, state, pincode, mobile, email) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
     try:
-        execute_query(query, (name, address, area, city, state, pincode, mobile, email)); return True, "Customer added."
+        execute_query(query, (name, address, area, city, state, pincode, mobile, email)); _invalidate_reports('customers'); return True, "Customer added."
     except sqlite3.IntegrityError: return False, "Error: Mobile number exists."
 def update_customer(cid, name, address, area, city, state, pincode, mobile, email):
     query = "UPDATE customers SET name=?, address=?, area=?, city=?, state=?, pincode=?, mobile=?, email=? WHERE id=?"
     try:
-        execute_query(query, (name, address, area, city, state, pincode, mobile, email, cid)); return True, "Customer updated."
+        execute_query(query, (name, address, area, city, state, pincode, mobile, email, cid)); _invalidate_reports('customers'); return True, "Customer updated."
     except sqlite3.IntegrityError: return False, "Error: Mobile number may already exist."
 
-def get_customers(): return pd.read_sql_query("SELECT * FROM customers", get_connection(), index_col='id')
+@_cached_report('customers', ttl=MASTER_DATA_TTL)
+def get_customers(): return _read_query("SELECT * FROM customers", index_col='id')
+
+CUSTOMER_SEARCH_LIMIT = 10
+
+def search_customers(prefix, limit=CUSTOMER_SEARCH_LIMIT):
+    """
+    Customers whose mobile or name (case-insensitive) starts with prefix. Both halves are range scans on
+    an index, so the lookup stays fast however many customers there are.
+    """
+    prefix = prefix.strip()
+    if not prefix:
+        return pd.DataFrame(columns=['name', 'mobile'], index=pd.Index([], name='id'))
+    upper = prefix + '\U0010ffff'  # sorts after every string that starts with prefix
+    query = ("SELECT id, name, mobile FROM customers WHERE mobile >= ? AND mobile < ? "
+             "UNION SELECT id, name, mobile FROM customers WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE "
+             "ORDER BY name LIMIT ?")
+    return _read_query(query, (prefix, upper, prefix, upper, limit), index_col='id')
+
+def get_customer_id_by_mobile(mobile):
+    row = _read_one("SELECT id FROM customers WHERE mobile = ?", (mobile.strip(),))
+    return row[0] if row else None
+
+@_cached_report('customers', 'customer_stats')
+def get_customer_stats():
+    """Lifetime spend, visit count and first/last visit per customer, biggest spenders first."""
+    query = "SELECT c.id as \"Customer ID\", c.name as \"Customer Name\", c.mobile as \"Mobile\", s.bill_count as \"Visits\", s.lifetime_spend as \"Lifetime Spend\", s.first_visit as \"First Visit\", s.last_visit as \"Last Visit\" FROM customer_stats s JOIN customers c ON c.id = s.customer_id ORDER BY s.lifetime_spend DESC"
+    with closing(get_connection()) as conn:
+        return pd.read_sql_query(query, conn)
+
+def get_customer_history(customer_id, limit=None):
+    """One customer's bills, newest first, read through idx_bills_customer."""
+    query = "SELECT id as \"Bill No\", bill_date as \"Bill Date\", customer_name as \"Customer Name\", pay_mode as \"Pay Mode\", grand_total + IFNULL((SELECT SUM(amount) FROM bill_adjustments a WHERE a.bill_id = bills.id), 0) as \"Bill Total\" FROM bills WHERE customer_id = ? ORDER BY bill_date DESC, id DESC"
+    params = (customer_id,)
+    if limit:
+        query += " LIMIT ?"
+        params += (limit,)
+    with closing(get_connection()) as conn:
+        return pd.read_sql_query(query, conn, params=params)
 def add_vendor(name, address, area, city, state, pincode, mobile, email, gst_number):
     query = "INSERT INTO vendors (name, address, area, city, state, pincode, mobile, email, gst_number) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
     try:
-        execute_query(query, (name, address, area, city, state, pincode, mobile, email, gst_number)); return True, "Vendor added."
+        execute_query(query, (name, address, area, city, state, pincode, mobile, email, gst_number)); _invalidate_reports('vendors'); return True, "Vendor added."
     except sqlite3.IntegrityError: return False, "Error: Name or GST# exists."
 # Add to db_functions.py
 def update_vendor(vid, name, address, area, city, state, pincode, mobile, email, gst_number):
     query = "UPDATE vendors SET name=?, address=?, area=?, city=?, state=?, pincode=?, mobile=?, email=?, gst_number=? WHERE id=?"
     try:
         execute_query(query, (name, address, area, city, state, pincode, mobile, email, gst_number, vid))
+        _invalidate_reports('vendors')
         return True, "Vendor updated."
     except sqlite3.IntegrityError:
         return False, "Error: Name or GST# exists."
-def get_vendors(): return pd.read_sql_query("SELECT * FROM vendors", get_connection(), index_col='id')
+@_cached_report('vendors', ttl=MASTER_DATA_TTL)
+def get_vendors(): return _read_query("SELECT * FROM vendors", index_col='id')
 def add_tax(name, value, tax_type):
     query = "INSERT INTO tax_config (tax_name, tax_value, tax_type) VALUES (?, ?, ?)"
     try:
-        execute_query(query, (name, value, tax_type)); return True, "Tax added."
+        execute_query(query, (name, value, tax_type)); _invalidate_reports('tax_config'); return True, "Tax added."
     except sqlite3.IntegrityError: return False, "Error: Tax name exists."
 # Add to db_functions.py
 def update_tax(tid, tax_name, tax_value, tax_type):
     query = "UPDATE tax_config SET tax_name=?, tax_value=?, tax_type=? WHERE id=?"
     try:
         execute_query(query, (tax_name, tax_value, tax_type, tid))
+        _invalidate_reports('tax_config')
         return True, "Tax configuration updated."
     except sqlite3.IntegrityError:
         return False, "Error: Tax name already exists."
-def get_taxes(): return pd.read_sql_query("SELECT * FROM tax_config", get_connection(), index_col='id')
+@_cached_report('tax_config', ttl=MASTER_DATA_TTL)
+def get_taxes(): return _read_query("SELECT * FROM tax_config", index_col='id')
+@_cached_report('tax_config', ttl=MASTER_DATA_TTL)
 def get_tcs_value():
     """Fetches the TCS percentage from the tax config table."""
-    query = "SELECT tax_value FROM tax_config WHERE tax_name = 'TCS'"
-    result = execute_query(query, fetch='one')
+    with get_connection_pool().connection() as conn:
+        result = conn.execute("SELECT tax_value FROM tax_config WHERE tax_name = 'TCS'").fetchone()
     return result[0] if result else 1.0
 
 # --- Purchase Order Functions (MODIFIED) ---
-def create_purchase_order(vendor_id, po_date, inv_num, remarks, items_df, totals):
-    po_query = "INSERT INTO purchase_orders (vendor_id, purchase_date, invoice_number, remarks, total_amount, total_gst, total_tcs, grand_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
-    po_id = execute_query(po_query, (vendor_id, po_date, inv_num, remarks, totals['total_amount'], totals['total_gst'], totals['total_tcs'], totals['grand_total']))
-    
+def price_purchase_items(items_df, tcs_rate):
+    """Adds amount and gst_amount to PO lines (rate excludes GST) and returns (items_df, totals)."""
+    items_df = items_df.copy()
+    items_df['amount'] = items_df['quantity'] * items_df['rate']
+    items_df['gst_amount'] = items_df['amount'] * items_df['gst_percent'] / 100
+    total_amount, total_gst = items_df['amount'].sum(), items_df['gst_amount'].sum()
+    total_tcs = (total_amount + total_gst) * (tcs_rate / 100)
+    totals = {'total_amount': total_amount, 'total_gst': total_gst, 'total_tcs': total_tcs, 'grand_total': total_amount + total_gst + total_tcs}
+    return items_df, totals
+
+def po_lines(po_items, products_df, taxes_df):
+    """
+    PO lines with purchase rate, selling price, stock and GST % from one join with the lines' products
+    and the tax table, so the cost follows the number of lines, not of products. Lines that carry a rate
+    (loaded from a saved PO, or drafted from the last purchase) keep it, others take the product's
+    purchase price.
+    """
+    lines = pd.DataFrame(po_items).reindex(columns=['product_id', 'quantity', 'rate', 'po_item_id'])
+    lines['product_id'] = lines['product_id'].astype('Int64')
+    gst_percents = taxes_df.drop_duplicates('tax_name').set_index('tax_name')['tax_value'].rename('gst_percent')
+    product_ids = lines['product_id'].dropna().unique().astype('int64')
+    details = products_df.reindex(product_ids)[['purchase_price', 'selling_price', 'stock', 'gst_category']].join(gst_percents, on='gst_category')
+    lines = lines.join(details, on='product_id')
+    lines['gst_percent'] = lines['gst_percent'].fillna(0)
+    lines['rate'] = lines['rate'].fillna(lines['purchase_price'])
+    lines['quantity'] = lines['quantity'].fillna(1).astype(int)
+    return lines
+
+PO_ITEM_COLUMNS = ['product_id', 'quantity', 'rate', 'gst_percent', 'gst_amount', 'amount']
+
+def _insert_po_items(cursor, po_id, items_df):
     item_query = "INSERT INTO purchase_order_items (purchase_order_id, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, ?, ?, ?, ?, ?, ?)"
-    for _, row in items_df.iterrows():
-        execute_query(item_query, (po_id, row['product_id'], row['quantity'], row['rate'], row['gst_percent'], row['gst_amount'], row['amount']))
-        update_product_stock(row['product_id'], row['quantity'])
+    cursor.executemany(item_query, [[po_id] + row for row in _param_rows(items_df, PO_ITEM_COLUMNS)])
+
+def _insert_purchase_order(cursor, vendor_id, po_date, inv_num, remarks, items_df, totals):
+    po_query = "INSERT INTO purchase_orders (vendor_id, purchase_date, invoice_number, remarks, total_amount, total_gst, total_tcs, grand_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    cursor.execute(po_query, (vendor_id, po_date, inv_num, remarks, totals['total_amount'], totals['total_gst'], totals['total_tcs'], totals['grand_total']))
+    po_id = cursor.lastrowid
+    _insert_po_items(cursor, po_id, items_df)
+    cursor.executemany("UPDATE products SET stock = stock + ? WHERE id = ?", _stock_deltas(items_df, 1))
+    return po_id
+
+def create_purchase_order(vendor_id, po_date, inv_num, remarks, items_df, totals):
+    po_id = _run_write(_insert_purchase_order, vendor_id, po_date, inv_num, remarks, items_df, totals)
+    _invalidate_reports('purchase_orders', 'purchase_order_items', 'products')
     return True, f"Purchase Order {po_id} created successfully!"
 
 def get_purchase_orders_summary(invoice_search=""):
@@ -103,11 +670,11 @@ def get_purchase_orders_summary(invoice_search=""):
         base_query += " WHERE po.invoice_number LIKE ?"
         params.append(f"%{invoice_search}%")
     base_query += " ORDER BY po.id DESC"
-    return pd.read_sql_query(base_query, get_connection(), params=params)
+    return _read_query(base_query, params)
 
 def get_purchase_order_details(po_id):
     po_query = "SELECT * FROM purchase_orders WHERE id = ?"
-    po_data = execute_query(po_query, (po_id,), fetch='one')
+    po_data = _read_one(po_query, (po_id,))
 
     # FIX: Join with tax_config to fetch the actual gst_percent value
     items_query = """
@@ -120,72 +687,234 @@ def get_purchase_order_details(po_id):
     LEFT JOIN tax_config tc ON p.gst_category = tc.tax_name
     WHERE poi.purchase_order_id = ?
     """
-    items_df = pd.read_sql_query(items_query, get_connection(), params=(po_id,))
+    items_df = _read_query(items_query, (po_id,))
     # Ensure gst_percent is not null if a tax category is deleted
     items_df['gst_percent'] = items_df['gst_percent'].fillna(0)
     return po_data, items_df
 
-def update_purchase_order(po_id, vendor_id, po_date, inv_num, remarks, items_df, totals):
+def _rewrite_purchase_order(cursor, po_id, vendor_id, po_date, inv_num, remarks, items_df, totals):
     po_update_query = "UPDATE purchase_orders SET vendor_id=?, purchase_date=?, invoice_number=?, remarks=?, total_amount=?, total_gst=?, total_tcs=?, grand_total=? WHERE id=?"
-    execute_query(po_update_query, (vendor_id, po_date, inv_num, remarks, totals['total_amount'], totals['total_gst'], totals['total_tcs'], totals['grand_total'], po_id))
+    cursor.execute(po_update_query, (vendor_id, po_date, inv_num, remarks, totals['total_amount'], totals['total_gst'], totals['total_tcs'], totals['grand_total'], po_id))
 
-    execute_query("DELETE FROM purchase_order_items WHERE purchase_order_id=?", (po_id,))
-    
-    item_insert_query = "INSERT INTO purchase_order_items (purchase_order_id, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, ?, ?, ?, ?, ?, ?)"
-    for _, row in items_df.iterrows():
-        execute_query(item_insert_query, (po_id, row['product_id'], row['quantity'], row['rate'], row['gst_percent'], row['gst_amount'], row['amount']))
+    # Take the old lines out of stock and put the new ones in, in the same transaction
+    cursor.execute("UPDATE products SET stock = stock - (SELECT SUM(quantity) FROM purchase_order_items WHERE purchase_order_id = ? AND product_id = products.id) WHERE id IN (SELECT product_id FROM purchase_order_items WHERE purchase_order_id = ?)", (po_id, po_id))
+    cursor.execute("DELETE FROM purchase_order_items WHERE purchase_order_id=?", (po_id,))
+    _insert_po_items(cursor, po_id, items_df)
+    cursor.executemany("UPDATE products SET stock = stock + ? WHERE id = ?", _stock_deltas(items_df, 1))
+
+def update_purchase_order(po_id, vendor_id, po_date, inv_num, remarks, items_df, totals):
+    """Replaces the PO header and lines; product stock is adjusted by the difference."""
+    _run_write(_rewrite_purchase_order, po_id, vendor_id, po_date, inv_num, remarks, items_df, totals)
+    _invalidate_reports('purchase_orders', 'purchase_order_items', 'products')
     
     return True, f"Purchase Order {po_id} updated successfully."
 
 # --- Billing & Reporting Functions (No Changes) ---
-def create_bill(bill_date, customer_name, pay_mode, remarks, items_df, totals):
-    bill_query = "INSERT INTO bills (bill_date, customer_name, pay_mode, remarks, sub_total, total_gst, grand_total) VALUES (?, ?, ?, ?, ?, ?, ?)"
-    bill_id = execute_query(bill_query, (bill_date, customer_name, pay_mode, remarks, totals['sub_total'], totals['total_gst'], totals['grand_total']))
+def price_bill_items(items_df):
+    """Adds base_price, sub_total_line, amount and gst_amount to bill lines (rate includes GST) and returns (items_df, totals)."""
+    items_df = items_df.copy()
+    items_df['base_price'] = items_df['rate'] / (1 + items_df['gst_percent'] / 100)
+    items_df['sub_total_line'] = items_df['base_price'] * items_df['quantity']
+    items_df['amount'] = items_df['rate'] * items_df['quantity']
+    items_df['gst_amount'] = items_df['amount'] - items_df['sub_total_line']
+    totals = {'sub_total': items_df['sub_total_line'].sum(), 'total_gst': items_df['gst_amount'].sum(), 'grand_total': items_df['amount'].sum()}
+    return items_df, totals
+
+BILL_ITEM_COLUMNS = ['product_id', 'quantity', 'rate', 'gst_percent', 'gst_amount', 'amount']
+
+def _take_stock(cursor, items_df):
+    """
+    Decrements stock for all lines, each only if enough is left. If any line is short nothing is
+    taken and InsufficientStockError is raised, so the caller's transaction rolls back.
+    """
+    deltas = [(-qty, pid, -qty) for qty, pid in _stock_deltas(items_df, -1)]
+    cursor.execute("SAVEPOINT take_stock")
+    cursor.executemany("UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?", deltas)
+    if cursor.rowcount < len(deltas):
+        cursor.execute("ROLLBACK TO take_stock")
+        cursor.execute("RELEASE take_stock")
+        raise InsufficientStockError(_short_products(cursor, items_df))
+    cursor.execute("RELEASE take_stock")
+
+def _short_products(cursor, items_df):
+    """Sorted ids of the products the lines need more of than is in stock."""
+    wanted = {pid: -qty for qty, pid in _stock_deltas(items_df, -1)}
+    placeholders = ', '.join('?' * len(wanted))
+    stock = dict(cursor.execute(f"SELECT id, stock FROM products WHERE id IN ({placeholders})", list(wanted)).fetchall())
+    return sorted(pid for pid, qty in wanted.items() if stock.get(pid, 0) < qty)
+
+def _insert_bill_items(cursor, bill_id, items_df, enforce_stock=True):
     item_query = "INSERT INTO bill_items (bill_id, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, ?, ?, ?, ?, ?, ?)"
-    for _, row in items_df.iterrows():
-        execute_query(item_query, (bill_id, row['product_id'], row['quantity'], row['rate'], row['gst_percent'], row['gst_amount'], row['amount']))
-        update_product_stock(row['product_id'], -row['quantity'])
+    cursor.executemany(item_query, [[bill_id] + row for row in _param_rows(items_df, BILL_ITEM_COLUMNS)])
+    if enforce_stock:
+        _take_stock(cursor, items_df)
+    else:
+        cursor.executemany("UPDATE products SET stock = stock + ? WHERE id = ?", _stock_deltas(items_df, -1))
+
+def _resolve_customer(cursor, customer_id, customer_name):
+    """customer_id as given, else the one customer with this name (or mobile); None for cash/unknown customers."""
+    if customer_id is not None or not customer_name or customer_name == "Cash Customer":
+        return customer_id
+    row = cursor.execute("SELECT COALESCE((SELECT id FROM customers WHERE mobile = ?), (SELECT MIN(id) FROM customers WHERE name = ? HAVING COUNT(*) = 1))",
+                         (customer_name, customer_name)).fetchone()
+    return row[0]
+
+def _add_customer_visit(cursor, customer_id, bill_date, amount):
+    if customer_id is None:
+        return
+    cursor.execute("""
+        INSERT INTO customer_stats (customer_id, bill_count, lifetime_spend, first_visit, last_visit) VALUES (?, 1, ?, ?, ?)
+        ON CONFLICT(customer_id) DO UPDATE SET bill_count = bill_count + 1, lifetime_spend = lifetime_spend + excluded.lifetime_spend,
+            first_visit = MIN(first_visit, excluded.first_visit), last_visit = MAX(last_visit, excluded.last_visit)
+    """, (customer_id, amount, bill_date, bill_date))
+
+# The customer's bills that still count as visits
+VISIT_BILLS = "SELECT bill_date FROM bills WHERE customer_id = ? AND id NOT IN (SELECT bill_id FROM bill_adjustments WHERE kind = 'void')"
+
+def _remove_customer_visit(cursor, customer_id, bill_date, amount):
+    """
+    Called after the bill row is gone, moved or voided; first/last visit are only re-read when this bill
+    was one of them, and are cleared with the customer's last visit.
+    """
+    if customer_id is None:
+        return
+    cursor.execute(f"""
+        UPDATE customer_stats SET bill_count = bill_count - 1, lifetime_spend = lifetime_spend - ?,
+            first_visit = CASE WHEN bill_count <= 1 THEN NULL WHEN first_visit = ? THEN COALESCE((SELECT MIN(bill_date) FROM ({VISIT_BILLS})), first_visit) ELSE first_visit END,
+            last_visit = CASE WHEN bill_count <= 1 THEN NULL WHEN last_visit = ? THEN COALESCE((SELECT MAX(bill_date) FROM ({VISIT_BILLS})), last_visit) ELSE last_visit END
+        WHERE customer_id = ?
+    """, (amount, bill_date, customer_id, bill_date, customer_id, customer_id))
+
+def _bill_visit(cursor, bill_id):
+    """(customer_id, bill_date, net total after adjustments) of a bill, or None."""
+    return cursor.execute("SELECT customer_id, bill_date, grand_total + IFNULL((SELECT SUM(amount) FROM bill_adjustments WHERE bill_id = bills.id), 0) FROM bills WHERE id = ?",
+                          (bill_id,)).fetchone()
+
+def _adjust_customer_spend(cursor, customer_id, amount):
+    if customer_id is not None:
+        cursor.execute("UPDATE customer_stats SET lifetime_spend = lifetime_spend + ? WHERE customer_id = ?", (amount, customer_id))
+
+def _insert_bill(cursor, bill_date, customer_name, pay_mode, remarks, items_df, totals, bill_uuid=None, enforce_stock=True, customer_id=None):
+    customer_id = _resolve_customer(cursor, customer_id, customer_name)
+    bill_query = "INSERT INTO bills (bill_uuid, customer_id, bill_date, customer_name, pay_mode, remarks, sub_total, total_gst, grand_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(bill_uuid) DO NOTHING"
+    cursor.execute(bill_query, (bill_uuid, customer_id, bill_date, customer_name, pay_mode, remarks, totals['sub_total'], totals['total_gst'], totals['grand_total']))
+    if cursor.rowcount == 0:  # this bill_uuid was already inserted
+        return cursor.execute("SELECT id FROM bills WHERE bill_uuid = ?", (bill_uuid,)).fetchone()[0]
+    bill_id = cursor.lastrowid
+    _insert_bill_items(cursor, bill_id, items_df, enforce_stock)
+    _add_customer_visit(cursor, customer_id, bill_date, totals['grand_total'])
+    return bill_id
+
+def _insert_journaled_bills(cursor, entries):
+    for entry in entries:
+        items_df = pd.DataFrame(entry['items'], columns=BILL_ITEM_COLUMNS)
+        bill_date, remarks = entry['bill_date'], entry['remarks']
+        if cursor.execute("SELECT 1 FROM day_close WHERE close_date = ?", (bill_date,)).fetchone():
+            # Its day was closed before the bill synced: book it on today's open day instead
+            bill_date, remarks = date.today().isoformat(), f"{remarks} (offline bill of {bill_date})".strip()
+        # The sale already happened at the counter, so it is inserted even if stock goes negative;
+        # the shortfall is re-checked here and noted on the bill for the next stock count
+        short = _short_products(cursor, items_df)
+        if short:
+            remarks = f"{remarks} (sold offline beyond stock: product ID(s) {', '.join(map(str, short))})".strip()
+        _insert_bill(cursor, bill_date, entry['customer_name'], entry['pay_mode'], remarks,
+                     items_df, entry['totals'], entry['bill_uuid'], False, entry.get('customer_id'))
+
+# Selling fires no audit triggers (see database.AUDITED_TABLES), so these skip publishing the audit
+# session and the billing hot path pays nothing for auditing
+UNAUDITED_WRITES = {_adjust_stock, _insert_bill, _insert_journaled_bills}
+
+def apply_journaled_bills(entries):
+    """
+    Inserts bills from the offline journal, each as its own command (and savepoint), so a bill the
+    database refuses does not hold back the others; bills already present are skipped. Returns one
+    item per entry: None once the bill is in the database, otherwise the exception that refused it.
+    """
+    errors = []
+    if USE_WRITE_QUEUE:
+        import writer
+        queue, user = writer.get_write_queue(), database.get_audit_user()
+        futures = [queue.submit(_as_audit_user, user, _insert_journaled_bills, [entry]) for entry in entries]
+        errors = [future.exception() for future in futures]  # all queued first, so they share commits
+    else:
+        for entry in entries:
+            try:
+                _run_write(_insert_journaled_bills, [entry])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+    if None in errors:
+        _invalidate_reports('bills', 'bill_items', 'products', 'customer_stats')
+    return errors
+
+def create_bill(bill_date, customer_name, pay_mode, remarks, items_df, totals, bill_uuid=None, customer_id=None):
+    bill_uuid = bill_uuid or uuid.uuid4().hex
+    try:
+        bill_id = _run_write(_insert_bill, bill_date, customer_name, pay_mode, remarks, items_df, totals, bill_uuid, True, customer_id)
+    except (InsufficientStockError, sqlite3.IntegrityError) as e:
+        return False, str(e)
+    except sqlite3.OperationalError as e:
+        import journal
+        if not journal.is_unavailable(e):
+            raise
+        # Database locked or unreachable: keep the sale in the local journal, journal.replay_pending() syncs it later
+        journal.record_bill(bill_uuid, bill_date, customer_name, pay_mode, remarks,
+                            _param_rows(items_df, BILL_ITEM_COLUMNS), {k: float(v) for k, v in totals.items()}, customer_id)
+        return True, (f"Database unavailable - bill saved offline (ref {bill_uuid[:8]}) and will sync automatically. "
+                      "Stock could not be checked: make sure the items are on the shelf.")
+    _invalidate_reports('bills', 'bill_items', 'products', 'customer_stats')
     return True, f"Bill {bill_id} created successfully!"
-def get_bill_report(start_date, end_date):
-    query = "SELECT b.id as 'Bill No', b.bill_date as 'Bill Date', p.name as 'Product Name', p.size as 'Size', bi.quantity as 'Quantity', bi.rate as 'Rate', bi.amount as 'Amount', b.customer_name as 'Customer Name', b.grand_total as 'Bill Total' FROM bills b JOIN bill_items bi ON b.id = bi.bill_id JOIN products p ON bi.product_id = p.id WHERE b.bill_date BETWEEN ? AND ?"
-    return pd.read_sql_query(query, get_connection(), params=(start_date, end_date))
+@_cached_report('bills', 'bill_items', 'bill_adjustments', 'products')
+def get_bill_report(start_date, end_date, fresh=False):
+    """Bill lines in the period; returns and edits appear as signed lines on their own date, Bill Total is net."""
+    query = "SELECT l.bill_id as \"Bill No\", l.line_date as \"Bill Date\", p.name as \"Product Name\", p.size as \"Size\", l.quantity as \"Quantity\", l.rate as \"Rate\", l.amount as \"Amount\", b.customer_name as \"Customer Name\", b.grand_total + COALESCE(adj.amount, 0) as \"Bill Total\" FROM bill_lines_all l LEFT JOIN bills_all b ON b.id = l.bill_id JOIN products p ON l.product_id = p.id LEFT JOIN (SELECT bill_id, SUM(amount) AS amount FROM bill_adjustments_all GROUP BY bill_id) adj ON adj.bill_id = l.bill_id WHERE l.line_date BETWEEN ? AND ? ORDER BY l.bill_id, l.line_date, l.line_kind, l.line_id"
+    with _report_reader(start_date, end_date, 'bills', fresh=fresh) as conn:
+        return _read_sql(conn, query, params=(start_date, end_date))
+@_cached_report('purchase_orders', 'purchase_order_items', 'products', 'vendors')
 def get_purchase_report(start_date, end_date, vendor_id=None):
-    base_query = "SELECT po.id as 'PO No', po.purchase_date as 'Purchase Date', v.name as 'Vendor', p.name as 'Product Name', poi.quantity as 'Quantity', poi.rate as 'Rate', poi.amount as 'Total Amount', po.grand_total as 'PO Grand Total' FROM purchase_orders po JOIN vendors v ON po.vendor_id = v.id JOIN purchase_order_items poi ON po.id = poi.purchase_order_id JOIN products p ON poi.product_id = p.id WHERE po.purchase_date BETWEEN ? AND ?"
+    base_query = "SELECT po.id as \"PO No\", po.purchase_date as \"Purchase Date\", v.name as \"Vendor\", p.name as \"Product Name\", poi.quantity as \"Quantity\", poi.rate as \"Rate\", poi.amount as \"Total Amount\", po.grand_total as \"PO Grand Total\" FROM purchase_orders_all po JOIN vendors v ON po.vendor_id = v.id JOIN purchase_order_items_all poi ON po.id = poi.purchase_order_id JOIN products p ON poi.product_id = p.id WHERE po.purchase_date BETWEEN ? AND ?"
     params = (start_date, end_date)
     if vendor_id and vendor_id != 'All':
         base_query += " AND po.vendor_id = ?"; params += (vendor_id,)
-    return pd.read_sql_query(base_query, get_connection(), params=params)
-def get_stock_report(): return pd.read_sql_query("SELECT p.id as 'Product ID', p.name as 'Product Name', p.type as 'Type', p.size as 'Size', p.selling_price as 'Selling Price', p.stock as 'Available Stock' FROM products p ORDER BY p.name", get_connection())
+    base_query += " ORDER BY po.purchase_date, po.id, poi.id"
+    with _report_reader(start_date, end_date, 'purchase_orders') as conn:
+        return _read_sql(conn, base_query, params=params)
+@_cached_report('products')
+def get_stock_report(): return _read_query("SELECT p.id as 'Product ID', p.name as 'Product Name', p.type as 'Type', p.size as 'Size', p.selling_price as 'Selling Price', p.stock as 'Available Stock' FROM products p ORDER BY p.name")
 
-def get_stock_report_with_dates(start_date, end_date):
+@_cached_report('products', 'bills', 'bill_items', 'bill_adjustments', 'purchase_orders', 'purchase_order_items')
+def get_stock_report_with_dates(start_date, end_date, include_forecast=False):
     """
     Get stock report with opening and closing stock for the specified date range.
     Opening stock = Current stock + Sales during period - Purchases during period
     Closing stock = Current stock
+    include_forecast adds the expected sales for the coming week (see forecast.py).
     """
     # Get current stock for all products
-    current_stock_query = "SELECT p.id, p.name as 'Product Name', p.type as 'Type', p.size as 'Size', p.stock as 'Current Stock' FROM products p ORDER BY p.name"
-    current_stock_df = pd.read_sql_query(current_stock_query, get_connection())
+    current_stock_query = "SELECT p.id, p.name as \"Product Name\", p.type as \"Type\", p.size as \"Size\", p.stock as \"Current Stock\" FROM products p ORDER BY p.name, p.id"
     
     # Get sales during the period
     sales_query = """
-    SELECT bi.product_id, SUM(bi.quantity) as 'Sales Qty'
-    FROM bill_items bi 
-    JOIN bills b ON bi.bill_id = b.id 
-    WHERE b.bill_date BETWEEN ? AND ?
-    GROUP BY bi.product_id
+    SELECT product_id, CAST(SUM(quantity) AS BIGINT) as "Sales Qty"
+    FROM bill_lines_all
+    WHERE line_date BETWEEN ? AND ?
+    GROUP BY product_id
     """
-    sales_df = pd.read_sql_query(sales_query, get_connection(), params=(start_date, end_date))
     
     # Get purchases during the period
     purchases_query = """
-    SELECT poi.product_id, SUM(poi.quantity) as 'Purchase Qty'
-    FROM purchase_order_items poi 
-    JOIN purchase_orders po ON poi.purchase_order_id = po.id 
+    SELECT poi.product_id, CAST(SUM(poi.quantity) AS BIGINT) as "Purchase Qty"
+    FROM purchase_order_items_all poi 
+    JOIN purchase_orders_all po ON poi.purchase_order_id = po.id 
     WHERE po.purchase_date BETWEEN ? AND ?
     GROUP BY poi.product_id
     """
-    purchases_df = pd.read_sql_query(purchases_query, get_connection(), params=(start_date, end_date))
+    
+    # Read all three from one connection so they describe the same point in time
+    with _report_reader(start_date, end_date, 'bills', 'purchase_orders') as conn:
+        current_stock_df = _read_sql(conn, current_stock_query)
+        sales_df = _read_sql(conn, sales_query, params=(start_date, end_date))
+        purchases_df = _read_sql(conn, purchases_query, params=(start_date, end_date))
     
     # Merge all data
     result_df = current_stock_df.copy()
@@ -199,17 +928,28 @@ def get_stock_report_with_dates(start_date, end_date):
     # Select and rename columns for final output
     final_df = result_df[['Product Name', 'Type', 'Size', 'Opening Stock', 'Closing Stock', 'Sales Qty', 'Purchase Qty']].copy()
     final_df.columns = ['Product Name', 'Type', 'Size', 'Opening Stock', 'Closing Stock', 'Sales (Period)', 'Purchases (Period)']
+
+    if include_forecast:
+        import forecast
+        forecast_totals = forecast.get_forecast_totals()
+        final_df[f'Forecast Sales (Next {forecast.HORIZON_DAYS} Days)'] = result_df['id'].map(forecast_totals).fillna(0).round(1).values
     
     return final_df
+@_cached_report('bills', 'bill_items', 'bill_adjustments', 'products')
 def get_product_wise_sales(start_date, end_date):
-    query = "SELECT p.name as 'Product Name', p.size as 'Size', SUM(bi.quantity) as 'Total Quantity Sold', SUM(bi.amount) as 'Total Sales Value' FROM bill_items bi JOIN products p ON bi.product_id = p.id JOIN bills b ON bi.bill_id = b.id WHERE b.bill_date BETWEEN ? AND ? GROUP BY p.name, p.size ORDER BY \"Total Quantity Sold\" DESC"
-    return pd.read_sql_query(query, get_connection(), params=(start_date, end_date))
+    query = "SELECT p.name as \"Product Name\", p.size as \"Size\", CAST(SUM(l.quantity) AS BIGINT) as \"Total Quantity Sold\", SUM(l.amount) as \"Total Sales Value\" FROM bill_lines_all l JOIN products p ON l.product_id = p.id WHERE l.line_date BETWEEN ? AND ? GROUP BY p.name, p.size ORDER BY \"Total Quantity Sold\" DESC, p.name, p.size"
+    with _report_reader(start_date, end_date, 'bills') as conn:
+        return _read_sql(conn, query, params=(start_date, end_date))
+@_cached_report('purchase_orders', 'purchase_order_items', 'products')
 def get_product_wise_purchases(start_date, end_date):
-    query = "SELECT p.name as 'Product Name', p.size as 'Size', SUM(poi.quantity) as 'Total Quantity Purchased', SUM(poi.amount) as 'Total Purchase Value' FROM purchase_order_items poi JOIN products p ON poi.product_id = p.id JOIN purchase_orders po ON poi.purchase_order_id = po.id WHERE po.purchase_date BETWEEN ? AND ? GROUP BY p.name, p.size ORDER BY \"Total Quantity Purchased\" DESC"
-    return pd.read_sql_query(query, get_connection(), params=(start_date, end_date))
+    query = "SELECT p.name as \"Product Name\", p.size as \"Size\", CAST(SUM(poi.quantity) AS BIGINT) as \"Total Quantity Purchased\", SUM(poi.amount) as \"Total Purchase Value\" FROM purchase_order_items_all poi JOIN products p ON poi.product_id = p.id JOIN purchase_orders_all po ON poi.purchase_order_id = po.id WHERE po.purchase_date BETWEEN ? AND ? GROUP BY p.name, p.size ORDER BY \"Total Quantity Purchased\" DESC, p.name, p.size"
+    with _report_reader(start_date, end_date, 'purchase_orders') as conn:
+        return _read_sql(conn, query, params=(start_date, end_date))
+@_cached_report('bills', 'bill_items', 'bill_adjustments', 'products')
 def get_bulk_litre_report(start_date, end_date):
-    query = "SELECT p.id, p.name, p.size, bi.quantity FROM bills b JOIN bill_items bi ON b.id = bi.bill_id JOIN products p ON bi.product_id = p.id WHERE b.bill_date BETWEEN ? AND ?"
-    df = pd.read_sql_query(query, get_connection(), params=(start_date, end_date))
+    query = "SELECT p.id, p.name, p.size, l.quantity FROM bill_lines_all l JOIN products p ON l.product_id = p.id WHERE l.line_date BETWEEN ? AND ?"
+    with _report_reader(start_date, end_date, 'bills') as conn:
+        df = _read_sql(conn, query, params=(start_date, end_date))
     if df.empty: return pd.DataFrame(columns=['Product Name', 'Total Litres Sold'])
     def convert_to_litres(size_str):
         if not isinstance(size_str, str): return 0
@@ -221,7 +961,7 @@ def get_bulk_litre_report(start_date, end_date):
     df['total_litres'] = df['quantity'] * df['size_in_litres']
     report = df.groupby('name')['total_litres'].sum().reset_index()
     report.columns = ['Product Name', 'Total Litres Sold']
-    return report.sort_values(by='Total Litres Sold', ascending=False)
+    return report.sort_values(by=['Total Litres Sold', 'Product Name'], ascending=[False, True], ignore_index=True)
 
 def auto_generate_bills_for_month(start_date, end_date, product_id, total_quantity):
     """
@@ -230,9 +970,8 @@ def auto_generate_bills_for_month(start_date, end_date, product_id, total_quanti
     Strictly prevents over-billing: if total_quantity > available stock, returns an error.
     Returns a summary of generated bills.
     """
-    from datetime import timedelta, datetime
-    import pandas as pd
-    
+    import numpy as np  # only needed here; keeps numpy's import off the startup path
+
     # Get product details
     products_df = get_products()
     if product_id not in products_df.index:
@@ -255,7 +994,6 @@ def auto_generate_bills_for_month(start_date, end_date, product_id, total_quanti
         return False, "Invalid date range."
     
     # Randomly distribute total_quantity across days
-    import numpy as np
     if total_quantity < days:
         # Not enough quantity for each day, assign 1 to total_quantity days
         daily_quantities = [1]*total_quantity + [0]*(days-total_quantity)
@@ -280,14 +1018,7 @@ def auto_generate_bills_for_month(start_date, end_date, product_id, total_quanti
             'gst_category': product['gst_category']
         }])
         # Calculate totals as in render_billing
-        items_df['base_price'] = items_df['rate'] / (1 + items_df['gst_percent'] / 100)
-        items_df['sub_total_line'] = items_df['base_price'] * items_df['quantity']
-        items_df['amount'] = items_df['rate'] * items_df['quantity']
-        items_df['gst_amount'] = items_df['amount'] - items_df['sub_total_line']
-        sub_total = items_df['sub_total_line'].sum()
-        total_gst = items_df['gst_amount'].sum()
-        grand_total = items_df['amount'].sum()
-        totals = {'sub_total': sub_total, 'total_gst': total_gst, 'grand_total': grand_total}
+        items_df, totals = price_bill_items(items_df)
         # Create bill
         success, message = create_bill(bill_date, 'Cash Customer', 'Cash', 'auto-generated', items_df, totals)
         summary.append({'date': bill_date, 'quantity': qty, 'success': success, 'message': message})
@@ -296,41 +1027,251 @@ def auto_generate_bills_for_month(start_date, end_date, product_id, total_quanti
 def get_bill_by_id(bill_id):
     """Fetch a single bill and its items by bill_id."""
     bill_query = "SELECT * FROM bills WHERE id = ?"
-    bill = execute_query(bill_query, (bill_id,), fetch='one')
+    bill = _read_one(bill_query, (bill_id,))
     items_query = "SELECT * FROM bill_items WHERE bill_id = ?"
-    items = pd.read_sql_query(items_query, get_connection(), params=(bill_id,))
+    items = _read_query(items_query, (bill_id,))
     return bill, items
 
-def update_bill(bill_id, bill_date, customer_name, pay_mode, remarks, items_df, totals):
-    """Update a bill and its items. Stock is adjusted accordingly."""
-    # Get original items to revert stock
-    _, original_items = get_bill_by_id(bill_id)
-    for _, row in original_items.iterrows():
-        update_product_stock(row['product_id'], row['quantity'])  # revert stock
-    # Update bill
-    bill_update_query = "UPDATE bills SET bill_date=?, customer_name=?, pay_mode=?, remarks=?, sub_total=?, total_gst=?, grand_total=? WHERE id=?"
-    execute_query(bill_update_query, (bill_date, customer_name, pay_mode, remarks, totals['sub_total'], totals['total_gst'], totals['grand_total'], bill_id))
-    # Delete old items
-    execute_query("DELETE FROM bill_items WHERE bill_id=?", (bill_id,))
-    # Insert new items and update stock
-    item_query = "INSERT INTO bill_items (bill_id, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, ?, ?, ?, ?, ?, ?)"
-    for _, row in items_df.iterrows():
-        execute_query(item_query, (bill_id, row['product_id'], row['quantity'], row['rate'], row['gst_percent'], row['gst_amount'], row['amount']))
-        update_product_stock(row['product_id'], -row['quantity'])
+# --- Returns, voids and edits ---
+# Bills are never rewritten after they are issued. Changes are signed lines in bill_adjustments
+# (negative quantity = goods back in stock), each change applied as one grouped delta.
+ADJUSTMENT_COLUMNS = ['product_id', 'quantity', 'rate', 'gst_percent', 'gst_amount', 'amount']
+
+def get_bill_adjustments(bill_id):
+    query = "SELECT adjustment_date, kind, reason, product_id, quantity, rate, gst_percent, gst_amount, amount FROM bill_adjustments WHERE bill_id = ? ORDER BY id"
+    with closing(get_connection()) as conn:
+        return pd.read_sql_query(query, conn, params=(bill_id,))
+
+def _net_bill_lines(cursor, bill_id):
+    """Quantity, amount and GST per product of a bill after all its adjustments."""
+    rows = cursor.execute("""
+        SELECT product_id, SUM(quantity), SUM(amount), SUM(gst_amount), MAX(rate), MAX(gst_percent) FROM (
+            SELECT product_id, quantity, amount, gst_amount, rate, gst_percent FROM bill_items WHERE bill_id = ?
+            UNION ALL
+            SELECT product_id, quantity, amount, gst_amount, rate, gst_percent FROM bill_adjustments WHERE bill_id = ?)
+        GROUP BY product_id""", (bill_id, bill_id)).fetchall()
+    return pd.DataFrame(rows, columns=['product_id', 'quantity', 'amount', 'gst_amount', 'rate', 'gst_percent']).set_index('product_id')
+
+def _record_adjustment(cursor, bill_id, kind, lines_df, adjustment_date, reason):
+    """
+    Inserts signed adjustment lines and moves stock by their grouped quantities: extra sales are taken
+    like a new bill (InsufficientStockError if short), returns go back on the shelf. Returns the amount.
+    """
+    lines_df = lines_df[(lines_df['quantity'] != 0) | (lines_df['amount'].abs() > 0.005)]
+    if lines_df.empty:
+        return 0.0
+    cursor.executemany(
+        "INSERT INTO bill_adjustments (bill_id, adjustment_date, kind, reason, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [[bill_id, adjustment_date, kind, reason] + row for row in _param_rows(lines_df, ADJUSTMENT_COLUMNS)])
+    sold_df = lines_df[lines_df['quantity'] > 0]
+    if not sold_df.empty:
+        _take_stock(cursor, sold_df)
+    cursor.executemany("UPDATE products SET stock = stock + ? WHERE id = ?", _stock_deltas(lines_df[lines_df['quantity'] < 0], -1))
+    return float(lines_df['amount'].sum())
+
+def _return_lines(cursor, bill_id, quantities):
+    """Adjustment lines taking back quantities (product_id -> qty) at the bill's net price of each product."""
+    net_df = _net_bill_lines(cursor, bill_id)
+    sold = net_df['quantity'].reindex(quantities.index, fill_value=0)
+    over = quantities[quantities > sold]
+    if not over.empty:
+        raise ValueError(f"Cannot return more than bill {bill_id} still has for product ID(s) {over.index.tolist()}.")
+    share = quantities / sold
+    net_df = net_df.loc[quantities.index]
+    return pd.DataFrame({'product_id': quantities.index, 'quantity': -quantities.values, 'rate': net_df['rate'].values,
+                         'gst_percent': net_df['gst_percent'].values, 'gst_amount': -(net_df['gst_amount'] * share).values,
+                         'amount': -(net_df['amount'] * share).values})
+
+def _check_not_voided(cursor, bill_id):
+    if cursor.execute("SELECT 1 FROM bill_adjustments WHERE bill_id = ? AND kind = 'void'", (bill_id,)).fetchone():
+        raise ValueError(f"Bill {bill_id} is voided and can no longer be changed.")
+
+def _apply_return(cursor, bill_id, quantities, kind, adjustment_date, reason):
+    visit = _bill_visit(cursor, bill_id)
+    if visit is None:
+        raise ValueError(f"Bill {bill_id} not found.")
+    _check_not_voided(cursor, bill_id)
+    if kind == 'void':
+        net_df = _net_bill_lines(cursor, bill_id)
+        quantities = net_df.loc[net_df['quantity'] > 0, 'quantity']
+        if quantities.empty:
+            raise ValueError(f"Bill {bill_id} has nothing left to void.")
+    amount = _record_adjustment(cursor, bill_id, kind, _return_lines(cursor, bill_id, quantities), adjustment_date, reason)
+    if kind == 'void':
+        _remove_customer_visit(cursor, visit[0], visit[1], -amount)
+    else:
+        _adjust_customer_spend(cursor, visit[0], amount)
+    return amount
+
+def return_bill_items(bill_id, quantities, reason="", adjustment_date=None):
+    """Takes back {product_id: quantity} from a bill: stock is restored and reports net the return on adjustment_date."""
+    quantities = pd.Series(quantities, dtype='int64')
+    quantities = quantities[quantities > 0]
+    if quantities.empty:
+        return False, "Nothing to return."
+    try:
+        amount = _run_write(_apply_return, bill_id, quantities, 'return', adjustment_date or date.today().isoformat(), reason)
+    except (ValueError, sqlite3.IntegrityError) as e:
+        return False, str(e)
+    _invalidate_reports('bill_adjustments', 'products', 'customer_stats')
+    return True, f"Returned items worth ₹{-amount:,.2f} from bill {bill_id}."
+
+def void_bill(bill_id, reason="", adjustment_date=None):
+    """Cancels everything still on a bill with one reversing adjustment; the bill itself stays for the record."""
+    try:
+        _run_write(_apply_return, bill_id, None, 'void', adjustment_date or date.today().isoformat(), reason)
+    except (ValueError, sqlite3.IntegrityError) as e:
+        return False, str(e)
+    _invalidate_reports('bill_adjustments', 'products', 'customer_stats')
+    return True, f"Bill {bill_id} voided."
+
+def _adjust_bill(cursor, bill_id, bill_date, customer_name, pay_mode, remarks, items_df, customer_id=None):
+    old_visit = _bill_visit(cursor, bill_id)
+    if old_visit is None:
+        raise ValueError(f"Bill {bill_id} not found.")
+    _check_not_voided(cursor, bill_id)
+    if customer_id is None and old_visit[0] is not None:
+        # Keep the link when the customer's name is unchanged, even if they were renamed since
+        same_name = cursor.execute("SELECT customer_name = ? FROM bills WHERE id = ?", (customer_name, bill_id)).fetchone()[0]
+        customer_id = old_visit[0] if same_name else None
+    customer_id = _resolve_customer(cursor, customer_id, customer_name)
+    cursor.execute("UPDATE bills SET customer_id=?, bill_date=?, customer_name=?, pay_mode=?, remarks=? WHERE id=?",
+                   (customer_id, bill_date, customer_name, pay_mode, remarks, bill_id))
+
+    # One delta line per product: wanted lines minus what the bill holds now
+    net_df = _net_bill_lines(cursor, bill_id)
+    wanted_df = items_df.groupby('product_id').agg(quantity=('quantity', 'sum'), amount=('amount', 'sum'), gst_amount=('gst_amount', 'sum'),
+                                                   rate=('rate', 'last'), gst_percent=('gst_percent', 'last'))
+    products = net_df.index.union(wanted_df.index)
+    sums = ['quantity', 'amount', 'gst_amount']
+    delta_df = wanted_df[sums].reindex(products, fill_value=0) - net_df[sums].reindex(products, fill_value=0)
+    for column in ('rate', 'gst_percent'):
+        delta_df[column] = wanted_df[column].reindex(products).fillna(net_df[column].reindex(products))
+    amount = _record_adjustment(cursor, bill_id, 'edit', delta_df.rename_axis('product_id').reset_index(), bill_date, remarks)
+
+    if (customer_id, bill_date) != tuple(old_visit[:2]):
+        _remove_customer_visit(cursor, *old_visit)
+        _add_customer_visit(cursor, customer_id, bill_date, old_visit[2] + amount)
+    else:
+        _adjust_customer_spend(cursor, customer_id, amount)
+
+def update_bill(bill_id, bill_date, customer_name, pay_mode, remarks, items_df, totals=None, customer_id=None):
+    """
+    Changes a bill to the given lines by recording the difference as an 'edit' adjustment dated on the
+    bill, in one transaction. The net total follows from the lines; totals is accepted for compatibility.
+    """
+    try:
+        _run_write(_adjust_bill, bill_id, bill_date, customer_name, pay_mode, remarks, items_df, customer_id)
+    except (InsufficientStockError, ValueError, sqlite3.IntegrityError) as e:
+        return False, str(e)
+    _invalidate_reports('bills', 'bill_adjustments', 'products', 'customer_stats')
     return True, f"Bill {bill_id} updated successfully!"
 
 def delete_bill(bill_id):
-    """Delete a bill and its items. Stock is adjusted accordingly."""
-    _, items = get_bill_by_id(bill_id)
-    for _, row in items.iterrows():
-        update_product_stock(row['product_id'], row['quantity'])  # revert stock
-    execute_query("DELETE FROM bill_items WHERE bill_id=?", (bill_id,))
-    execute_query("DELETE FROM bills WHERE id=?", (bill_id,))
-    return True, f"Bill {bill_id} deleted successfully!"
+    """Bills are voided rather than deleted, so the sale and its reversal stay on record."""
+    return void_bill(bill_id, reason="deleted")
+
+# Totals per pay mode between ?1 and ?2: bills by their date, returns and edits by the day they were
+# recorded (refunded in the bill's pay mode). {open_only} restricts both to days without a day_close.
+DAY_PAYMENTS_QUERY = """
+SELECT pay_mode, SUM(bills) AS bill_count, SUM(sales) AS sales_total, SUM(adjustments) AS adjustment_total, SUM(sales + adjustments) AS net_total FROM (
+    SELECT COALESCE(pay_mode, 'Unknown') AS pay_mode, 1 AS bills, grand_total AS sales, 0 AS adjustments FROM bills
+    WHERE bill_date BETWEEN ?1 AND ?2 {open_only}
+    UNION ALL
+    SELECT COALESCE(b.pay_mode, 'Unknown'), 0, 0, a.amount FROM bill_adjustments a LEFT JOIN bills b ON b.id = a.bill_id
+    WHERE a.adjustment_date BETWEEN ?1 AND ?2 {open_only_adjustments}
+) GROUP BY pay_mode ORDER BY pay_mode
+"""
+OPEN_DAYS_ONLY = {'open_only': "AND NOT EXISTS (SELECT 1 FROM day_close WHERE close_date = bill_date)",
+                  'open_only_adjustments': "AND NOT EXISTS (SELECT 1 FROM day_close WHERE close_date = a.adjustment_date)"}
+ALL_DAYS = {'open_only': "", 'open_only_adjustments': ""}
+
+DAY_TAXES_QUERY = """
+SELECT COALESCE(p.gst_category, 'Unknown') AS gst_category, l.gst_percent, SUM(l.amount - l.gst_amount) AS taxable_amount, SUM(l.gst_amount) AS gst_amount
+FROM (
+    SELECT bi.product_id, bi.gst_percent, bi.gst_amount, bi.amount FROM bill_items bi JOIN bills b ON b.id = bi.bill_id WHERE b.bill_date BETWEEN ?1 AND ?2
+    UNION ALL
+    SELECT product_id, gst_percent, gst_amount, amount FROM bill_adjustments WHERE adjustment_date BETWEEN ?1 AND ?2
+) l LEFT JOIN products p ON p.id = l.product_id
+GROUP BY 1, 2 ORDER BY 1, 2
+"""
+DAY_PAYMENT_COLUMNS = ['pay_mode', 'bill_count', 'sales_total', 'adjustment_total', 'net_total']
+DAY_TAX_COLUMNS = ['gst_category', 'gst_percent', 'taxable_amount', 'gst_amount']
+
+def _close_day(cursor, close_date):
+    if cursor.execute("SELECT 1 FROM day_close WHERE close_date = ?", (close_date,)).fetchone():
+        raise ValueError(f"{close_date} is already closed.")
+    payments = cursor.execute(DAY_PAYMENTS_QUERY.format(**ALL_DAYS), (close_date, close_date)).fetchall()
+    taxes = cursor.execute(DAY_TAXES_QUERY, (close_date, close_date)).fetchall()
+    header = (close_date, database.get_audit_user(), sum(row[1] for row in payments), sum(row[2] for row in payments),
+              sum(row[3] for row in payments), sum(row[4] for row in payments), sum(row[2] for row in taxes), sum(row[3] for row in taxes))
+    cursor.execute("INSERT INTO day_close (close_date, closed_at, closed_by, bill_count, sales_total, adjustment_total, net_total, taxable_total, gst_total) "
+                   "VALUES (?, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'), ?, ?, ?, ?, ?, ?, ?)", header)
+    cursor.executemany("INSERT INTO day_close_payments (close_date, pay_mode, bill_count, sales_total, adjustment_total, net_total) VALUES (?, ?, ?, ?, ?, ?)",
+                       [(close_date,) + tuple(row) for row in payments])
+    cursor.executemany("INSERT INTO day_close_taxes (close_date, gst_category, gst_percent, taxable_amount, gst_amount) VALUES (?, ?, ?, ?, ?)",
+                       [(close_date,) + tuple(row) for row in taxes])
+    return header
+
+def close_day(close_date=None):
+    """
+    End-of-day close (Z report): stores the day's totals per pay mode and tax category in day_close and
+    locks the day, so no bill can be added, edited or re-dated into it and no adjustment recorded on it.
+    """
+    close_date = close_date or date.today().isoformat()
+    if close_date > date.today().isoformat():
+        return False, "A day can only be closed once it has started."
+    try:
+        header = _run_write(_close_day, close_date)
+    except (ValueError, sqlite3.IntegrityError) as e:
+        return False, str(e)
+    _invalidate_reports('day_close')
+    return True, f"Day {close_date} closed: {header[2]} bills, net sales ₹{header[5]:,.2f}."
+
+def get_day_close(close_date):
+    """
+    (header, payments_df, taxes_df) of one day. For a closed day these are the stored records; for an
+    open day a preview computed from the bills, with header['closed'] False.
+    """
+    with closing(get_connection()) as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM day_close WHERE close_date = ?", (close_date,)).fetchone()
+        if row is not None:
+            header = dict(row, closed=True)
+            payments_df = pd.read_sql_query(f"SELECT {', '.join(DAY_PAYMENT_COLUMNS)} FROM day_close_payments WHERE close_date = ? ORDER BY pay_mode", conn, params=(close_date,))
+            taxes_df = pd.read_sql_query(f"SELECT {', '.join(DAY_TAX_COLUMNS)} FROM day_close_taxes WHERE close_date = ? ORDER BY gst_category, gst_percent", conn, params=(close_date,))
+            return header, payments_df, taxes_df
+        payments_df = pd.read_sql_query(DAY_PAYMENTS_QUERY.format(**ALL_DAYS), conn, params=(close_date, close_date))
+        taxes_df = pd.read_sql_query(DAY_TAXES_QUERY, conn, params=(close_date, close_date))
+    header = {'close_date': close_date, 'closed': False, 'bill_count': int(payments_df['bill_count'].sum()),
+              'sales_total': payments_df['sales_total'].sum(), 'adjustment_total': payments_df['adjustment_total'].sum(),
+              'net_total': payments_df['net_total'].sum(), 'taxable_total': taxes_df['taxable_amount'].sum(), 'gst_total': taxes_df['gst_amount'].sum()}
+    return header, payments_df, taxes_df
+
+@_cached_report('day_close')
+def get_day_closes(start_date, end_date):
+    """Closed days in the period, newest first."""
+    with closing(get_connection()) as conn:
+        return pd.read_sql_query("SELECT * FROM day_close WHERE close_date BETWEEN ? AND ? ORDER BY close_date DESC", conn, params=(start_date, end_date))
+
+@_cached_report('day_close', 'bills', 'bill_adjustments')
+def get_sales_summary(start_date, end_date):
+    """Totals per pay mode for a period: closed days are summed from their day_close records, only open days are read from the bills."""
+    with closing(get_connection()) as conn:
+        closed_df = pd.read_sql_query(
+            "SELECT pay_mode, SUM(bill_count) AS bill_count, SUM(sales_total) AS sales_total, SUM(adjustment_total) AS adjustment_total, SUM(net_total) AS net_total "
+            "FROM day_close_payments WHERE close_date BETWEEN ? AND ? GROUP BY pay_mode", conn, params=(start_date, end_date))
+        open_df = pd.read_sql_query(DAY_PAYMENTS_QUERY.format(**OPEN_DAYS_ONLY), conn, params=(start_date, end_date))
+    frames = [df for df in (closed_df, open_df) if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=DAY_PAYMENT_COLUMNS).set_index('pay_mode')
+    return pd.concat(frames).groupby('pay_mode').sum()
 
+@_cached_report('store_info', ttl=MASTER_DATA_TTL)
 def get_store_info():
     query = "SELECT name, address, vat_number FROM store_info WHERE id = 1"
-    result = execute_query(query, fetch='one')
+    with get_connection_pool().connection() as conn:
+        result = conn.execute(query).fetchone()
     if result:
         return {'name': result[0], 'address': result[1], 'vat_number': result[2]}
     else:
@@ -340,4 +1281,5 @@ def update_store_info(name, address, vat_number):
     # Upsert logic: insert or update row with id=1
     query = "INSERT INTO store_info (id, name, address, vat_number) VALUES (1, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET name=excluded.name, address=excluded.address, vat_number=excluded.vat_number"
     execute_query(query, (name, address, vat_number))
+    _invalidate_reports('store_info')
     return True, "Store info updated."
@@ -0,0 +1,118 @@
+# forecast.py
+"""
+Daily demand forecast per product: simple exponential smoothing with weekday seasonality, fitted
+for all products at once on a products x days NumPy matrix read in one query (sales net of returns).
+
+The fitted state (smoothed level and weekday totals per product) is kept in memory. Each later call
+only reads the days completed since the previous one. A full refit runs on first use, when products
+are added, when a bill or adjustment dated on an already fitted day is written (backdated or offline
+bills, edits), and every REFIT_DAYS, which also picks up old bills deleted by archiving.
+"""
+import threading
+from contextlib import closing
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import db_functions as db
+
+HISTORY_DAYS = 3 * 365  # days of sales used by a full fit
+ALPHA = 0.1  # weight of the newest day in the smoothed level
+SEASON_PRIOR_DAYS = 4  # pulls the weekday factors of slow sellers towards 1
+HORIZON_DAYS = 7
+REFIT_DAYS = 30
+
+_model_lock = threading.Lock()
+_model = None
+
+def _sales_matrix(conn, product_ids, first_day, last_day):
+    """Quantities sold per product (rows, in product_ids order) and day (columns, first_day..last_day)."""
+    days = max((last_day - first_day).days + 1, 0)
+    matrix = np.zeros((len(product_ids), days))
+    rows = conn.execute(
+        "SELECT product_id, day, SUM(quantity) FROM ("
+        " SELECT bi.product_id, b.bill_date AS day, bi.quantity FROM bill_items bi JOIN bills b ON b.id = bi.bill_id WHERE b.bill_date BETWEEN ?1 AND ?2"
+        " UNION ALL SELECT product_id, adjustment_date, quantity FROM bill_adjustments WHERE adjustment_date BETWEEN ?1 AND ?2"
+        ") GROUP BY product_id, day",
+        (first_day.isoformat(), last_day.isoformat())).fetchall()
+    if rows and days and len(product_ids):
+        pids, dates, quantities = (np.asarray(column) for column in zip(*rows))
+        row = np.minimum(np.searchsorted(product_ids, pids), len(product_ids) - 1)
+        col = (np.array([d[:10] for d in dates], dtype='datetime64[D]') - np.datetime64(first_day)).astype(int)
+        known = product_ids[row] == pids  # lines of deleted products are ignored
+        np.add.at(matrix, (row[known], col[known]), quantities[known].astype(float))
+    return matrix
+
+def _weekday_factors(model):
+    """products x 7 multipliers of the level for Monday..Sunday."""
+    weekday_sum, weekday_days = model['weekday_sum'], model['weekday_days']
+    daily_mean = (weekday_sum.sum(axis=1) / max(weekday_days.sum(), 1))[:, None]
+    numerator = weekday_sum + SEASON_PRIOR_DAYS * daily_mean
+    denominator = (weekday_days + SEASON_PRIOR_DAYS) * daily_mean
+    return np.divide(numerator, denominator, out=np.ones_like(numerator), where=denominator > 0)
+
+def _advance(model, matrix, first_day):
+    """Folds the days in matrix (starting at first_day) into the model."""
+    days = matrix.shape[1]
+    if not days:
+        return
+    weekdays = (np.arange(days) + first_day.weekday()) % 7
+    model['weekday_sum'] = model['weekday_sum'] + matrix @ np.eye(7)[weekdays]
+    model['weekday_days'] = model['weekday_days'] + np.bincount(weekdays, minlength=7)
+    deseasonalised = matrix / _weekday_factors(model)[:, weekdays]
+    if model['level'] is None:
+        model['level'] = deseasonalised.mean(axis=1)
+    # Smoothing over T days in one matrix-vector product: level_T = (1-a)^T * level_0 + sum_t a(1-a)^(T-1-t) * x_t
+    weights = ALPHA * (1 - ALPHA) ** np.arange(days - 1, -1, -1)
+    model['level'] = (1 - ALPHA) ** days * model['level'] + deseasonalised @ weights
+
+def _last_row_ids(conn):
+    return conn.execute("SELECT (SELECT IFNULL(MAX(id), 0) FROM bills), (SELECT IFNULL(MAX(id), 0) FROM bill_adjustments)").fetchone()
+
+def _backdated_since(conn, model):
+    """True if a bill or adjustment written after the model's fit falls on a day the model has already fitted."""
+    bills_seen, adjustments_seen = model['row_ids']
+    through = model['through'].isoformat()
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM bills WHERE id > ?1 AND bill_date <= ?2)"
+                        " OR EXISTS (SELECT 1 FROM bill_adjustments WHERE id > ?3 AND adjustment_date <= ?2)",
+                        (bills_seen, through, adjustments_seen)).fetchone()[0]
+
+def _fitted_model(conn):
+    global _model
+    yesterday = date.today() - timedelta(days=1)  # only complete days are fitted
+    product_ids = np.sort(np.asarray([row[0] for row in conn.execute("SELECT id FROM products")], dtype=np.int64))
+    row_ids = _last_row_ids(conn)  # read before the sales, so rows written meanwhile are checked next time
+    model = _model
+    if (model is None or (yesterday - model['fitted_on']).days >= REFIT_DAYS or not np.array_equal(model['product_ids'], product_ids)
+            or _backdated_since(conn, model)):
+        first_sale = conn.execute("SELECT MIN(bill_date) FROM bills").fetchone()[0]
+        first_day = yesterday - timedelta(days=HISTORY_DAYS - 1)
+        if first_sale:
+            first_day = max(first_day, date.fromisoformat(first_sale[:10]))
+        model = {'product_ids': product_ids, 'level': None, 'weekday_sum': np.zeros((len(product_ids), 7)),
+                 'weekday_days': np.zeros(7), 'fitted_on': yesterday, 'through': yesterday}
+        _advance(model, _sales_matrix(conn, product_ids, first_day, yesterday), first_day)
+    elif model['through'] < yesterday:
+        first_day = model['through'] + timedelta(days=1)
+        _advance(model, _sales_matrix(conn, product_ids, first_day, yesterday), first_day)
+        model['through'] = yesterday
+    if model['level'] is None:
+        model['level'] = np.zeros(len(product_ids))
+    model['row_ids'] = row_ids
+    _model = model
+    return model
+
+def get_forecast(horizon_days=HORIZON_DAYS):
+    """Expected daily sales per product (rows) for today and the following days (columns)."""
+    with _model_lock, closing(db.get_connection()) as conn:
+        model = _fitted_model(conn)
+        start = model['through'] + timedelta(days=1)
+        weekdays = (np.arange(horizon_days) + start.weekday()) % 7
+        values = model['level'][:, None] * _weekday_factors(model)[:, weekdays]
+        columns = [(start + timedelta(days=d)).isoformat() for d in range(horizon_days)]
+        return pd.DataFrame(values, index=pd.Index(model['product_ids'], name='product_id'), columns=columns)
+
+def get_forecast_totals(horizon_days=HORIZON_DAYS):
+    """Expected sales per product over the next horizon_days."""
+    return get_forecast(horizon_days).sum(axis=1)
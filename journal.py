@@ -0,0 +1,206 @@
+# journal.py
+"""
+Local write-ahead journal for bills that could not be written to liquor_store.db, e.g. because the
+file sits on a network share that dropped out or is locked by a backup.
+
+The bill is appended as one checksummed line and fsynced before the sale is confirmed, and
+replay_pending() later inserts pending bills, each as its own writer command so one refused bill
+does not hold back the others. Every bill carries a client-generated bill_uuid and bills.bill_uuid
+is unique, so a bill that reached the database but was never marked as applied here is not
+inserted a second time. Bills the database refuses for good (e.g. their day and today are both
+closed) are moved to QUARANTINE_FILE for someone to enter by hand.
+
+The app server and api.py may share the journal, so appends and the final truncation hold an OS
+file lock, and only one process replays at a time.
+
+Line format: <crc32 hex> <json>
+"""
+import json
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+
+JOURNAL_FILE = "bill_journal.log"
+QUARANTINE_FILE = JOURNAL_FILE + ".quarantine"
+LOCK_FILE = JOURNAL_FILE + ".lock"  # held while the journal is appended to or truncated
+REPLAY_LOCK_FILE = JOURNAL_FILE + ".replay"  # held by the one process replaying
+REPLAY_BATCH = 50  # bills queued to the writer at a time
+# SQLite result codes meaning the database is busy, locked or could not be reached: worth journaling and
+# retrying. Any other error (a missing table, a constraint) would fail the same way on replay.
+UNAVAILABLE_CODES = {sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED, sqlite3.SQLITE_CANTOPEN, sqlite3.SQLITE_IOERR}
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(f, blocking):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.05)
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f, blocking):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def _file_lock(path, blocking=True):
+    """Exclusive lock on path across processes and threads; yields False if not blocking and already held."""
+    with open(path, 'a+b') as f:
+        locked = _lock_file(f, blocking)
+        try:
+            yield locked
+        finally:
+            if locked:
+                _unlock_file(f)
+
+def _encode(entry):
+    payload = json.dumps(entry, separators=(',', ':'))
+    return f"{zlib.crc32(payload.encode('utf-8')):08x} {payload}\n"
+
+def _append(entries, path=JOURNAL_FILE):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(_encode(entry) for entry in entries))
+        f.flush()
+        os.fsync(f.fileno())
+
+def _read(path=JOURNAL_FILE):
+    """
+    Returns (valid entries in file order, number of lines with a bad checksum, e.g. a torn last write,
+    bytes read). Appends after the returned offset are not included.
+    """
+    entries, corrupt, offset = [], 0, 0
+    if not os.path.exists(path):
+        return entries, corrupt, offset
+    with open(path, 'rb') as f:
+        for raw in f:
+            offset += len(raw)
+            crc, _, payload = raw.decode('utf-8', errors='replace').rstrip('\n').partition(' ')
+            try:
+                valid = int(crc, 16) == zlib.crc32(payload.encode('utf-8'))
+            except ValueError:
+                valid = False
+            if valid:
+                entries.append(json.loads(payload))
+            else:
+                corrupt += 1
+    return entries, corrupt, offset
+
+def _unresolved(entries):
+    resolved = {entry['bill_uuid'] for entry in entries if entry['type'] in ('applied', 'quarantined')}
+    return [entry for entry in entries if entry['type'] == 'bill' and entry['bill_uuid'] not in resolved]
+
+def record_bill(bill_uuid, bill_date, customer_name, pay_mode, remarks, item_rows, totals, customer_id=None):
+    """Durably stores one bill; item_rows are lists in db_functions.BILL_ITEM_COLUMNS order."""
+    entry = {'type': 'bill', 'bill_uuid': bill_uuid, 'bill_date': bill_date, 'customer_id': customer_id, 'customer_name': customer_name,
+             'pay_mode': pay_mode, 'remarks': remarks, 'items': item_rows, 'totals': totals, 'recorded_at': time.time()}
+    with _file_lock(LOCK_FILE):
+        _append([entry])
+
+def has_pending():
+    return os.path.exists(JOURNAL_FILE) and os.path.getsize(JOURNAL_FILE) > 0
+
+def pending_bills():
+    return _unresolved(_read()[0])
+
+def quarantined_bills():
+    """Bills the database refused for good, each with the 'error' it gave."""
+    return _read(QUARANTINE_FILE)[0]
+
+def _is_marker(raw, bill_uuids):
+    """True if the raw journal line marks one of bill_uuids as applied or quarantined."""
+    payload = raw.decode('utf-8', errors='replace').rstrip('\n').partition(' ')[2]
+    try:
+        entry = json.loads(payload)
+    except ValueError:
+        return False
+    return entry.get('type') in ('applied', 'quarantined') and entry.get('bill_uuid') in bill_uuids
+
+def _truncate(offset, corrupt, resolved):
+    """
+    Drops the first offset bytes (all replayed) and the markers written for them (resolved bill_uuids),
+    keeping whatever other processes appended since.
+    """
+    with open(JOURNAL_FILE, 'rb') as f:
+        replayed = f.read(offset)
+        rest = b''.join(raw for raw in f if not _is_marker(raw, resolved))
+    if corrupt:
+        # Keep unreadable lines for inspection
+        with open(f"{JOURNAL_FILE}.corrupt-{int(time.time())}", 'wb') as f:
+            f.write(replayed)
+    if not rest:
+        os.remove(JOURNAL_FILE)
+        return
+    with open(JOURNAL_FILE + ".tmp", 'wb') as f:
+        f.write(rest)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(JOURNAL_FILE + ".tmp", JOURNAL_FILE)
+
+def is_unavailable(error):
+    """True if error means the database is busy, locked or unreachable rather than refusing the bill."""
+    return isinstance(error, sqlite3.OperationalError) and (getattr(error, 'sqlite_errorcode', 0) & 0xff) in UNAVAILABLE_CODES
+
+def _replay(batch_size):
+    import db_functions as db
+    with _file_lock(LOCK_FILE):
+        entries, corrupt, offset = _read()
+    pending = _unresolved(entries)
+    applied, blocked, resolved = 0, False, set()
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        markers, quarantined = [], []
+        for entry, error in zip(batch, db.apply_journaled_bills(batch)):
+            if error is None:
+                markers.append({'type': 'applied', 'bill_uuid': entry['bill_uuid']})
+                applied += 1
+            elif is_unavailable(error):
+                blocked = True  # locked or unreachable: retried on the next replay
+            else:
+                markers.append({'type': 'quarantined', 'bill_uuid': entry['bill_uuid'], 'error': str(error)})
+                quarantined.append(dict(entry, error=str(error)))
+        resolved.update(marker['bill_uuid'] for marker in markers)
+        with _file_lock(LOCK_FILE):
+            if quarantined:
+                _append(quarantined, QUARANTINE_FILE)
+            if markers:
+                _append(markers)
+        if blocked:
+            return applied
+    if offset:
+        with _file_lock(LOCK_FILE):
+            _truncate(offset, corrupt, resolved)
+    return applied
+
+def replay_pending(batch_size=REPLAY_BATCH):
+    """
+    Inserts pending journal bills into the database and returns how many were applied. Stops while the
+    database is locked or unreachable; the rest stay pending. Runs on page loads, so it never raises,
+    and returns 0 at once if another process is already replaying.
+    """
+    with _file_lock(REPLAY_LOCK_FILE, blocking=False) as replaying:
+        if not replaying:
+            return 0
+        try:
+            return _replay(batch_size)
+        except Exception as e:
+            print(f"Replaying the bill journal failed: {e}")
+            return 0
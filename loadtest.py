@@ -0,0 +1,109 @@
+# loadtest.py
+"""
+Load test for api.py: several simulated terminals post bills back to back for a fixed time, and the
+sustained bills per second and the latency percentiles are reported.
+
+By default the API is served in-process on a temporary copy of liquor_store.db with its stock topped
+up, so the test neither touches the live data nor runs out of stock. Pass a URL to load an API that
+is already running instead; its bills are real.
+
+Usage: python loadtest.py [terminals] [seconds] [url]   (default 8 terminals for 30 s)
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from aiohttp import web
+
+TERMINALS = 8
+DURATION = 30  # seconds
+MAX_LINES = 3  # lines per bill, 1 to MAX_LINES products of quantity 1
+TOP_UP_STOCK = 1_000_000  # units added to every product of the temporary copy
+
+async def _terminal(session, url, number, product_ids, deadline, latencies, failures):
+    """Posts bills one after another, like a till that is never idle, until deadline."""
+    rng = random.Random(number)
+    headers = {'X-Operator': f"loadtest-{number}"}
+    while time.perf_counter() < deadline:
+        items = [{'product_id': pid, 'quantity': 1} for pid in rng.sample(product_ids, min(len(product_ids), rng.randint(1, MAX_LINES)))]
+        body = {'customer_name': 'Cash Customer', 'pay_mode': 'Cash', 'remarks': 'load test', 'items': items}
+        started = time.perf_counter()
+        async with session.post(f"{url}/bills", json=body, headers=headers) as response:
+            result = await response.json()
+        if response.status == 201 and result['success']:
+            latencies.append(time.perf_counter() - started)
+        else:
+            failures.append(result.get('message') or result.get('error'))
+
+async def run_load_test(url, terminals=TERMINALS, seconds=DURATION):
+    """
+    Runs `terminals` concurrent clients against the API at url for `seconds` and returns bills, failed,
+    bills_per_second and p50/p95/max latency in ms.
+    """
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=terminals)) as session:
+        async with session.get(f"{url}/products") as response:
+            product_ids = [product['id'] for product in await response.json()]
+        if not product_ids:
+            raise ValueError("The database has no products to bill.")
+        latencies, failures = [], []
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(*(_terminal(session, url, n, product_ids, deadline, latencies, failures) for n in range(terminals)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+    return {'terminals': terminals, 'seconds': round(elapsed, 1), 'bills': len(latencies), 'failed': len(failures),
+            'bills_per_second': round(len(latencies) / elapsed, 1), 'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95),
+            'max_ms': percentile(1.0), 'first_failure': failures[0] if failures else None}
+
+@asynccontextmanager
+async def serve_api():
+    """Serves api.py for the database in the working directory on a free local port; yields its URL."""
+    import api
+    runner = web.AppRunner(api.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, api.API_HOST, 0)
+    await site.start()
+    try:
+        port = site._server.sockets[0].getsockname()[1]
+        yield f"http://{api.API_HOST}:{port}"
+    finally:
+        await runner.cleanup()
+
+async def _run_on_copy(terminals, seconds):
+    async with serve_api() as url:
+        return await run_load_test(url, terminals, seconds)
+
+def load_test_copy(terminals=TERMINALS, seconds=DURATION):
+    """Runs the load test against an in-process API on a temporary copy of liquor_store.db."""
+    import backup
+    import db_functions as db
+    source, cwd = os.path.abspath(db.DB_FILE), os.getcwd()
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+        backup._copy_database(source, os.path.join(tmp, db.DB_FILE), pages=-1)
+        conn = sqlite3.connect(os.path.join(tmp, db.DB_FILE))
+        conn.execute("UPDATE products SET stock = stock + ?", (TOP_UP_STOCK,))
+        conn.commit()
+        conn.close()
+        os.chdir(tmp)
+        try:
+            return asyncio.run(_run_on_copy(terminals, seconds))
+        finally:
+            os.chdir(cwd)
+
+if __name__ == '__main__':
+    terminals = int(sys.argv[1]) if len(sys.argv) > 1 else TERMINALS
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else DURATION
+    if len(sys.argv) > 3:
+        stats = asyncio.run(run_load_test(sys.argv[3].rstrip('/'), terminals, seconds))
+    else:
+        stats = load_test_copy(terminals, seconds)
+    for key, value in stats.items():
+        print(f"{key}: {value}")
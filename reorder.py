@@ -0,0 +1,122 @@
+# reorder.py
+"""
+Low-stock alerts and reorder suggestions.
+
+Sales velocity per product is blended from the quantities sold over rolling windows (SALES_WINDOWS).
+Daily sales per product, net of returns (bill_adjustments), are kept in memory. Each call reads only
+the bill lines and adjustments added since the previous call, so checking after every bill costs one
+small query. If bill lines disappeared (e.g. archived), the table is rebuilt. Vendors, purchase intervals and last rates come
+from purchase_order_items history.
+"""
+import threading
+from contextlib import closing
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import db_functions as db
+
+SALES_WINDOWS = (7, 30, 90)  # days
+WINDOW_WEIGHTS = (0.5, 0.3, 0.2)  # recent sales count most
+LEAD_TIME_DAYS = 3  # from placing an order until the stock is on the shelf
+SAFETY_DAYS = 4  # extra days of sales kept as safety stock
+DEFAULT_COVER_DAYS = 14  # days of sales to order for when a product has no purchase history
+MIN_COVER_DAYS, MAX_COVER_DAYS = 7, 60
+
+_sales_lock = threading.Lock()
+_sales_state = {'last_line_id': 0, 'line_count': 0, 'last_adjustment_id': 0, 'daily': None}
+
+PURCHASE_HISTORY_QUERY = """
+WITH lines AS (
+    SELECT poi.product_id, po.vendor_id, po.purchase_date, poi.rate,
+           ROW_NUMBER() OVER (PARTITION BY poi.product_id ORDER BY po.purchase_date DESC, po.id DESC) AS recency
+    FROM purchase_order_items poi JOIN purchase_orders po ON po.id = poi.purchase_order_id
+), intervals AS (
+    SELECT product_id, (julianday(MAX(purchase_date)) - julianday(MIN(purchase_date))) / NULLIF(COUNT(DISTINCT purchase_date) - 1, 0) AS interval_days
+    FROM lines GROUP BY product_id
+)
+SELECT l.product_id, l.vendor_id, v.name AS vendor, l.rate AS last_rate, i.interval_days
+FROM lines l JOIN intervals i ON i.product_id = l.product_id LEFT JOIN vendors v ON v.id = l.vendor_id
+WHERE l.recency = 1
+"""
+
+def _daily_sales(conn):
+    """Quantity sold per (product_id, bill_date) over the longest window."""
+    since = (date.today() - timedelta(days=max(SALES_WINDOWS))).isoformat()
+    with _sales_lock:
+        state = _sales_state
+        if state['daily'] is None:
+            new = None
+            last_line_id = conn.execute("SELECT IFNULL(MAX(id), 0) FROM bill_items").fetchone()[0]
+        else:
+            new = pd.read_sql_query(
+                "SELECT bi.id, bi.product_id, b.bill_date, bi.quantity FROM bill_items bi LEFT JOIN bills b ON b.id = bi.bill_id WHERE bi.id > ?",
+                conn, params=(state['last_line_id'],))
+            last_line_id = int(new['id'].max()) if not new.empty else state['last_line_id']
+        line_count = conn.execute("SELECT COUNT(*) FROM bill_items WHERE id <= ?", (last_line_id,)).fetchone()[0]
+
+        rebuild = new is None or state['line_count'] + len(new) != line_count
+        if rebuild:
+            # First call, or lines were deleted since the last one: read the whole window again
+            new = pd.read_sql_query(
+                "SELECT bi.product_id, b.bill_date, bi.quantity FROM bill_items bi JOIN bills b ON b.id = bi.bill_id WHERE bi.id <= ? AND b.bill_date >= ?",
+                conn, params=(last_line_id, since))
+            daily = new.groupby(['product_id', 'bill_date'])['quantity'].sum()
+        else:
+            new = new.dropna(subset=['bill_date'])
+            new = new[new['bill_date'] >= since]
+            daily = state['daily'].add(new.groupby(['product_id', 'bill_date'])['quantity'].sum(), fill_value=0)
+
+        # Adjustments are only ever appended, so the id alone tells what is new
+        last_adjustment_id = 0 if rebuild else state['last_adjustment_id']
+        adjustments = pd.read_sql_query("SELECT id, product_id, adjustment_date AS bill_date, quantity FROM bill_adjustments WHERE id > ?",
+                                        conn, params=(last_adjustment_id,))
+        if not adjustments.empty:
+            last_adjustment_id = int(adjustments['id'].max())
+            adjustments = adjustments[adjustments['bill_date'] >= since]
+            daily = daily.add(adjustments.groupby(['product_id', 'bill_date'])['quantity'].sum(), fill_value=0)
+        daily = daily[daily.index.get_level_values('bill_date') >= since]  # days that left the longest window
+
+        state.update(last_line_id=last_line_id, line_count=line_count, last_adjustment_id=last_adjustment_id, daily=daily)
+        return daily.copy()
+
+def get_reorder_suggestions(only_needed=True):
+    """
+    Velocity, reorder point and suggested order quantity for every product, with the vendor and rate of
+    its last purchase. With only_needed, returns just the products at or below their reorder point,
+    the ones closest to running out first.
+    """
+    with closing(db.get_connection()) as conn:
+        daily = _daily_sales(conn)
+        history = pd.read_sql_query(PURCHASE_HISTORY_QUERY, conn, index_col='product_id')
+    df = db.get_products()[['name', 'size', 'stock']].join(history)
+
+    days_ago = (pd.Timestamp(date.today()) - pd.to_datetime(daily.index.get_level_values('bill_date'))).days.to_numpy()
+    df['velocity'] = 0.0
+    for window, weight in zip(SALES_WINDOWS, WINDOW_WEIGHTS):
+        sold = daily[days_ago < window].groupby(level='product_id').sum().reindex(df.index, fill_value=0)
+        df[f'sold_{window}d'] = sold.astype(int)
+        df['velocity'] += weight * sold / window
+
+    cover_days = df['interval_days'].astype(float).clip(MIN_COVER_DAYS, MAX_COVER_DAYS).fillna(DEFAULT_COVER_DAYS)
+    df['reorder_point'] = np.ceil(df['velocity'] * (LEAD_TIME_DAYS + SAFETY_DAYS)).astype(int)
+    order_up_to = df['reorder_point'] + np.ceil(df['velocity'] * cover_days).astype(int)
+    needed = (df['velocity'] > 0) & (df['stock'] <= df['reorder_point'])
+    df['suggested_qty'] = np.where(needed, (order_up_to - df['stock']).clip(lower=0), 0)
+    df['days_of_cover'] = (df['stock'] / df['velocity'].where(df['velocity'] > 0)).round(1)
+    df['velocity'] = df['velocity'].round(2)
+    df = df.drop(columns='interval_days')
+
+    if only_needed:
+        df = df[df['suggested_qty'] > 0].sort_values('days_of_cover')
+    return df
+
+def draft_purchase_order(suggestions_df, vendor_id):
+    """
+    PO lines (product_id, quantity, rate) for one vendor's suggestions, in the form render_purchases
+    edits. The rate is the last purchase rate, so the draft starts from what the vendor charged last.
+    """
+    lines = suggestions_df[(suggestions_df['vendor_id'] == vendor_id) & (suggestions_df['suggested_qty'] > 0)]
+    return [{'product_id': int(pid), 'quantity': int(qty), 'rate': float(rate)}
+            for pid, qty, rate in zip(lines.index, lines['suggested_qty'], lines['last_rate'])]
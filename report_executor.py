@@ -0,0 +1,132 @@
+# report_executor.py
+"""
+Runs report functions from db_functions on a thread pool so a long date range doesn't freeze the page.
+Finished results are kept by (report, params) until this process writes a table the report reads or
+db.REPORT_CACHE_TTL passes; starting a report with new params cancels the stale query of the same
+owner through sqlite3's progress handler / interrupt().
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import db_functions as db
+
+PROGRESS_STEP = 10000  # SQLite VM instructions between progress callbacks
+
+class ReportCancelled(Exception):
+    pass
+
+class ReportJob:
+    def __init__(self, report, args, owner, versions=()):
+        self.report = report
+        self.args = args
+        self.owner = owner
+        self.versions = versions  # db.table_versions() of the report's tables when it was submitted
+        self.started_at = time.time()
+        self.finished_at = None
+        self.steps = 0
+        self.cancelled = False
+        self.future = None
+        self._connections = []
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return (self.report, self.args)
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def attach(self, conn):
+        """Called by db_functions for every connection the report opens."""
+        with self._lock:
+            if self.cancelled:
+                raise ReportCancelled(self.report)
+            self._connections.append(conn)
+        if isinstance(conn, sqlite3.Connection):
+            conn.set_progress_handler(self._on_progress, PROGRESS_STEP)
+
+    def _on_progress(self):
+        self.steps += PROGRESS_STEP
+        return 1 if self.cancelled else 0  # non-zero aborts the running statement
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.interrupt()
+            except Exception:
+                pass  # connection already closed
+
+    def done(self):
+        return self.future.done()
+
+    def reusable(self, versions):
+        """False once cancelled, failed, or outdated by a write to the report's tables or by age."""
+        if self.cancelled or versions != self.versions:
+            return False
+        if not self.done():
+            return True
+        return not self.future.exception() and time.time() - self.finished_at < db.REPORT_CACHE_TTL
+
+    def result(self):
+        """Returns the report DataFrame; raises ReportCancelled if the query was superseded."""
+        try:
+            return self.future.result()
+        except Exception:
+            if self.cancelled:
+                raise ReportCancelled(self.report)
+            raise
+
+class ReportExecutor:
+    def __init__(self, max_workers=2, max_results=32):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._jobs = OrderedDict()  # (report, args) -> ReportJob, most recently used last
+        self._max_results = max_results
+        self._lock = threading.Lock()
+
+    def submit(self, report, func, *args, owner=None):
+        """
+        Returns the job for (report, args), starting it if needed. Any other running job of the same
+        owner and report (e.g. the previous date range) is cancelled.
+        """
+        key = (report, args)
+        versions = db.table_versions(*getattr(func, 'tables', ()))
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.reusable(versions):
+                self._jobs.move_to_end(key)
+                return job
+            for other in self._jobs.values():
+                if other.owner == owner and other.report == report and not other.done():
+                    other.cancel()
+            job = ReportJob(report, args, owner, versions)
+            job.future = self._pool.submit(self._run, job, func)
+            self._jobs[key] = job
+            self._evict()
+        return job
+
+    def cancel(self, report, owner=None):
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.report == report and job.owner == owner and not job.done()]
+        for job in jobs:
+            job.cancel()
+
+    def _run(self, job, func):
+        if job.cancelled:
+            raise ReportCancelled(job.report)
+        try:
+            with db.bound_report_job(job):
+                return func(*job.args)
+        finally:
+            job.finished_at = time.time()
+
+    def _evict(self):
+        finished = [key for key, job in self._jobs.items() if job.done()]
+        while len(self._jobs) > self._max_results and finished:
+            del self._jobs[finished.pop(0)]
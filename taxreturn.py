@@ -0,0 +1,127 @@
+# taxreturn.py
+"""
+Monthly GST/VAT return from the tax_daily aggregate.
+
+tax_daily holds output tax (sales, net of returns and edits) and input tax (purchases) per day and
+rate. Triggers created in database.py update it on every bill, adjustment and purchase order write,
+so a month's return reads at most 31 days x rates rows however many bills it covers.
+reconcile_tax_return() compares the aggregate with the raw line items and rebuild_tax_daily()
+recomputes a month from them. Both refuse months of archived financial years: their line items have
+left the database and tax_daily keeps the totals from before archiving.
+
+Usage: python taxreturn.py YYYY-MM [--reconcile]
+"""
+import json
+import os
+import sys
+from contextlib import closing
+from datetime import date, timedelta
+
+import pandas as pd
+
+import archive
+import database
+import db_functions as db
+
+EXPORT_DIR = "tax_returns"
+RECONCILE_TOLERANCE = 0.01  # rupees of difference per day and rate still counted as matching
+
+def month_bounds(period):
+    """First and last day (ISO dates) of a 'YYYY-MM' period."""
+    first = date.fromisoformat(f"{period}-01")
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+def is_archived(period):
+    """True if the month belongs to an archived financial year."""
+    return archive.is_archived(*month_bounds(period))
+
+def get_tax_return(period):
+    """Taxable value and tax per direction ('output' = sales, 'input' = purchases) and rate for one month."""
+    start_date, end_date = month_bounds(period)
+    with closing(db.get_connection()) as conn:
+        return pd.read_sql_query(
+            "SELECT direction, gst_percent, ROUND(SUM(taxable_amount), 2) AS taxable_amount, ROUND(SUM(tax_amount), 2) AS tax_amount, SUM(line_count) AS line_count "
+            "FROM tax_daily WHERE tax_date BETWEEN ? AND ? GROUP BY direction, gst_percent HAVING SUM(line_count) != 0 OR ROUND(SUM(tax_amount), 2) != 0 "
+            "ORDER BY direction DESC, gst_percent", conn, params=(start_date, end_date))
+
+def tax_totals(return_df):
+    """Output tax, input tax and the net payable of a return."""
+    output_tax = return_df.loc[return_df['direction'] == 'output', 'tax_amount'].sum()
+    input_tax = return_df.loc[return_df['direction'] == 'input', 'tax_amount'].sum()
+    return {'output_tax': round(float(output_tax), 2), 'input_tax': round(float(input_tax), 2), 'net_payable': round(float(output_tax - input_tax), 2)}
+
+def tax_return_csv(period):
+    return get_tax_return(period).to_csv(index=False)
+
+def tax_return_json(period):
+    """The return with store details and totals, as filed."""
+    return_df = get_tax_return(period)
+    store = db.get_store_info()
+    document = {'period': period, 'store_name': store['name'], 'vat_number': store['vat_number'], 'generated_on': date.today().isoformat(),
+                'lines': return_df.to_dict('records'), 'totals': tax_totals(return_df)}
+    return json.dumps(document, indent=2, default=float)
+
+def export_tax_return(period, directory=EXPORT_DIR):
+    """Writes tax_return_<period>.csv and .json into directory and returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for extension, render in (('csv', tax_return_csv), ('json', tax_return_json)):
+        path = os.path.join(directory, f"tax_return_{period}.{extension}")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(render(period))
+        paths.append(path)
+    return paths
+
+def reconcile_tax_return(period, tolerance=RECONCILE_TOLERANCE):
+    """
+    Days and rates of the month where tax_daily and the line items disagree by more than tolerance
+    (empty if the return is consistent), or None for archived months, which have no line items left to compare.
+    """
+    if is_archived(period):
+        return None
+    start_date, end_date = month_bounds(period)
+    query = f"""
+    SELECT tax_date, direction, gst_percent, SUM(aggregate_tax) AS aggregate_tax, SUM(line_tax) AS line_tax,
+           SUM(aggregate_taxable) AS aggregate_taxable, SUM(line_taxable) AS line_taxable
+    FROM (
+        SELECT tax_date, direction, gst_percent, tax_amount AS aggregate_tax, 0 AS line_tax, taxable_amount AS aggregate_taxable, 0 AS line_taxable
+        FROM tax_daily WHERE tax_date BETWEEN ?1 AND ?2
+        UNION ALL
+        SELECT tax_date, direction, gst_percent, 0, tax_amount, 0, taxable_amount FROM ({database.TAX_LINES_SQL}) WHERE tax_date BETWEEN ?1 AND ?2
+    ) GROUP BY tax_date, direction, gst_percent
+    HAVING ABS(SUM(aggregate_tax) - SUM(line_tax)) > ?3 OR ABS(SUM(aggregate_taxable) - SUM(line_taxable)) > ?3
+    ORDER BY tax_date, direction, gst_percent
+    """
+    with closing(db.get_connection()) as conn:
+        return pd.read_sql_query(query, conn, params=(start_date, end_date, tolerance))
+
+def _rebuild_tax_daily(cursor, start_date, end_date):
+    cursor.execute("DELETE FROM tax_daily WHERE tax_date BETWEEN ? AND ?", (start_date, end_date))
+    cursor.execute(f"""
+    INSERT INTO tax_daily (tax_date, direction, gst_percent, taxable_amount, tax_amount, line_count)
+    SELECT tax_date, direction, gst_percent, SUM(taxable_amount), SUM(tax_amount), COUNT(*) FROM ({database.TAX_LINES_SQL})
+    WHERE tax_date BETWEEN ? AND ? GROUP BY 1, 2, 3
+    """, (start_date, end_date))
+
+def rebuild_tax_daily(period):
+    """Recomputes one month of tax_daily from the line items; refused for archived months."""
+    if is_archived(period):
+        return False, f"{period} is archived: its line items are no longer in the database, so its tax totals cannot be rebuilt."
+    db._run_write(_rebuild_tax_daily, *month_bounds(period))
+    return True, f"Tax totals for {period} rebuilt from the bill and purchase lines."
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    database.create_tables()
+    period = sys.argv[1]
+    for path in export_tax_return(period):
+        print(f"Wrote {path}")
+    if '--reconcile' in sys.argv:
+        mismatches = reconcile_tax_return(period)
+        if mismatches is None:
+            print(f"{period} is archived; there are no line items to reconcile with.")
+        else:
+            print("Aggregates match the line items." if mismatches.empty else mismatches.to_string(index=False))
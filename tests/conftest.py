@@ -0,0 +1,39 @@
+# conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+# The application modules live flat in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+    A fresh, empty store database (liquor_store.db) in a temporary working directory. The process-wide
+    writer, read pool, caches and catalogue are reset so they open the new file.
+    """
+    monkeypatch.chdir(tmp_path)
+    import database
+    database.create_tables()
+    if _has_pandas():
+        import catalogue
+        import db_functions as db
+        import writer
+        monkeypatch.setattr(writer, '_instance', None)
+        monkeypatch.setattr(db, '_pool', None)
+        monkeypatch.setattr(db, '_snapshot_taken_at', 0.0)
+        monkeypatch.setattr(db, '_snapshot_counter', None)
+        monkeypatch.setitem(catalogue._state, 'conn', None)
+        db.clear_report_cache()
+        db._stock_holds.clear()
+    yield tmp_path
+    database._schema_ready.discard(str(tmp_path / database.DB_FILE))
+
+def _has_pandas():
+    try:
+        import pandas  # noqa: F401
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
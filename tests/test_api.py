@@ -0,0 +1,58 @@
+# test_api.py
+"""The bill endpoint looks up only the products it bills and answers malformed lines with 400."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("pandas")
+aiohttp = pytest.importorskip("aiohttp")
+
+import db_functions as db
+import loadtest
+
+def _post_bills(*bodies):
+    async def run():
+        async with loadtest.serve_api() as url, aiohttp.ClientSession() as session:
+            responses = []
+            for body in bodies:
+                async with session.post(f"{url}/bills", json=body) as response:
+                    responses.append((response.status, await response.json()))
+            return responses
+    return asyncio.run(run())
+
+@pytest.fixture
+def products(store):
+    for name in ("Test Beer", "Test Cider", "Test Stout"):
+        db.add_product(name, "Beer", "650ml", 100, 180, "Beer", "VAT18")
+    db.execute_query("UPDATE products SET stock = 10")
+    return [row[0] for row in db.execute_query("SELECT id FROM products ORDER BY id", fetch='all')]
+
+def test_bill_looks_up_only_its_products(products, monkeypatch):
+    def full_copy():
+        raise AssertionError("the bill endpoint copied the whole catalogue")
+    monkeypatch.setattr(db, 'get_products', full_copy)
+    body = {'items': [{'product_id': products[1], 'quantity': 2}, {'product_id': products[1], 'quantity': 1, 'rate': 170}]}
+
+    [(status, result)] = _post_bills(body)
+
+    assert status == 201, result
+    assert db.execute_query("SELECT product_id, quantity, rate FROM bill_items ORDER BY id", fetch='all') == [
+        (products[1], 2, 180.0), (products[1], 1, 170.0)]
+
+@pytest.mark.parametrize("item, message", [
+    ({'quantity': "two"}, "Quantities must be whole numbers."),
+    ({'quantity': 1.5}, "Quantities must be whole numbers."),
+    ({'quantity': None}, "Quantities must be whole numbers."),
+    ({'quantity': 0}, "Quantities must be positive."),
+    ({'quantity': 1, 'product_id': "beer"}, "product_id must be a whole number."),
+    ({'quantity': 1, 'rate': "cheap"}, "Rates must be non-negative numbers."),
+])
+def test_malformed_lines_are_rejected_with_400(products, item, message):
+    [(status, result)] = _post_bills({'items': [dict({'product_id': products[0]}, **item)]})
+
+    assert (status, result) == (400, {'error': message})
+    assert db.execute_query("SELECT COUNT(*) FROM bills", fetch='one')[0] == 0
+
+def test_unknown_product_is_404(products):
+    [(status, result)] = _post_bills({'items': [{'product_id': max(products) + 1, 'quantity': 1}]})
+    assert status == 404 and str(max(products) + 1) in result['error']
@@ -0,0 +1,67 @@
+# test_archive_reports.py
+"""Reports read only the archived rows of their date range, straight from the Parquet files."""
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+import archive
+import db_functions as db
+
+@pytest.fixture
+def archived_years(store):
+    db.add_product("Test Brandy", "Brandy", "750ml", 400, 590, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Brandy'", fetch='one')[0]
+    db.update_product_stock(pid, 100)
+    for bill_date in ("2022-05-01", "2023-05-01", "2024-05-01"):
+        items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 590.0, 'gst_percent': 18.0}]))
+        assert db.create_bill(bill_date, "Cash Customer", "Cash", "", items_df, totals)[0]
+    assert archive.archive_financial_year(2022, vacuum=False)[0]
+    return store
+
+def test_reports_read_only_their_archived_range(archived_years, monkeypatch):
+    assert archive.archive_financial_year(2023, vacuum=False)[0]
+    reads = []
+    read = archive.read_archive
+    def recording_read(table, *args, **kwargs):
+        df = read(table, *args, **kwargs)
+        reads.append((table, len(df)))
+        return df
+    monkeypatch.setattr(archive, 'read_archive', recording_read)
+
+    report = db.get_bill_report("2023-04-01", "2024-03-31")
+    assert report['Bill Date'].tolist() == ["2023-05-01"]
+    assert ('bills', 1) in reads and ('bill_items', 1) in reads
+    assert db.get_bill_report("2022-04-01", "2025-03-31")['Bill Date'].tolist() == ["2022-05-01", "2023-05-01", "2024-05-01"]
+    assert not os.path.exists(os.path.join(archive.ARCHIVE_DIR, "archive.db"))
+
+def test_reports_attach_only_their_tables(archived_years, monkeypatch):
+    attached = []
+    attach = db._attach_archived_rows
+    monkeypatch.setattr(db, '_attach_archived_rows', lambda conn, table, *args: (attached.append(table), attach(conn, table, *args)))
+    db.get_product_wise_purchases("2022-04-01", "2025-03-31")
+    assert attached == ['purchase_orders', 'purchase_order_items']
+
+def test_adjustments_are_archived_with_their_bills(store):
+    db.add_product("Test Wine", "Wine", "750ml", 400, 590, "Wine", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Wine'", fetch='one')[0]
+    db.update_product_stock(pid, 100)
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 3, 'rate': 590.0, 'gst_percent': 18.0}]))
+    for _ in range(2):
+        assert db.create_bill("2022-06-01", "Cash Customer", "Cash", "", items_df, totals)[0]
+    returned_in_year, returned_later = (row[0] for row in db.execute_query("SELECT id FROM bills ORDER BY id", fetch='all'))
+    assert db.return_bill_items(returned_in_year, {pid: 1}, adjustment_date="2022-06-02")[0]
+    assert db.return_bill_items(returned_later, {pid: 1}, adjustment_date="2023-06-02")[0]
+    sales_before = db.get_product_wise_sales("2022-04-01", "2024-03-31")
+
+    success, summary = archive.archive_financial_year(2022, vacuum=False)
+    assert success
+    assert summary == {'bills_kept': 1, 'bills': 1, 'bill_adjustments': 1, 'purchase_orders': 0}
+    # No adjustment is left behind without its bill, and the bill returned later is still in the database
+    assert db.execute_query("SELECT COUNT(*) FROM bill_adjustments WHERE bill_id NOT IN (SELECT id FROM bills)", fetch='one')[0] == 0
+    assert db.execute_query("SELECT id FROM bills", fetch='all') == [(returned_later,)]
+    pd.testing.assert_frame_equal(db.get_product_wise_sales("2022-04-01", "2024-03-31"), sales_before)
+    report = db.get_bill_report("2022-04-01", "2024-03-31")
+    assert report.loc[report['Bill No'] == returned_in_year, 'Bill Total'].unique().tolist() == [pytest.approx(1180.0)]
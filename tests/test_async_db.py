@@ -0,0 +1,87 @@
+# test_async_db.py
+"""Concurrent API writes reach the writer queue together and share commits; identical reads share queries."""
+import asyncio
+import time
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import async_db as adb
+import db_functions as db
+import writer
+
+CONCURRENT_BILLS = 40
+BENCHMARK_CALLS = 200
+
+def _vodka():
+    db.add_product("Test Vodka", "Vodka", "750ml", 300, 600, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Vodka'", fetch='one')[0]
+    db.update_product_stock(pid, 1000)
+    return db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 600.0, 'gst_percent': 18.0}]))
+
+def test_concurrent_writes_are_group_committed(store):
+    items_df, totals = _vodka()
+
+    async def burst():
+        return await asyncio.gather(*(adb.create_bill(date.today().isoformat(), "Cash Customer", "Cash", "", items_df, totals)
+                                      for _ in range(CONCURRENT_BILLS)))
+    results = asyncio.run(burst())
+
+    assert all(success for success, _ in results)
+    assert db.execute_query("SELECT COUNT(*) FROM bills", fetch='one')[0] == CONCURRENT_BILLS
+    stats = writer.get_write_queue().stats
+    assert stats['transactions'] < stats['commands']  # several bills per commit
+
+def _bill_count_slowly():
+    count = db.execute_query("SELECT COUNT(*) FROM bills", fetch='one')[0]
+    time.sleep(0.3)  # the query is still in flight while the write below commits
+    return count
+
+def test_reads_after_a_write_do_not_join_older_queries(store):
+    items_df, totals = _vodka()
+
+    async def read_write_read():
+        before = asyncio.ensure_future(adb.run_read(_bill_count_slowly))
+        joined = asyncio.ensure_future(adb.run_read(_bill_count_slowly))
+        await asyncio.sleep(0.05)
+        assert (await adb.create_bill(date.today().isoformat(), "Cash Customer", "Cash", "", items_df, totals))[0]
+        after = await adb.run_read(_bill_count_slowly)
+        return await before, await joined, after
+    stats = adb.get_coalesce_stats()
+    assert asyncio.run(read_write_read()) == (0, 0, 1)
+    assert adb.get_coalesce_stats()['coalesced'] == stats['coalesced'] + 1
+
+def test_concurrency_benchmark(store):
+    """Concurrent API calls against one at a time: identical reports coalesce and bills share commits."""
+    items_df, totals = _vodka()
+    today = date.today().isoformat()
+
+    async def timed(calls):
+        started = time.perf_counter()
+        await asyncio.gather(*calls())
+        return time.perf_counter() - started
+
+    async def benchmark():
+        sequential_bills = time.perf_counter()
+        for _ in range(BENCHMARK_CALLS):
+            await adb.create_bill(today, "Cash Customer", "Cash", "", items_df, totals)
+        sequential_bills = time.perf_counter() - sequential_bills
+        concurrent_bills = await timed(lambda: (adb.create_bill(today, "Cash Customer", "Cash", "", items_df, totals) for _ in range(BENCHMARK_CALLS)))
+        db.clear_report_cache()
+        sequential_reads = time.perf_counter()
+        for _ in range(BENCHMARK_CALLS):
+            db.clear_report_cache()
+            await adb.get_bill_report(today, today)
+        sequential_reads = time.perf_counter() - sequential_reads
+        db.clear_report_cache()
+        concurrent_reads = await timed(lambda: (adb.get_bill_report(today, today) for _ in range(BENCHMARK_CALLS)))
+        return sequential_bills, concurrent_bills, sequential_reads, concurrent_reads
+    sequential_bills, concurrent_bills, sequential_reads, concurrent_reads = asyncio.run(benchmark())
+    print(f"\n{BENCHMARK_CALLS} bills: {BENCHMARK_CALLS / sequential_bills:.0f}/s one at a time, {BENCHMARK_CALLS / concurrent_bills:.0f}/s concurrently; "
+          f"{BENCHMARK_CALLS} bill reports: {sequential_reads * 1000:.0f} ms one at a time, {concurrent_reads * 1000:.0f} ms concurrently")
+
+    assert db.execute_query("SELECT COUNT(*) FROM bills", fetch='one')[0] == 2 * BENCHMARK_CALLS
+    assert concurrent_bills < sequential_bills
+    assert concurrent_reads < sequential_reads
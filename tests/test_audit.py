@@ -0,0 +1,106 @@
+# test_audit.py
+"""Audit times are stored in UTC and filtered and shown by local date; any client can write audited tables."""
+import sqlite3
+import statistics
+import time
+from contextlib import closing, nullcontext
+
+import pytest
+
+pytest.importorskip("pandas")
+if not hasattr(time, 'tzset'):
+    pytest.skip("needs time.tzset to switch the local time zone", allow_module_level=True)
+
+import audit
+import database
+import db_functions as db
+
+@pytest.fixture
+def india_time(monkeypatch):
+    monkeypatch.setenv('TZ', 'Asia/Kolkata')  # UTC+05:30
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_entry_after_local_midnight_belongs_to_the_local_date(store, india_time):
+    conn = sqlite3.connect(db.DB_FILE)
+    conn.execute("INSERT INTO audit_log (changed_at, user, table_name, row_id, action, changes) VALUES ('2026-01-31 20:00:00.000', 'asha', 'products', 1, 'UPDATE', '{}')")
+    conn.commit()
+    conn.close()
+
+    assert audit.get_audit_log(start_date="2026-01-31", end_date="2026-01-31").empty
+    log_df = audit.get_audit_log(start_date="2026-02-01", end_date="2026-02-01")
+    assert log_df['changed_at'].tolist() == ["2026-02-01 01:30:00.000"]
+
+def _audit_rows(table_name):
+    conn = sqlite3.connect(db.DB_FILE)
+    try:
+        return conn.execute("SELECT user, action FROM audit_log WHERE table_name = ? ORDER BY id", (table_name,)).fetchall()
+    finally:
+        conn.close()
+
+def test_any_sqlite_client_can_write_audited_tables(store):
+    database.set_audit_user("asha")
+    try:
+        db.add_product("Vodka", "Plain", "750ml", 100, 150, "Spirits", "VAT18")
+    finally:
+        database.set_audit_user(None)
+    # e.g. the sqlite3 shell, DB Browser or a backup script: no application functions registered
+    conn = sqlite3.connect(db.DB_FILE)
+    conn.execute("UPDATE products SET selling_price = 160")
+    conn.execute("DELETE FROM products")
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM audit_session").fetchone()[0] == 0
+    conn.close()
+
+    assert _audit_rows('products') == [("asha", 'INSERT'), (database.EXTERNAL_AUDIT_USER, 'UPDATE'), (database.EXTERNAL_AUDIT_USER, 'DELETE')]
+
+def test_suspended_writes_are_not_audited(store):
+    db.add_product("Vodka", "Plain", "750ml", 100, 150, "Spirits", "VAT18")
+    with closing(db.get_connection()) as conn, database.audit_suspended():
+        with database.audit_session(conn):
+            conn.execute("DELETE FROM products")
+        conn.commit()
+    assert _audit_rows('products') == [(database.DEFAULT_AUDIT_USER, 'INSERT')]
+
+BENCHMARK_BILLS = 200  # bills per round
+BENCHMARK_ROUNDS = 15  # alternating between the two databases, compared round by round
+
+def _billing_round(conn, items, totals):
+    """Seconds to bill BENCHMARK_BILLS bills in one transaction, which is then rolled back."""
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    for _ in range(BENCHMARK_BILLS):
+        db._as_audit_user(cursor, "asha", db._insert_bill, "2026-01-05", "Cash Customer", "Cash", "", items, totals)
+    elapsed = time.perf_counter() - started
+    conn.rollback()
+    return elapsed
+
+def test_audit_overhead_on_billing(store, monkeypatch):
+    pd = pytest.importorskip("pandas")
+    db.add_product("Vodka", "Plain", "750ml", 100, 150, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Vodka'", fetch='one')[0]
+    db.update_product_stock(pid, 1_000_000)
+    items, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 150.0, 'gst_percent': 18.0}]))
+    # Two identical copies of the store, one without the audit triggers
+    with closing(sqlite3.connect(db.DB_FILE)) as src:
+        for copy in ("audited.db", "unaudited.db"):
+            with closing(sqlite3.connect(copy)) as dst:
+                src.backup(dst)
+    with closing(sqlite3.connect("unaudited.db")) as conn:
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'audit%'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+        conn.commit()
+
+    audited, unaudited = [], []
+    with closing(sqlite3.connect("audited.db")) as audited_conn, closing(sqlite3.connect("unaudited.db")) as unaudited_conn:
+        for _ in range(BENCHMARK_ROUNDS):
+            audited.append(_billing_round(audited_conn, items, totals))
+            with monkeypatch.context() as m:
+                m.setattr(database, 'audit_session', lambda cursor: nullcontext())
+                unaudited.append(_billing_round(unaudited_conn, items, totals))
+    overhead = statistics.median(a / u for a, u in zip(audited, unaudited)) - 1
+    print(f"\n{BENCHMARK_BILLS} bills: {min(audited) * 1000:.1f} ms audited, {min(unaudited) * 1000:.1f} ms without auditing, "
+          f"median overhead {overhead:.1%}")
+    assert overhead < 0.05
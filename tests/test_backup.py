@@ -0,0 +1,76 @@
+# test_backup.py
+"""Backups restore the exact state they were taken at, and a damaged backup never replaces the live data."""
+import gzip
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import backup
+import db_functions as db
+
+@pytest.fixture
+def beer(store):
+    db.add_product("Test Lager", "Beer", "650ml", 90, 180, "Beer", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Lager'", fetch='one')[0]
+    db.update_product_stock(pid, 100)
+    return pid
+
+def _sell(pid, quantity):
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': quantity, 'rate': 180.0, 'gst_percent': 18.0}]))
+    assert db.create_bill("2025-01-10", "Cash Customer", "Cash", "", items_df, totals)[0]
+
+def _state(pid):
+    bills = db.execute_query("SELECT COUNT(*) FROM bills", fetch='one')[0]
+    stock = db.execute_query("SELECT stock FROM products WHERE id = ?", (pid,), fetch='one')[0]
+    return bills, stock
+
+def _backup(label):
+    success, name = backup.create_backup(label=label)
+    assert success, name
+    return name
+
+def test_round_trip_restores_the_backed_up_state(beer):
+    _sell(beer, 2)
+    name = _backup("-a")
+    _sell(beer, 5)
+    assert _state(beer) == (2, 93)
+
+    success, message = backup.restore_backup(name)
+    assert success, message
+    assert _state(beer) == (1, 98)
+    assert db.get_bill_report("2025-01-10", "2025-01-10")['Quantity'].tolist() == [2]  # no stale cached report
+    assert any(name.endswith("-before-restore" + backup.BACKUP_SUFFIX) for name in backup.list_backups()['name'])
+
+def test_restore_to_a_chosen_snapshot(beer):
+    names = []
+    for label, quantity in (("-a", 1), ("-b", 2), ("-c", 3)):
+        _sell(beer, quantity)
+        names.append(_backup(label))
+    assert set(names) <= set(backup.list_backups()['name'])
+
+    assert backup.restore_backup(names[1])[0]
+    assert _state(beer) == (2, 97)
+    assert backup.restore_backup(names[0])[0]
+    assert _state(beer) == (1, 99)
+    assert backup.restore_backup(names[2])[0]
+    assert _state(beer) == (3, 94)
+
+def test_damaged_backup_is_refused(beer):
+    _sell(beer, 2)
+    os.makedirs(backup.BACKUP_DIR, exist_ok=True)
+    name = f"{backup.BACKUP_PREFIX}20250101-000000-damaged{backup.BACKUP_SUFFIX}"
+    with gzip.open(os.path.join(backup.BACKUP_DIR, name), 'wb') as f:
+        f.write(b"not a database" * 100)
+
+    success, message = backup.restore_backup(name)
+    assert not success and "integrity" in message
+    assert _state(beer) == (1, 98)
+    assert not backup.restore_backup("missing.db.gz")[0]
+
+def test_rotation_keeps_the_newest(beer):
+    names = [_backup(f"-{n}") for n in range(4)]  # within one second the label orders them
+    success, newest = backup.create_backup(keep=2, label="-5")
+    assert success
+    assert set(backup.list_backups()['name']) == {names[3], newest}
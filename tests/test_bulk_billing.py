@@ -0,0 +1,81 @@
+# test_bulk_billing.py
+"""Bulk order mode: a pasted order list fills the cart in one step and bills as one large bill."""
+from contextlib import closing
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+from cart import Cart, parse_pasted_lines, set_cart_quantities
+
+PRODUCTS = 300
+
+@pytest.fixture
+def shelf(store):
+    db.add_tax("VAT18", 18.0, "VAT")
+    with closing(db.get_connection()) as conn, conn:
+        conn.executemany("INSERT INTO products (name, size, purchase_price, selling_price, gst_category, barcode1, stock) VALUES (?, '750ml', 100, ?, 'VAT18', ?, 10)",
+                         ((f"SKU {n}", 100 + n, f"890{n:05d}") for n in range(PRODUCTS)))
+    db.clear_report_cache()
+    import catalogue
+    catalogue.invalidate()
+    return db.get_products(), db.get_taxes()
+
+def _paste(cart, text, products_df, taxes_df, session_key="till-1"):
+    """What the Add Lines to Cart button does."""
+    pasted, unreadable = parse_pasted_lines(text)
+    product_ids = db.get_product_ids_by_code(pasted)
+    quantities = {}
+    for code, quantity in pasted.items():
+        if code in product_ids:
+            pid = product_ids[code]
+            quantities[pid] = quantities.get(pid, cart.quantity(pid)) + quantity
+    errors = [f"Could not read line: {line}" for line in unreadable] + [code for code in pasted if code not in product_ids]
+    return errors + set_cart_quantities(cart, quantities, products_df, taxes_df, db.held_by_others(session_key), session_key)
+
+def test_pasted_order_bills_every_line(shelf):
+    products_df, taxes_df = shelf
+    cart = Cart()
+    text = "\n".join(f"890{n:05d}\t{1 + n % 3}" for n in range(PRODUCTS))
+    assert _paste(cart, text, products_df, taxes_df) == []
+    assert len(cart) == PRODUCTS
+    assert sum(cart.quantities().values()) == sum(1 + n % 3 for n in range(PRODUCTS))
+    assert cart.to_frame()['gst_percent'].eq(18.0).all()
+
+    items_df, totals = db.price_bill_items(cart.to_frame())
+    success, message = db.create_bill(date.today().isoformat(), "Cash Customer", "Cash", "", items_df, totals)
+    assert success, message
+    assert db.execute_query("SELECT COUNT(*), SUM(quantity) FROM bill_items", fetch='one') == (PRODUCTS, sum(cart.quantities().values()))
+    assert db.execute_query("SELECT grand_total FROM bills", fetch='one')[0] == pytest.approx(cart.grand_total)
+    assert db.execute_query("SELECT MIN(stock), MAX(stock) FROM products", fetch='one') == (7, 9)
+
+def test_paste_adds_to_the_cart_and_reports_problem_lines(shelf):
+    products_df, taxes_df = shelf
+    cart = Cart()
+    pid = db.get_product_ids_by_code(["89000000"])["89000000"]
+    assert _paste(cart, "89000000 4", products_df, taxes_df) == []
+    errors = _paste(cart, f"89000000 4\n99999999 1\nnot a line at all\n{products_df.index[1]} 11", products_df, taxes_df)
+
+    assert cart.quantity(pid) == 8  # added to the line already in the cart
+    assert products_df.index[1] not in cart  # product id instead of barcode, but more than the stock
+    assert errors == ["Could not read line: not a line at all", "99999999", "SKU 1 (750ml): only 10 available."]
+
+def test_other_carts_holds_limit_the_paste(shelf):
+    products_df, taxes_df = shelf
+    pid = products_df.index[0]
+    assert _paste(Cart(), f"{pid} 7", products_df, taxes_df, session_key="till-1") == []
+    cart = Cart()
+    errors = _paste(cart, f"{pid} 4\n{products_df.index[1]} 2", products_df, taxes_df, session_key="till-2")
+    assert errors == ["SKU 0 (750ml): only 3 available."]
+    assert cart.quantities() == {products_df.index[1]: 2}
+
+def test_zero_quantity_removes_lines(shelf):
+    products_df, taxes_df = shelf
+    cart = Cart()
+    _paste(cart, "89000000 2\n89000001 3", products_df, taxes_df)
+    pid = products_df.index[0]
+    assert set_cart_quantities(cart, {pid: 0}, products_df, taxes_df, {}, "till-1") == []
+    assert pid not in cart and len(cart) == 1
+    assert ("till-1", pid) not in db._stock_holds
@@ -0,0 +1,65 @@
+# test_cart.py
+"""Cart running totals match pricing the whole bill, and pasted order lists are read leniently."""
+import random
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+from cart import Cart, parse_pasted_lines, stock_shortfalls
+
+def _priced_totals(cart):
+    _, totals = db.price_bill_items(cart.to_frame())
+    return totals
+
+def _assert_totals_match(cart):
+    expected = _priced_totals(cart)
+    for key in ('sub_total', 'total_gst', 'grand_total'):
+        assert cart.totals()[key] == pytest.approx(expected[key], abs=1e-6)
+
+def test_running_totals_follow_every_change():
+    cart = Cart()
+    cart.add(1, "Rum", 2, 590.0, 18.0, "VAT18")
+    cart.add(2, "Beer", 6, 180.0, 5.0, "VAT5")
+    _assert_totals_match(cart)
+    assert cart.grand_total == pytest.approx(2 * 590 + 6 * 180)
+
+    cart.add(1, "Rum", 1, 590.0, 18.0, "VAT18")  # same product: one line
+    assert len(cart) == 2 and cart.quantity(1) == 3
+    cart.set_quantity(2, 4)
+    _assert_totals_match(cart)
+    cart.set_quantity(2, 0)
+    assert 2 not in cart and cart.quantities() == {1: 3}
+    _assert_totals_match(cart)
+
+    version = cart.version
+    cart.remove(1)
+    assert cart.totals() == {'sub_total': 0.0, 'total_gst': 0.0, 'grand_total': 0.0}
+    assert cart.version > version
+    cart.remove(1)  # already gone
+    assert cart.to_frame().empty
+
+def test_running_totals_after_many_random_changes():
+    rng = random.Random(0)
+    cart = Cart()
+    for _ in range(2000):
+        pid = rng.randint(1, 300)
+        if rng.random() < 0.7:
+            cart.add(pid, f"P{pid}", rng.randint(1, 5), round(rng.uniform(50, 5000), 2), rng.choice([5.0, 12.0, 18.0, 28.0]), "VAT")
+        elif pid in cart:
+            cart.set_quantity(pid, rng.randint(0, 10))
+    _assert_totals_match(cart)
+    assert list(cart.to_frame()['product_id']) == [line['product_id'] for line in cart]  # order added
+
+def test_parse_pasted_lines():
+    text = "8901\t3\nA-12, 2\n\n  B7  \nA-12;1\n8901 x\nC9 1 2\nD4 0\nE5 -1\n"
+    quantities, unreadable = parse_pasted_lines(text)
+    assert quantities == {'8901': 3, 'A-12': 3, 'B7': 1}
+    assert unreadable == ["8901 x", "C9 1 2", "D4 0", "E5 -1"]
+    assert parse_pasted_lines("") == ({}, [])
+
+def test_stock_shortfalls_count_other_carts():
+    stock = pd.Series({1: 10, 2: 5, 3: 0})
+    shortfalls = stock_shortfalls({1: 8, 2: 5, 3: 0, 4: 1}, stock, held={1: 4, 2: 0})
+    assert shortfalls.to_dict() == {1: 6, 4: 0}
@@ -0,0 +1,54 @@
+# test_catalogue.py
+"""Memory of the shared product catalogue with many sessions pinning different stock versions."""
+import tracemalloc
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import catalogue
+import db_functions as db
+
+SKUS = 50_000
+SESSIONS = 20
+
+@pytest.fixture
+def large_catalogue(store):
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO products (name, type, size, purchase_price, selling_price, category, gst_category, stock) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(f"Product {i}", ("Rum", "Gin", "Beer", "Wine")[i % 4], ("180ml", "375ml", "750ml", "1L")[i % 4 - 1], 100.0, 150.0, "Spirits", "VAT18", 100)
+             for i in range(SKUS)])
+    return store
+
+def test_sessions_on_old_versions_hold_only_their_stock_column(large_catalogue):
+    """Each session keeps the frame of the version current at its last rerun, e.g. while idle."""
+    sessions = []
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        for n in range(SESSIONS):
+            frame = catalogue.get_catalogue().frame
+            sessions.append({'products_df': frame, 'original_products_df': frame})
+            if n == 0:
+                first_version = tracemalloc.get_traced_memory()[0] - base
+            with db.get_connection() as conn:  # a sale between two reruns: a new stock-only version
+                conn.execute("UPDATE products SET stock = stock - 1 WHERE id = ?", (n + 1,))
+        total = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+
+    assert len({id(session['products_df']) for session in sessions}) == SESSIONS
+    per_version = (total - first_version) / (SESSIONS - 1)
+    print(f"\n{SKUS} SKUs x {SESSIONS} sessions: first version {first_version / 2**20:.1f} MB, "
+          f"{per_version / 2**20:.2f} MB per further version, {total / 2**20:.1f} MB in all")
+    assert per_version < 2 * SKUS * 8  # about one int64 stock column per version
+
+def test_stock_only_version_frame_matches_a_full_load(large_catalogue):
+    catalogue.get_catalogue().frame
+    with db.get_connection() as conn:
+        conn.execute("UPDATE products SET stock = 7 WHERE id = 3")
+    derived = catalogue.get_catalogue().frame
+    catalogue.invalidate()
+    pd.testing.assert_frame_equal(derived, catalogue.get_catalogue().frame)
+    assert derived.loc[3, 'stock'] == 7
@@ -0,0 +1,113 @@
+# test_customer_stats.py
+"""customer_stats is filled from the bills once, when the table is created, and not on later schema upgrades."""
+import sqlite3
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import database
+import db_functions as db
+
+@pytest.fixture
+def sales(store):
+    db.add_product("Test Rum", "Rum", "750ml", 400, 800, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Rum'", fetch='one')[0]
+    db.update_product_stock(pid, 100)
+    db.add_customer("Asha", "", "", "", "", "", "9800000001", "")
+    today = date.today().isoformat()
+    bill_ids = []
+    for quantity in (3, 2):
+        items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': quantity, 'rate': 800.0, 'gst_percent': 18.0}]))
+        assert db.create_bill(today, "Asha", "Cash", "", items_df, totals)[0]
+        bill_ids.append(db.execute_query("SELECT MAX(id) FROM bills", fetch='one')[0])
+    assert db.return_bill_items(bill_ids[0], {pid: 1})[0]
+    assert db.void_bill(bill_ids[1])[0]
+    return store
+
+def _stats():
+    return db.execute_query("SELECT bill_count, lifetime_spend FROM customer_stats", fetch='all')
+
+def _rerun_schema_upgrade():
+    conn = sqlite3.connect(database.DB_FILE)
+    conn.execute("PRAGMA user_version = 0")  # e.g. an older backup being restored
+    conn.commit()
+    conn.close()
+    database._schema_ready.clear()
+    database.create_tables()
+
+def test_schema_upgrade_keeps_netted_stats(sales):
+    assert _stats() == [(1, pytest.approx(1600.0))]
+    _rerun_schema_upgrade()
+    assert _stats() == [(1, pytest.approx(1600.0))]
+
+def test_new_table_is_filled_net_of_adjustments(sales):
+    before = _stats()
+    db.execute_query("DROP TABLE customer_stats")
+    _rerun_schema_upgrade()
+    assert _stats() == before
+
+def _visits():
+    return db.execute_query("SELECT bill_count, first_visit, last_visit FROM customer_stats", fetch='one')
+
+def _bill_asha(pid, day):
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 800.0, 'gst_percent': 18.0}]))
+    assert db.create_bill(day, "Asha", "Cash", "", items_df, totals)[0]
+    return db.execute_query("SELECT MAX(id) FROM bills", fetch='one')[0], items_df, totals
+
+@pytest.fixture
+def asha(store):
+    db.add_product("Test Rum", "Rum", "750ml", 400, 800, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Rum'", fetch='one')[0]
+    db.update_product_stock(pid, 10)
+    db.add_customer("Asha", "", "", "", "", "", "9800000001", "")
+    return pid
+
+def _stock(pid):
+    return db.execute_query("SELECT stock FROM products WHERE id = ?", (pid,), fetch='one')[0]
+
+def test_voided_bill_cannot_be_edited(asha):
+    bill_id, items_df, totals = _bill_asha(asha, '2025-01-10')
+    assert db.void_bill(bill_id)[0]
+    stats, stock = _stats(), _stock(asha)
+
+    success, message = db.update_bill(bill_id, '2025-01-10', "Asha", "Cash", "", items_df, totals)
+    assert not success and "voided" in message
+    assert _stats() == stats and _stock(asha) == stock
+    assert db.get_bill_report('2025-01-10', '2025-01-10', fresh=True)['Bill Total'].iloc[0] == pytest.approx(0)
+
+def test_voided_bill_cannot_be_returned_or_voided_again(asha):
+    bill_id, _, _ = _bill_asha(asha, '2025-01-10')
+    assert db.void_bill(bill_id)[0]
+    stats, stock = _stats(), _stock(asha)
+
+    success, message = db.return_bill_items(bill_id, {asha: 1})
+    assert not success and "voided" in message
+    assert not db.void_bill(bill_id)[0]
+    assert _stats() == stats and _stock(asha) == stock
+
+def test_void_moves_first_and_last_visit(asha):
+    first, _, _ = _bill_asha(asha, '2025-01-10')
+    _bill_asha(asha, '2025-02-10')
+    last, _, _ = _bill_asha(asha, '2025-03-10')
+    assert db.void_bill(last)[0]
+    assert _visits() == (2, '2025-01-10', '2025-02-10')
+    assert db.void_bill(first)[0]
+    assert _visits() == (1, '2025-02-10', '2025-02-10')
+
+def test_voiding_the_last_bill_clears_the_visits(asha):
+    bill_id, _, _ = _bill_asha(asha, '2025-01-10')
+    assert db.void_bill(bill_id)[0]
+    assert _visits() == (0, None, None)
+    assert _stats() == [(0, pytest.approx(0))]
+
+def test_customer_search_reuses_pooled_connections(store):
+    db.add_customer("Asha", "", "", "", "", "", "9800000001", "")
+    db.add_customer("Ashok", "", "", "", "", "", "9800000002", "")
+    pool = db.get_connection_pool()
+    for prefix in ("9", "98", "a", "as", "ash", "asho"):  # one search per keystroke
+        db.search_customers(prefix)
+    assert pool.stats['opened'] == 1
+    assert db.search_customers("ASH")['name'].tolist() == ["Asha", "Ashok"]
+    assert db.search_customers("980000000")['mobile'].tolist() == ["9800000001", "9800000002"]
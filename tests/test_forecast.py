@@ -0,0 +1,71 @@
+# test_forecast.py
+"""The forecast fits thousands of products quickly and picks up bills written for days it has already fitted."""
+import time
+from contextlib import closing
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+import forecast
+
+SKUS = 5000
+DAYS = 3 * 365
+LINES_PER_DAY = 500  # products sold on a day, each on its own bill line
+MAX_FIT_SECONDS = 30
+
+@pytest.fixture(autouse=True)
+def no_model(monkeypatch):
+    monkeypatch.setattr(forecast, '_model', None)
+
+def _fill(skus, days, lines_per_day):
+    rng = np.random.default_rng(0)
+    first_day = date.today() - timedelta(days=days)
+    with closing(db.get_connection()) as conn, conn:
+        conn.executemany("INSERT INTO products (id, name, size, purchase_price, selling_price, gst_category) VALUES (?, ?, '750ml', 100, 150, 'VAT18')",
+                         ((pid, f"SKU {pid}") for pid in range(1, skus + 1)))
+        for day in range(days):
+            bill_id = conn.execute("INSERT INTO bills (bill_date, customer_name, pay_mode, grand_total) VALUES (?, 'Cash Customer', 'Cash', 0)",
+                                   ((first_day + timedelta(days=day)).isoformat(),)).lastrowid
+            pids = rng.choice(skus, lines_per_day, replace=False) + 1
+            conn.executemany("INSERT INTO bill_items (bill_id, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, ?, ?, 150, 18, 0, 150)",
+                             ((bill_id, int(pid), int(quantity)) for pid, quantity in zip(pids, rng.integers(1, 5, lines_per_day))))
+
+def test_benchmark_full_fit_and_incremental_update(store):
+    _fill(SKUS, DAYS, LINES_PER_DAY)
+    started = time.perf_counter()
+    totals = forecast.get_forecast_totals()
+    full_fit = time.perf_counter() - started
+    started = time.perf_counter()
+    forecast.get_forecast_totals()
+    refresh = time.perf_counter() - started
+    print(f"\n{SKUS} SKUs x {DAYS} days: full fit {full_fit:.2f} s, next call {refresh * 1000:.0f} ms")
+
+    assert len(totals) == SKUS and (totals > 0).all()
+    assert full_fit < MAX_FIT_SECONDS
+    assert refresh < full_fit
+
+def test_backdated_bill_refits_the_model(store):
+    _fill(3, 60, 3)
+    before = forecast.get_forecast_totals()
+    fitted = forecast._model
+
+    # An offline bill synced today for last week: a big sale of product 1
+    with closing(db.get_connection()) as conn, conn:
+        bill_id = conn.execute("INSERT INTO bills (bill_date, customer_name, pay_mode, grand_total) VALUES (?, 'Cash Customer', 'Cash', 0)",
+                               ((date.today() - timedelta(days=7)).isoformat(),)).lastrowid
+        conn.execute("INSERT INTO bill_items (bill_id, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, 1, 500, 150, 18, 0, 150)", (bill_id,))
+    after = forecast.get_forecast_totals()
+    assert forecast._model is not fitted
+    assert after[1] > before[1]
+    assert after[2] == pytest.approx(before[2])
+
+    # A bill for today is not a fitted day yet and keeps the model
+    fitted = forecast._model
+    with closing(db.get_connection()) as conn, conn:
+        conn.execute("INSERT INTO bills (bill_date, customer_name, pay_mode, grand_total) VALUES (?, 'Cash Customer', 'Cash', 0)", (date.today().isoformat(),))
+    forecast.get_forecast_totals()
+    assert forecast._model is fitted
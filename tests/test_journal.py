@@ -0,0 +1,128 @@
+# test_journal.py
+"""Offline journal: bills made while the database is locked are kept and replayed exactly once."""
+import sqlite3
+import threading
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+import journal
+import writer
+
+BURST_BILLS = 120
+TERMINALS = 6
+
+@pytest.fixture
+def product(store, monkeypatch):
+    monkeypatch.setattr(writer, 'BUSY_TIMEOUT_MS', 200)  # give up on the lock quickly
+    db.add_product("Test Whisky", "Whisky", "750ml", 500, 1000, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Whisky'", fetch='one')[0]
+    db.update_product_stock(pid, 10_000)
+    return pid
+
+def _items(pid, quantity=1, rate=1000.0):
+    items_df = pd.DataFrame([{'product_id': pid, 'quantity': quantity, 'rate': rate, 'gst_percent': 18.0}])
+    return db.price_bill_items(items_df)
+
+def _journal_bill(pid, bill_date):
+    items_df, totals = _items(pid)
+    bill_uuid = uuid.uuid4().hex
+    journal.record_bill(bill_uuid, bill_date, "Cash Customer", "Cash", "", db._param_rows(items_df, db.BILL_ITEM_COLUMNS),
+                        {k: float(v) for k, v in totals.items()})
+    return bill_uuid
+
+def _bill_count(where="1"):
+    return db.execute_query(f"SELECT COUNT(*) FROM bills WHERE {where}", fetch='one')[0]
+
+def test_locked_database_burst_is_journaled_and_replayed_once(product):
+    items_df, totals = _items(product)
+    results = []
+    blocker = sqlite3.connect(db.DB_FILE)
+    blocker.execute("BEGIN EXCLUSIVE")  # e.g. a backup tool or another process holding the file
+    try:
+        def terminal():
+            for _ in range(BURST_BILLS // TERMINALS):
+                results.append(db.create_bill(date.today().isoformat(), "Cash Customer", "Cash", "", items_df, totals))
+        threads = [threading.Thread(target=terminal) for _ in range(TERMINALS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+    assert len(results) == BURST_BILLS
+    assert all(success and "saved offline" in message for success, message in results)
+    assert len(journal.pending_bills()) == BURST_BILLS
+    assert _bill_count() == 0
+
+    assert journal.replay_pending() == BURST_BILLS
+    assert _bill_count() == BURST_BILLS
+    assert not journal.has_pending()
+    assert journal.replay_pending() == 0
+    assert _bill_count() == BURST_BILLS
+
+def test_refused_bill_is_quarantined_without_blocking_the_others(product):
+    closed_day = (date.today() - timedelta(days=2)).isoformat()
+    open_day = (date.today() - timedelta(days=1)).isoformat()
+    for day in (closed_day, date.today().isoformat()):
+        assert db.close_day(day)[0]
+    refused = _journal_bill(product, closed_day)  # its day and today are closed: can never be booked
+    accepted = _journal_bill(product, open_day)
+
+    assert journal.replay_pending() == 1
+    assert _bill_count(f"bill_uuid = '{accepted}'") == 1
+    quarantined = journal.quarantined_bills()
+    assert [entry['bill_uuid'] for entry in quarantined] == [refused]
+    assert "closed" in quarantined[0]['error']
+    assert not journal.has_pending()
+
+def test_bills_appended_during_a_replay_are_not_lost(product, monkeypatch):
+    _journal_bill(product, date.today().isoformat())
+    late = []
+    apply = db.apply_journaled_bills
+
+    def apply_while_another_process_appends(entries):
+        if not late:
+            late.append(_journal_bill(product, date.today().isoformat()))
+        return apply(entries)
+    monkeypatch.setattr(db, 'apply_journaled_bills', apply_while_another_process_appends)
+
+    assert journal.replay_pending() == 1
+    assert [entry['bill_uuid'] for entry in journal.pending_bills()] == late
+    assert journal.replay_pending() == 1
+    assert _bill_count() == 2
+    assert not journal.has_pending()
+
+def test_replay_never_raises(product, monkeypatch):
+    _journal_bill(product, date.today().isoformat())
+    def broken(entries):
+        raise RuntimeError("unexpected")
+    monkeypatch.setattr(db, 'apply_journaled_bills', broken)
+    assert journal.replay_pending() == 0
+    assert len(journal.pending_bills()) == 1
+
+def test_other_database_errors_are_raised_not_journaled(product):
+    items_df, totals = _items(product)
+    db.execute_query("DROP TABLE bill_items")  # e.g. a broken schema: replaying would fail the same way
+    with pytest.raises(sqlite3.OperationalError, match="bill_items"):
+        db.create_bill(date.today().isoformat(), "Cash Customer", "Cash", "", items_df, totals)
+    assert not journal.has_pending()
+
+def test_replay_notes_bills_sold_beyond_stock(product):
+    db.update_product_stock(product, -9_999)  # 1 left
+    items_df, totals = _items(product, quantity=3)
+    bill_uuid = uuid.uuid4().hex
+    journal.record_bill(bill_uuid, date.today().isoformat(), "Cash Customer", "Cash", "counter", db._param_rows(items_df, db.BILL_ITEM_COLUMNS),
+                        {k: float(v) for k, v in totals.items()})
+    _journal_bill(product, date.today().isoformat())  # stock is short for this one too once the first is in
+
+    assert journal.replay_pending() == 2
+    remarks = [row[0] for row in db.execute_query("SELECT remarks FROM bills ORDER BY id", fetch='all')]
+    assert remarks == [f"counter (sold offline beyond stock: product ID(s) {product})", f"(sold offline beyond stock: product ID(s) {product})"]
+    assert db.execute_query("SELECT stock FROM products WHERE id = ?", (product,), fetch='one')[0] == -3
@@ -0,0 +1,25 @@
+# test_loadtest.py
+"""The API load test sustains bills from several terminals and every confirmed bill is in the database."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("aiohttp")
+
+import db_functions as db
+import loadtest
+
+def test_terminals_sustain_bills(store):
+    for name in ("Test Beer", "Test Cider", "Test Stout"):
+        db.add_product(name, "Beer", "650ml", 100, 180, "Beer", "VAT18")
+    db.execute_query("UPDATE products SET stock = 10000")
+
+    async def run():
+        async with loadtest.serve_api() as url:
+            return await loadtest.run_load_test(url, terminals=4, seconds=2)
+    stats = asyncio.run(run())
+
+    assert stats['failed'] == 0, stats['first_failure']
+    assert stats['bills'] > 0 and stats['bills_per_second'] > 0
+    assert db.execute_query("SELECT COUNT(*) FROM bills", fetch='one')[0] == stats['bills']
@@ -0,0 +1,66 @@
+# test_po_lines.py
+"""PO grid lines take their rate, stock and tax from the right place, and price into the saved PO."""
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+
+@pytest.fixture
+def catalogue_frames(store):
+    db.add_tax("VAT18", 18.0, "VAT")
+    db.add_tax("VAT5", 5.0, "VAT")
+    db.add_product("Test Rum", "Rum", "750ml", 400, 600, "Spirits", "VAT18")
+    db.add_product("Test Beer", "Beer", "650ml", 90, 150, "Beer", "VAT5")
+    db.add_product("Test Mixer", "Soda", "300ml", 10, 20, "Mixers", "EXEMPT")  # no tax_config row
+    ids = {name: db.execute_query("SELECT id FROM products WHERE name = ?", (name,), fetch='one')[0] for name in ("Test Rum", "Test Beer", "Test Mixer")}
+    db.update_product_stock(ids["Test Rum"], 7)
+    return db.get_products(), db.get_taxes(), ids
+
+def test_rates_and_taxes_of_each_kind_of_line(catalogue_frames):
+    products_df, taxes_df, ids = catalogue_frames
+    po_items = [
+        {'product_id': ids["Test Rum"], 'quantity': 3},  # new line: the product's purchase price
+        {'product_id': ids["Test Beer"], 'quantity': 24, 'rate': 85.0, 'po_item_id': 11},  # saved line keeps its rate
+        {'product_id': ids["Test Mixer"], 'quantity': 10, 'rate': 9.5},  # drafted from the last purchase
+        {'product_id': None},  # the empty line a new PO starts with
+    ]
+    lines = db.po_lines(po_items, products_df, taxes_df)
+
+    assert lines['rate'].tolist()[:3] == [400.0, 85.0, 9.5]
+    assert lines['gst_percent'].tolist() == [18.0, 5.0, 0.0, 0.0]
+    assert lines['quantity'].tolist() == [3, 24, 10, 1]
+    assert lines['stock'].tolist()[:3] == [7, 0, 0]
+    assert lines['selling_price'].tolist()[:3] == [600.0, 150.0, 20.0]
+    assert lines.loc[3, ['rate', 'stock']].isna().all()
+
+def test_lines_price_into_the_saved_po(catalogue_frames):
+    products_df, taxes_df, ids = catalogue_frames
+    db.add_vendor("Depot", "", "", "", "", "", "9000000000", "", "")
+    vendor_id = db.execute_query("SELECT id FROM vendors", fetch='one')[0]
+    lines = db.po_lines([{'product_id': ids["Test Rum"], 'quantity': 3}, {'product_id': ids["Test Beer"], 'quantity': 24, 'rate': 85.0}],
+                        products_df, taxes_df)
+    items_df, totals = db.price_purchase_items(lines[['product_id', 'quantity', 'rate', 'gst_percent']].astype({'product_id': 'int64'}), 1.0)
+
+    amount = 3 * 400 + 24 * 85
+    gst = 3 * 400 * 0.18 + 24 * 85 * 0.05
+    assert totals['total_amount'] == pytest.approx(amount)
+    assert totals['total_gst'] == pytest.approx(gst)
+    assert totals['grand_total'] == pytest.approx((amount + gst) * 1.01)
+
+    assert db.create_purchase_order(vendor_id, "2025-01-10", "INV-1", "", items_df, totals)[0]
+    po_id = db.execute_query("SELECT id FROM purchase_orders", fetch='one')[0]
+    _, saved = db.get_purchase_order_details(po_id)
+    assert saved[['quantity', 'rate', 'gst_percent']].values.tolist() == [[3, 400.0, 18.0], [24, 85.0, 5.0]]
+    assert db.execute_query("SELECT stock FROM products WHERE id = ?", (ids["Test Rum"],), fetch='one')[0] == 10
+
+    # Editing the saved PO: its lines keep the saved rate even after the purchase price changes
+    products_df.loc[ids["Test Rum"], 'purchase_price'] = 450.0
+    assert db.po_lines(saved.to_dict('records'), products_df, taxes_df)['rate'].tolist() == [400.0, 85.0]
+
+def test_lines_of_deleted_products_have_no_details(catalogue_frames):
+    products_df, taxes_df, ids = catalogue_frames
+    lines = db.po_lines([{'product_id': 99999, 'quantity': 2}, {'product_id': ids["Test Rum"], 'quantity': 1}, {'product_id': ids["Test Rum"], 'quantity': 4}],
+                        products_df, taxes_df)
+    assert lines.loc[0, ['rate', 'stock', 'selling_price']].isna().all() and lines.loc[0, 'gst_percent'] == 0
+    assert lines['rate'].tolist()[1:] == [400.0, 400.0] and lines['quantity'].tolist() == [2, 1, 4]
@@ -0,0 +1,109 @@
+# test_reorder.py
+"""Reorder points from blended sales velocity, the incremental daily sales table, and PO drafts."""
+import math
+from contextlib import closing
+from datetime import date, timedelta
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+import reorder
+
+@pytest.fixture(autouse=True)
+def fresh_sales(monkeypatch):
+    monkeypatch.setattr(reorder, '_sales_state', {'last_line_id': 0, 'line_count': 0, 'last_adjustment_id': 0, 'daily': None})
+
+@pytest.fixture
+def whisky(store):
+    db.add_product("Test Whisky", "Whisky", "750ml", 400, 800, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Whisky'", fetch='one')[0]
+    db.add_vendor("Depot", "", "", "", "", "", "9000000000", "", "")
+    vendor_id = db.execute_query("SELECT id FROM vendors", fetch='one')[0]
+    items_df, totals = db.price_purchase_items(pd.DataFrame([{'product_id': pid, 'quantity': 19, 'rate': 420.0, 'gst_percent': 18.0}]), 1.0)
+    db.create_purchase_order(vendor_id, (date.today() - timedelta(days=20)).isoformat(), "INV", "", items_df, totals)
+    return pid, vendor_id
+
+def _days_ago(days):
+    return (date.today() - timedelta(days=days)).isoformat()
+
+def _sell(pid, quantity, days_ago):
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': quantity, 'rate': 800.0, 'gst_percent': 18.0}]))
+    assert db.create_bill(_days_ago(days_ago), "Cash Customer", "Cash", "", items_df, totals)[0]
+    return db.execute_query("SELECT MAX(id) FROM bills", fetch='one')[0]
+
+def _daily_sales():
+    with closing(db.get_connection()) as conn:
+        return reorder._daily_sales(conn)
+
+def _rebuilt():
+    """The daily table read from scratch, to compare the incremental one with."""
+    state = dict(reorder._sales_state)
+    reorder._sales_state.update(last_line_id=0, line_count=0, last_adjustment_id=0, daily=None)
+    try:
+        return _daily_sales()
+    finally:
+        reorder._sales_state.update(state)
+
+def test_appended_lines_are_added_incrementally(whisky):
+    pid, _ = whisky
+    _sell(pid, 2, 1)
+    assert _daily_sales()[(pid, _days_ago(1))] == 2
+    _sell(pid, 3, 1)
+    _sell(pid, 1, 2)
+    daily = _daily_sales()
+    assert daily[(pid, _days_ago(1))] == 5 and daily[(pid, _days_ago(2))] == 1
+    pd.testing.assert_series_equal(daily, _rebuilt(), check_dtype=False)
+
+def test_deleted_lines_rebuild_the_table(whisky):
+    pid, _ = whisky
+    bill_id = _sell(pid, 2, 1)
+    _sell(pid, 3, 2)
+    _daily_sales()
+    # Archiving deletes old bills and their lines
+    db.execute_query("DELETE FROM bill_items WHERE bill_id = ?", (bill_id,))
+    _sell(pid, 1, 2)
+    daily = _daily_sales()
+    assert (pid, _days_ago(1)) not in daily.index or daily[(pid, _days_ago(1))] == 0
+    assert daily[(pid, _days_ago(2))] == 4
+    pd.testing.assert_series_equal(daily, _rebuilt(), check_dtype=False)
+
+def test_returns_are_netted_on_their_own_day(whisky):
+    pid, _ = whisky
+    bill_id = _sell(pid, 3, 2)
+    _daily_sales()
+    assert db.return_bill_items(bill_id, {pid: 1}, adjustment_date=_days_ago(1))[0]
+    daily = _daily_sales()
+    assert daily[(pid, _days_ago(2))] == 3 and daily[(pid, _days_ago(1))] == -1
+    pd.testing.assert_series_equal(daily, _rebuilt(), check_dtype=False)
+
+def test_reorder_point_and_suggested_quantity(whisky):
+    pid, vendor_id = whisky
+    for days_ago in (1, 2, 3, 4, 5, 6, 6):
+        _sell(pid, 2, days_ago)  # 14 sold this week, stock 19 -> 5
+    row = reorder.get_reorder_suggestions().loc[pid]
+
+    velocity = 0.5 * 14 / 7 + 0.3 * 14 / 30 + 0.2 * 14 / 90
+    reorder_point = math.ceil(velocity * (reorder.LEAD_TIME_DAYS + reorder.SAFETY_DAYS))
+    order_up_to = reorder_point + math.ceil(velocity * reorder.DEFAULT_COVER_DAYS)  # one purchase: no interval yet
+    assert (row['sold_7d'], row['sold_30d'], row['sold_90d']) == (14, 14, 14)
+    assert row['velocity'] == pytest.approx(velocity, abs=0.005)
+    assert row['reorder_point'] == reorder_point
+    assert row['suggested_qty'] == order_up_to - 5
+    assert row['vendor_id'] == vendor_id and row['last_rate'] == 420.0
+
+def test_nothing_is_suggested_above_the_reorder_point(whisky):
+    pid, _ = whisky
+    _sell(pid, 1, 3)
+    assert pid not in reorder.get_reorder_suggestions().index
+    assert reorder.get_reorder_suggestions(only_needed=False).loc[pid, 'suggested_qty'] == 0
+
+def test_draft_purchase_order_carries_the_last_rate(whisky):
+    pid, vendor_id = whisky
+    for days_ago in (1, 2, 3, 4, 5, 6, 6):
+        _sell(pid, 2, days_ago)
+    suggestions = reorder.get_reorder_suggestions()
+    items = reorder.draft_purchase_order(suggestions, vendor_id)
+    assert items == [{'product_id': pid, 'quantity': int(suggestions.loc[pid, 'suggested_qty']), 'rate': 420.0}]
+    assert reorder.draft_purchase_order(suggestions, vendor_id + 1) == []
@@ -0,0 +1,50 @@
+# test_report_cache.py
+"""Cached reports are shared until a write invalidates them; fresh=True always reads the database."""
+import contextlib
+import sqlite3
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+
+def test_fresh_bill_report_bypasses_the_cache(store):
+    db.add_product("Test Tequila", "Tequila", "750ml", 900, 1800, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Tequila'", fetch='one')[0]
+    db.update_product_stock(pid, 10)
+    today = date.today().isoformat()
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 1800.0, 'gst_percent': 18.0}]))
+    assert db.create_bill(today, "Cash Customer", "Cash", "", items_df, totals)[0]
+    assert len(db.get_bill_report(today, today, fresh=True)) == 1
+
+    # A bill written by another process does not invalidate this process's cache
+    conn = sqlite3.connect(db.DB_FILE)
+    bill_id = conn.execute("INSERT INTO bills (bill_date, customer_name, pay_mode, sub_total, total_gst, grand_total) VALUES (?, 'Cash Customer', 'Cash', 1525.42, 274.58, 1800)",
+                           (today,)).lastrowid
+    conn.execute("INSERT INTO bill_items (bill_id, product_id, quantity, rate, gst_percent, gst_amount, amount) VALUES (?, ?, 1, 1800, 18, 274.58, 1800)", (bill_id, pid))
+    conn.commit()
+    conn.close()
+
+    assert len(db.get_bill_report(today, today, fresh=True)) == 2
+
+def _sell_one(pid, day):
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 1800.0, 'gst_percent': 18.0}]))
+    assert db.create_bill(day, "Cash Customer", "Cash", "", items_df, totals)[0]
+
+def _closing_stock(day):
+    report = db.get_stock_report_with_dates(day, day)
+    return int(report.loc[report['Product Name'] == 'Test Tequila', 'Closing Stock'].iloc[0])
+
+@pytest.mark.parametrize('heavy', [False, True], ids=['operational', 'report-job'])
+def test_reads_after_each_write_see_it(store, heavy):
+    db.add_product("Test Tequila", "Tequila", "750ml", 900, 1800, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Tequila'", fetch='one')[0]
+    db.update_product_stock(pid, 10)
+    today = date.today().isoformat()
+    with db.heavy_report_reads() if heavy else contextlib.nullcontext():
+        for sold in (1, 2, 3):
+            _sell_one(pid, today)
+            assert len(db.get_bill_report(today, today)) == sold
+            assert _closing_stock(today) == 10 - sold
@@ -0,0 +1,38 @@
+# test_report_executor.py
+"""Finished report jobs are reused only until a write touches the tables they read."""
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+from report_executor import ReportExecutor
+
+def _sell_one(pid, day):
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 150.0, 'gst_percent': 18.0}]))
+    assert db.create_bill(day, "Cash Customer", "Cash", "", items_df, totals)[0]
+
+def test_a_bill_written_after_a_report_shows_in_the_next_submit(store):
+    db.add_product("Test Rum", "Rum", "750ml", 100, 150, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Rum'", fetch='one')[0]
+    db.update_product_stock(pid, 10)
+    today = date.today().isoformat()
+    executor = ReportExecutor()
+    _sell_one(pid, today)
+    first = executor.submit('Bills', db.get_bill_report, today, today)
+    assert len(first.result()) == 1
+    assert executor.submit('Bills', db.get_bill_report, today, today) is first  # nothing written since
+
+    _sell_one(pid, today)
+    second = executor.submit('Bills', db.get_bill_report, today, today)
+    assert second is not first
+    assert len(second.result()) == 2
+
+def test_finished_jobs_expire_after_the_cache_ttl(store, monkeypatch):
+    today = date.today().isoformat()
+    executor = ReportExecutor()
+    first = executor.submit('Bills', db.get_bill_report, today, today)
+    first.result()
+    monkeypatch.setattr(db, 'REPORT_CACHE_TTL', 0)
+    assert executor.submit('Bills', db.get_bill_report, today, today) is not first
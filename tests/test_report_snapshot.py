@@ -0,0 +1,82 @@
+# test_report_snapshot.py
+"""The reporting snapshot must finish, and keep billing latency low, while the till commits constantly."""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pandas")
+
+import db_functions as db
+
+BILL_INTERVAL = 0.02  # one bill every 20 ms
+MAX_SNAPSHOT_SECONDS = 10
+MAX_BILL_LATENCY = 1.0  # seconds one commit may wait for the snapshot
+
+def _fill(db_file, rows=200_000):
+    """About 40 MB of bills, enough for a paged copy to need hundreds of steps."""
+    with sqlite3.connect(db_file) as conn:
+        conn.executemany("INSERT INTO bills (bill_date, customer_name, pay_mode, remarks, sub_total, total_gst, grand_total) VALUES ('2024-01-01', ?, 'Cash', ?, 100, 18, 118)",
+                         ((f"Customer {i}", "x" * 150) for i in range(rows)))
+
+def _bill_continuously(db_file, stop, latencies):
+    with sqlite3.connect(db_file, timeout=30) as conn:
+        while not stop.is_set():
+            started = time.perf_counter()
+            conn.execute("INSERT INTO bills (bill_date, customer_name, pay_mode, sub_total, total_gst, grand_total) VALUES ('2024-01-02', 'Till', 'Cash', 1, 0, 1)")
+            conn.commit()
+            latencies.append(time.perf_counter() - started)
+            time.sleep(BILL_INTERVAL)
+
+def test_snapshot_finishes_under_steady_billing(store):
+    _fill(db.DB_FILE)
+    stop, latencies = threading.Event(), []
+    till = threading.Thread(target=_bill_continuously, args=(db.DB_FILE, stop, latencies))
+    till.start()
+    result = []
+    try:
+        time.sleep(0.2)
+        # On a thread, so a copy that never finishes fails the test instead of hanging it
+        snapshot = threading.Thread(target=lambda: result.append(db.refresh_report_snapshot(force=True)), daemon=True)
+        snapshot.start()
+        snapshot.join(MAX_SNAPSHOT_SECONDS)
+    finally:
+        stop.set()
+        till.join()
+
+    assert result == [True], f"snapshot not finished after {MAX_SNAPSHOT_SECONDS} s of steady billing"
+    assert len(latencies) > 10
+    assert max(latencies) < MAX_BILL_LATENCY
+    with sqlite3.connect(db.REPORT_SNAPSHOT_FILE) as conn:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        assert conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0] >= 200_000
+
+def test_reports_keep_the_old_snapshot_while_a_refresh_runs(store):
+    db.refresh_report_snapshot(force=True)
+    with db._snapshot_lock:  # another thread is copying
+        db._snapshot_taken_at = 0.0
+        assert db.refresh_report_snapshot() is False
+
+def test_billing_stays_fast_while_a_full_year_report_runs(store):
+    import pandas as pd
+    from report_executor import ReportExecutor
+    _fill(db.DB_FILE)
+    db.add_product("Till Rum", "Rum", "750ml", 100, 150, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Till Rum'", fetch='one')[0]
+    db.update_product_stock(pid, 1_000_000)
+    with sqlite3.connect(db.DB_FILE) as conn:
+        conn.execute("INSERT INTO bill_items (bill_id, product_id, quantity, rate, gst_percent, gst_amount, amount) SELECT id, ?, 1, 100, 18, 18, 118 FROM bills", (pid,))
+    items, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 150, 'gst_percent': 18}]))
+    executor = ReportExecutor()
+    job = executor.submit('Bills', db.get_bill_report, '2024-01-01', '2024-12-31')
+    latencies = []
+    while not job.done():
+        started = time.perf_counter()
+        success, message = db.create_bill('2024-01-02', "Cash Customer", "Cash", "", items, totals)
+        latencies.append(time.perf_counter() - started)
+        assert success, message
+
+    assert len(job.result()) >= 200_000
+    assert len(latencies) > 5, "report finished before billing could be measured"
+    assert max(latencies) < MAX_BILL_LATENCY
@@ -0,0 +1,50 @@
+# test_stock_holds.py
+"""Open carts hold stock against each other until they expire or check out."""
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+
+@pytest.fixture
+def last_unit(store):
+    db.add_product("Test Brandy", "Brandy", "750ml", 500, 1000, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Brandy'", fetch='one')[0]
+    db.update_product_stock(pid, 1)
+    return pid
+
+def test_two_carts_compete_for_the_last_unit(last_unit):
+    assert db.hold_stock_many('till-1', {last_unit: 1}, {last_unit: 1}) == []
+    assert db.hold_stock_many('till-2', {last_unit: 1}, {last_unit: 1}) == [last_unit]
+    assert db.held_by_others('till-2') == {last_unit: 1}
+    assert db.held_by_others('till-1') == {}
+
+    assert db.hold_stock('till-1', last_unit, 0, 1)  # taken out of the first cart
+    assert db.hold_stock('till-2', last_unit, 1, 1)
+
+def test_holds_expire_after_the_ttl(last_unit, monkeypatch):
+    monkeypatch.setattr(db, 'STOCK_HOLD_TTL', 0)
+    assert db.hold_stock('till-1', last_unit, 1, 1)
+    assert db.held_by_others('till-2') == {}
+    assert db.hold_stock('till-2', last_unit, 1, 1)
+
+def test_activity_refreshes_every_hold_of_the_cart(last_unit, monkeypatch):
+    db.add_product("Test Cider", "Cider", "500ml", 50, 100, "Beer", "VAT18")
+    other = db.execute_query("SELECT id FROM products WHERE name = 'Test Cider'", fetch='one')[0]
+    assert db.hold_stock('till-1', last_unit, 1, 1)
+    expires_at = db._stock_holds[('till-1', last_unit)][1]
+    monkeypatch.setattr(db, 'STOCK_HOLD_TTL', db.STOCK_HOLD_TTL + 60)
+    assert db.hold_stock('till-1', other, 1, 5)
+    assert db._stock_holds[('till-1', last_unit)][1] > expires_at
+
+def test_checkout_releases_the_holds(last_unit):
+    assert db.hold_stock('till-1', last_unit, 1, 1)
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': last_unit, 'quantity': 1, 'rate': 1000.0, 'gst_percent': 18.0}]))
+    assert db.create_bill(date.today().isoformat(), "Cash Customer", "Cash", "", items_df, totals)[0]
+    db.release_holds('till-1')  # what the billing page does after a successful checkout
+
+    assert db.held_by_others('till-2') == {}
+    db.update_product_stock(last_unit, 1)  # restocked
+    assert db.hold_stock('till-2', last_unit, 1, 1)
@@ -0,0 +1,36 @@
+# test_taxreturn.py
+"""Months of archived financial years keep their tax totals: no rebuild or reconciliation from line items."""
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+import archive
+import db_functions as db
+import taxreturn
+
+@pytest.fixture
+def archived_sale(store):
+    db.add_product("Test Gin", "Gin", "750ml", 400, 1180, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Gin'", fetch='one')[0]
+    db.update_product_stock(pid, 100)
+    for bill_date in ("2023-06-10", "2024-06-10"):
+        items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 2, 'rate': 1180.0, 'gst_percent': 18.0}]))
+        assert db.create_bill(bill_date, "Cash Customer", "Cash", "", items_df, totals)[0]
+    assert archive.archive_financial_year(2023, vacuum=False)[0]
+    return store
+
+def test_archived_month_is_not_rebuilt(archived_sale):
+    before = taxreturn.get_tax_return("2023-06")
+    assert not before.empty
+    assert taxreturn.is_archived("2023-06")
+    assert taxreturn.reconcile_tax_return("2023-06") is None
+    success, _ = taxreturn.rebuild_tax_daily("2023-06")
+    assert not success
+    pd.testing.assert_frame_equal(taxreturn.get_tax_return("2023-06"), before)
+
+def test_live_month_is_still_reconciled_and_rebuilt(archived_sale):
+    assert not taxreturn.is_archived("2024-06")
+    assert taxreturn.reconcile_tax_return("2024-06").empty
+    assert taxreturn.rebuild_tax_daily("2024-06")[0]
+    assert taxreturn.tax_totals(taxreturn.get_tax_return("2024-06"))['output_tax'] == pytest.approx(360.0)
@@ -0,0 +1,51 @@
+# test_writer.py
+"""Many sessions billing at once: every bill is committed exactly once, stock never oversells, and commits are shared."""
+import re
+import threading
+import time
+from datetime import date
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import db_functions as db
+import writer
+
+SUBMITTERS = 64
+BILLS_EACH = 2
+STOCK = 100  # fewer units than bills, so some must be refused
+MAX_LATENCY = 2.0  # seconds for one create_bill, queueing included
+
+def test_concurrent_submitters_get_exactly_once_results(store):
+    db.add_product("Test Gin", "Gin", "750ml", 300, 600, "Spirits", "VAT18")
+    pid = db.execute_query("SELECT id FROM products WHERE name = 'Test Gin'", fetch='one')[0]
+    db.update_product_stock(pid, STOCK)
+    items_df, totals = db.price_bill_items(pd.DataFrame([{'product_id': pid, 'quantity': 1, 'rate': 600.0, 'gst_percent': 18.0}]))
+    start = threading.Barrier(SUBMITTERS)
+    results, latencies = [], []
+
+    def submitter():
+        start.wait()
+        for _ in range(BILLS_EACH):
+            started = time.perf_counter()
+            results.append(db.create_bill(date.today().isoformat(), "Cash Customer", "Cash", "", items_df, totals))
+            latencies.append(time.perf_counter() - started)
+    threads = [threading.Thread(target=submitter) for _ in range(SUBMITTERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == SUBMITTERS * BILLS_EACH
+    created = [int(re.search(r"Bill (\d+) created", message).group(1)) for success, message in results if success]
+    refused = [message for success, message in results if not success]
+    assert len(created) == STOCK and len(set(created)) == STOCK
+    assert all("Insufficient stock" in message for message in refused)
+    assert sorted(created) == [row[0] for row in db.execute_query("SELECT id FROM bills ORDER BY id", fetch='all')]
+    assert db.execute_query("SELECT stock FROM products WHERE id = ?", (pid,), fetch='one')[0] == 0
+    assert db.execute_query("SELECT SUM(quantity) FROM bill_items", fetch='one')[0] == STOCK
+
+    stats = writer.get_write_queue().stats
+    assert stats['transactions'] < stats['commands'] / 4  # most bills share a commit
+    assert max(latencies) < MAX_LATENCY
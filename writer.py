@@ -0,0 +1,106 @@
+# writer.py
+"""
+Single writer thread that owns the write connection to liquor_store.db.
+
+db_functions queues transaction bodies (create bill, PO changes, stock adjustments) here instead of
+opening its own connections, so concurrent sessions no longer race each other for the SQLite write
+lock. Commands that are waiting together are group-committed: one BEGIN IMMEDIATE ... COMMIT (one
+fsync) for the whole batch, with each command inside its own SAVEPOINT so a failing command is
+rolled back on its own. Callers get their result (or exception) through a Future.
+"""
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+import db_functions as db
+
+MAX_BATCH = 64  # commands per transaction
+BUSY_TIMEOUT_MS = 5000  # wait for other processes holding the lock; after that bills go to the offline journal
+
+_instance = None
+_instance_lock = threading.Lock()
+
+class WriteQueue:
+    def __init__(self, db_file, max_batch=MAX_BATCH):
+        self.db_file = db_file
+        self.max_batch = max_batch
+        self.stats = {'commands': 0, 'transactions': 0, 'failed': 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, command, *args):
+        """Queues command(cursor, *args); the returned Future resolves after the batch has committed."""
+        future = Future()
+        self._queue.put((command, args, future))
+        return future
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = conn or self._connect()
+            except sqlite3.Error as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            if not self._commit_batch(conn, batch):
+                # The file may have gone away (network share, restore); reconnect for the next batch
+                conn.close()
+                conn = None
+
+    def _commit_batch(self, conn, batch):
+        cursor = conn.cursor()
+        outcomes = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for command, args, _ in batch:
+                cursor.execute("SAVEPOINT command")
+                try:
+                    outcomes.append((True, command(cursor, *args)))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO command")
+                    outcomes.append((False, e))
+                cursor.execute("RELEASE command")
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            self.stats['failed'] += len(batch)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return False
+
+        self.stats['commands'] += len(batch)
+        self.stats['transactions'] += 1
+        for (_, _, future), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                self.stats['failed'] += 1
+                future.set_exception(value)
+        return True
+
+def get_write_queue():
+    """The process-wide writer for db_functions.DB_FILE, started on first use."""
+    global _instance
+    with _instance_lock:
+        if _instance is None or _instance.db_file != db.DB_FILE:
+            _instance = WriteQueue(db.DB_FILE)
+        return _instance